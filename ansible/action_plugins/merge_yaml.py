@@ -13,16 +13,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
 import os
 import shutil
 import tempfile
 
-import yaml
-
 from ansible import constants
 from ansible import errors as ansible_errors
 from ansible.plugins import action
 
+from kolla_ansible import yaml_utils
+
+# Arguments of the task which are consumed by this action plugin and must not
+# be passed on to the copy or file actions.
+_MERGE_ARGS = ('sources', 'extend_lists', 'merge_lists_by', 'yaml_width',
+               'skip_unchanged')
+
+# File attribute arguments which are enforced on an unchanged destination.
+_FILE_ARGS = ('mode', 'owner', 'group', 'seuser', 'serole', 'selevel',
+              'setype', 'attributes', 'unsafe_writes')
+
 DOCUMENTATION = '''
 ---
 module: merge_yaml
@@ -55,6 +65,29 @@ options:
     default: False
     required: False
     type: bool
+  merge_lists_by:
+    description:
+      - A key name, or a list of key names, identifying items of a list.
+        When set, lists found under an equivalent key in several documents
+        are merged item by item rather than replaced or extended. Mapping
+        items that share the value of the first identity key they define
+        are merged recursively, other items are appended unless an equal
+        item is already present. This avoids duplicated entries, e.g. when
+        merging Prometheus scrape configs by C(job_name). Takes precedence
+        over C(extend_lists).
+    default: None
+    required: False
+    type: list
+  skip_unchanged:
+    description:
+      - Whether to compare the merged document with the content of an
+        existing destination file before writing it. If both documents are
+        equal, rendering and copying the document is skipped and only the
+        file attributes are enforced. This reads the destination file from
+        the remote host, which is an extra round trip when it changed.
+    default: False
+    required: False
+    type: bool
   yaml_width:
     description:
       - The maximum width of the YAML document. By default, Ansible uses the
@@ -79,6 +112,19 @@ Merge multiple yaml files:
         yaml_width: 131072
         dest:
           - "/tmp/out.yml"
+
+Merge Prometheus configs, merging scrape configs by job name:
+
+- hosts: localhost
+  tasks:
+    - name: Merge yaml files
+      merge_yaml:
+        sources:
+          - "/tmp/prometheus.yml"
+          - "/tmp/prometheus.yml.d/custom.yml"
+        merge_lists_by: job_name
+        dest:
+          - "/tmp/out.yml"
 '''
 
 
@@ -102,9 +148,36 @@ class ActionModule(action.ActionBase):
             self._templar.environment.loader.searchpath = searchpath
 
             template_data = self._templar.template(template_data)
-            result = yaml.safe_load(template_data)
+            result = yaml_utils.safe_load(template_data)
         return result or {}
 
+    def read_remote_config(self, dest, task_vars):
+        """Return the parsed content of the destination file.
+
+        Returns None if the file does not exist or cannot be parsed.
+        """
+        slurp_result = self._execute_module(
+            module_name='ansible.legacy.slurp',
+            module_args=dict(src=dest),
+            task_vars=task_vars)
+        if slurp_result.get('failed') or 'content' not in slurp_result:
+            return None
+        try:
+            content = base64.b64decode(slurp_result['content'])
+            return yaml_utils.safe_load(content)
+        except (ValueError, yaml_utils.YAMLError):
+            return None
+
+    def enforce_file_attributes(self, dest, task_vars):
+        """Apply the file attributes of the task to an existing file."""
+        file_args = dict((k, v) for k, v in self._task.args.items()
+                         if k in _FILE_ARGS)
+        file_args.update(dict(path=dest, state='file'))
+        return self._execute_module(
+            module_name='ansible.legacy.file',
+            module_args=file_args,
+            task_vars=task_vars)
+
     def run(self, tmp=None, task_vars=None):
         if task_vars is None:
             task_vars = dict()
@@ -122,28 +195,38 @@ class ActionModule(action.ActionBase):
         output = {}
         sources = self._task.args.get('sources', None)
         extend_lists = self._task.args.get('extend_lists', False)
+        merge_lists_by = self._task.args.get('merge_lists_by', None)
         yaml_width = self._task.args.get('yaml_width', None)
+        skip_unchanged = self._task.args.get('skip_unchanged', False)
         if not isinstance(sources, list):
             sources = [sources]
         for source in sources:
             Utils.update_nested_conf(
-                output, self.read_config(source), extend_lists)
+                output, self.read_config(source), extend_lists,
+                merge_lists_by)
 
         # restore original vars
         self._templar.available_variables = old_vars
 
+        dest = self._task.args.get('dest', None)
+        if skip_unchanged and dest and not self._play_context.diff:
+            current = self.read_remote_config(dest, task_vars)
+            if current is not None and Utils.documents_equal(current, output):
+                result.update(self.enforce_file_attributes(dest, task_vars))
+                result['dest'] = dest
+                return result
+
         local_tempdir = tempfile.mkdtemp(dir=constants.DEFAULT_LOCAL_TMP)
 
         try:
             result_file = os.path.join(local_tempdir, 'source')
             with open(result_file, 'w') as f:
-                f.write(yaml.dump(output, default_flow_style=False,
-                                  width=yaml_width))
+                f.write(yaml_utils.dump(output, default_flow_style=False,
+                                        width=yaml_width))
 
             new_task = self._task.copy()
-            new_task.args.pop('sources', None)
-            new_task.args.pop('extend_lists', None)
-            new_task.args.pop('yaml_width', None)
+            for arg in _MERGE_ARGS:
+                new_task.args.pop(arg, None)
             new_task.args.update(
                 dict(
                     src=result_file
@@ -161,7 +244,8 @@ class ActionModule(action.ActionBase):
             copy_result = copy_action.run(task_vars=task_vars)
             copy_result['invocation']['module_args'].update({
                 'src': result_file, 'sources': sources,
-                'extend_lists': extend_lists})
+                'extend_lists': extend_lists,
+                'merge_lists_by': merge_lists_by})
             result.update(copy_result)
         finally:
             shutil.rmtree(local_tempdir)
@@ -170,12 +254,16 @@ class ActionModule(action.ActionBase):
 
 class Utils(object):
     @staticmethod
-    def update_nested_conf(conf, update, extend_lists=False):
+    def update_nested_conf(conf, update, extend_lists=False,
+                           merge_lists_by=None):
+        if isinstance(merge_lists_by, str):
+            merge_lists_by = [merge_lists_by]
         for k, v in update.items():
             if isinstance(v, dict):
                 conf[k] = Utils.update_nested_conf(
-                    conf.get(k, {}), v, extend_lists)
-            elif k in conf and isinstance(conf[k], list) and extend_lists:
+                    conf.get(k, {}), v, extend_lists, merge_lists_by)
+            elif (k in conf and isinstance(conf[k], list) and
+                    (extend_lists or merge_lists_by)):
                 if not isinstance(v, list):
                     errmsg = (
                         "Failure merging key `%(key)s` in dictionary "
@@ -185,7 +273,78 @@ class Utils(object):
                             "value": v, "type": type(v)}
                     )
                     raise ansible_errors.AnsibleModuleError(errmsg)
-                conf[k].extend(v)
+                if merge_lists_by:
+                    Utils.merge_keyed_lists(
+                        conf[k], v, merge_lists_by, extend_lists)
+                else:
+                    conf[k].extend(v)
             else:
                 conf[k] = v
         return conf
+
+    @staticmethod
+    def _list_item_identity(item, keys):
+        """Return the identity of a list item, or None if it has none."""
+        if isinstance(item, dict):
+            for key in keys:
+                value = item.get(key)
+                if value is not None and not isinstance(value, (dict, list)):
+                    return (key, value)
+        return None
+
+    @staticmethod
+    def merge_keyed_lists(conf, update, keys, extend_lists=False):
+        """Merge the items of a list into another list, in place.
+
+        Mapping items are matched by the value of the first of ``keys`` they
+        define and merged recursively. Items without an identity are only
+        appended if no equal item is present yet.
+        """
+        index = {}
+        for position, item in enumerate(conf):
+            identity = Utils._list_item_identity(item, keys)
+            if identity is not None:
+                index.setdefault(identity, position)
+        for item in update:
+            identity = Utils._list_item_identity(item, keys)
+            if identity is None:
+                if not any(Utils.documents_equal(item, existing)
+                           for existing in conf):
+                    conf.append(item)
+            elif identity in index:
+                Utils.update_nested_conf(
+                    conf[index[identity]], item, extend_lists, keys)
+            else:
+                index[identity] = len(conf)
+                conf.append(item)
+        return conf
+
+    @staticmethod
+    def documents_equal(first, second):
+        """Return whether two parsed YAML documents are equal.
+
+        Unlike ``==``, scalars of different types are never equal, e.g.
+        ``1`` and ``true`` or ``1`` and ``1.0``, as they are rendered
+        differently.
+        """
+        stack = [(first, second)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if type(a) is not type(b):
+                return False
+            if isinstance(a, dict):
+                if len(a) != len(b):
+                    return False
+                for k, v in a.items():
+                    if k not in b:
+                        return False
+                    stack.append((v, b[k]))
+            elif isinstance(a, list):
+                if len(a) != len(b):
+                    return False
+                stack.extend(zip(a, b))
+            elif a != b:
+                return False
+        return True
@@ -0,0 +1,205 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import csv
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+---
+name: kolla_profile
+type: aggregate
+short_description: Report the time spent in tasks, roles and hosts
+description:
+  - Records the duration of every task, the time spent by every host and the
+    number of calls of every module.
+  - At the end of the run, JSON and CSV reports are written and the slowest
+    tasks, roles and hosts are displayed.
+requirements:
+  - enable in configuration
+options:
+  output_dir:
+    description: Directory to which the reports are written.
+    default: .
+    type: path
+    env:
+      - name: KOLLA_ANSIBLE_PROFILE_DIR
+    ini:
+      - section: callback_kolla_profile
+        key: output_dir
+  top:
+    description: Number of tasks, roles and hosts displayed in the summary.
+    default: 20
+    type: int
+    env:
+      - name: KOLLA_ANSIBLE_PROFILE_TOP
+    ini:
+      - section: callback_kolla_profile
+        key: top
+'''
+
+# Modules whose number of calls is displayed in the summary.
+SUMMARY_MODULES = ('kolla_container', 'kolla_toolbox', 'merge_configs')
+
+CSV_FIELDS = ('play', 'role', 'task', 'action', 'hosts', 'duration',
+              'host_time')
+
+
+class _Task(object):
+    """Timings of a task, which may run on several hosts."""
+
+    def __init__(self, play, task, start):
+        self.play = play
+        self.role = task._role.get_name() if task._role else ''
+        # NOTE: The name returned by get_name is prefixed with the role.
+        self.name = (task.name or task.get_name()).strip()
+        self.action = task.action.split('.')[-1]
+        self.start = start
+        self.end = start
+        self.hosts = 0
+        self.host_time = 0.0
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def to_dict(self):
+        return {'play': self.play, 'role': self.role, 'task': self.name,
+                'action': self.action, 'hosts': self.hosts,
+                'duration': round(self.duration, 3),
+                'host_time': round(self.host_time, 3)}
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'kolla_profile'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self._start = time.time()
+        self._play = ''
+        # Runs of tasks, in the order they started.
+        self._tasks = []
+        # Latest run of the tasks by task UUID.
+        self._current = {}
+        # Start times of the tasks running on hosts by task UUID and host.
+        self._running = {}
+        self._host_time = collections.Counter()
+        self._modules = collections.Counter()
+
+    def v2_playbook_on_play_start(self, play):
+        self._play = play.get_name().strip()
+
+    def _start_task(self, task):
+        self._current[task._uuid] = _Task(self._play, task, time.time())
+        self._tasks.append(self._current[task._uuid])
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        if task._uuid not in self._current:
+            self._start_task(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        # NOTE: A handler keeps its UUID when it runs in several flushes of
+        # handlers, each of which is recorded separately.
+        self._start_task(task)
+
+    def v2_runner_on_start(self, host, task):
+        self._running[(task._uuid, host.get_name())] = time.time()
+
+    def _record(self, result, called=True):
+        now = time.time()
+        task = self._current.get(result._task._uuid)
+        if task is None:
+            return
+        host = result._host.get_name()
+        start = self._running.pop((result._task._uuid, host), task.start)
+        task.end = max(task.end, now)
+        task.hosts += 1
+        task.host_time += now - start
+        self._host_time[host] += now - start
+        if called:
+            self._modules[task.action] += 1
+
+    def v2_runner_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result)
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result)
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result, called=False)
+
+    def _roles(self):
+        roles = collections.Counter()
+        for task in self._tasks:
+            roles[task.role] += task.duration
+        return roles
+
+    def _report(self):
+        tasks = sorted(self._tasks, key=lambda t: -t.duration)
+        return {
+            'duration': round(time.time() - self._start, 3),
+            'tasks': [task.to_dict() for task in tasks],
+            'roles': dict((role, round(duration, 3)) for role, duration
+                          in self._roles().most_common()),
+            'hosts': dict((host, round(duration, 3)) for host, duration
+                          in self._host_time.most_common()),
+            'modules': dict(self._modules.most_common()),
+        }
+
+    def _write(self, report):
+        output_dir = self.get_option('output_dir')
+        os.makedirs(output_dir, exist_ok=True)
+        prefix = os.path.join(
+            output_dir, 'kolla-ansible-profile-%s' %
+            time.strftime('%Y%m%d-%H%M%S', time.localtime(self._start)))
+        with open(prefix + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(prefix + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(report['tasks'])
+        return prefix
+
+    def _display_top(self, title, rows):
+        self._display.banner(title)
+        for name, duration in rows:
+            self._display.display('%-70s %10.2fs' % (name[:70], duration))
+
+    def v2_playbook_on_stats(self, stats):
+        report = self._report()
+        top = self.get_option('top')
+        self._display_top(
+            'SLOWEST TASKS',
+            [('%s : %s' % (t['role'] or t['play'], t['task']), t['duration'])
+             for t in report['tasks'][:top]])
+        self._display_top('SLOWEST ROLES',
+                          [(role or '(play tasks)', duration) for role, duration
+                           in list(report['roles'].items())[:top]])
+        self._display_top('SLOWEST HOSTS',
+                          list(report['hosts'].items())[:top])
+        self._display.banner('MODULE CALLS')
+        for module in SUMMARY_MODULES:
+            self._display.display('%-70s %10d' % (
+                module, report['modules'].get(module, 0)))
+        prefix = self._write(report)
+        self._display.display('Profile written to %s.json and %s.csv' %
+                              (prefix, prefix))
@@ -15,8 +15,10 @@
 # limitations under the License.
 
 from kolla_ansible.kolla_address import kolla_address
+from kolla_ansible.kolla_cluster_addresses import kolla_cluster_addresses
 from kolla_ansible.kolla_url import kolla_url
 from kolla_ansible.put_address_in_context import put_address_in_context
+from kolla_ansible.put_address_in_context import put_addresses_in_context
 
 
 class FilterModule(object):
@@ -25,6 +27,8 @@ class FilterModule(object):
     def filters(self):
         return {
             'kolla_address': kolla_address,
+            'kolla_cluster_addresses': kolla_cluster_addresses,
             'kolla_url': kolla_url,
             'put_address_in_context': put_address_in_context,
+            'put_addresses_in_context': put_addresses_in_context,
         }
@@ -15,50 +15,125 @@
 from __future__ import annotations
 
 import json
+import shlex
 from typing import Any, Dict, Iterable, List, Tuple
 
+from ansible.errors import AnsibleFilterError
+
+
+_ATOM_TAGS = frozenset(("uuid", "named-uuid", "string", "integer", "real", "boolean"))
+
+# Port columns managed through provider port options, with the value used
+# when a column is unset or an option is empty.
+PORT_OPTION_DEFAULTS: Dict[str, Any] = {
+    "tag": [],
+    "trunks": [],
+    "external_ids": {},
+    "other_config": {},
+    "type": "",
+    "options": {},
+}
+
+
+def _is_atom_tag(tag: Any) -> bool:
+    return isinstance(tag, str) and tag in _ATOM_TAGS
+
 
 def _convert_ovsdb_value(value: Any) -> Any:
-    """Convert an OVSDB JSON value to native Python types."""
-    if isinstance(value, list):
-        if not value:
-            return []
-        tag = value[0]
-        if tag == "set":
-            items = [_convert_ovsdb_value(item) for item in value[1]]
-            if len(items) == 0:
-                return []
+    """Convert an OVSDB JSON value to native Python types.
+
+    Nested values are converted with an explicit stack rather than recursion.
+    """
+    if not isinstance(value, list):
+        return value
+    result: List[Any] = [None]
+    stack: List[Tuple[Any, Any, Any]] = [(value, result, 0)]
+    while stack:
+        value, target, index = stack.pop()
+        # Atoms are unwrapped in place.
+        while isinstance(value, list) and len(value) == 2 and _is_atom_tag(value[0]):
+            value = value[1]
+        if not isinstance(value, list):
+            target[index] = value
+        elif not value:
+            target[index] = []
+        elif value[0] == "set":
+            items = value[1]
             if len(items) == 1:
-                return items[0]
-            return items
-        if tag == "map":
-            return {
-                _convert_ovsdb_value(item[0]): _convert_ovsdb_value(item[1])
-                for item in value[1]
-            }
-        if tag in {"uuid", "named-uuid", "string", "integer", "real", "boolean"}:
-            return _convert_ovsdb_value(value[1])
-        return [_convert_ovsdb_value(item) for item in value]
-    return value
-
-
-def ovsdb_rows(data: Any) -> List[Dict[str, Any]]:
-    """Convert the JSON output of ovs-vsctl to a list of dictionaries."""
+                stack.append((items[0], target, index))
+            else:
+                converted: List[Any] = [None] * len(items)
+                target[index] = converted
+                stack.extend((item, converted, i) for i, item in enumerate(items))
+        elif value[0] == "map":
+            mapping: Dict[Any, Any] = {}
+            target[index] = mapping
+            for item in value[1]:
+                # Map keys are atoms.
+                key = _convert_ovsdb_value(item[0])
+                mapping[key] = None
+                stack.append((item[1], mapping, key))
+        else:
+            converted = [None] * len(value)
+            target[index] = converted
+            stack.extend((item, converted, i) for i, item in enumerate(value))
+    return result[0]
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value)
+
+
+def _load_table(data: Any, columns: Any = None) -> Tuple[List[str], List[int], List[Any]]:
+    """Return the selected headings, their indices and the rows of a table."""
     if isinstance(data, str):
         data = json.loads(data)
     if not isinstance(data, dict):
-        return []
+        return [], [], []
     headings = data.get("headings", [])
-    rows = data.get("data", [])
+    if columns is None:
+        selected = list(headings)
+    else:
+        selected = [heading for heading in _as_list(columns) if heading in headings]
+    indices = [headings.index(heading) for heading in selected]
+    return selected, indices, data.get("data", [])
+
+
+def ovsdb_rows(data: Any, columns: Any = None) -> List[Dict[str, Any]]:
+    """Convert the JSON output of ovs-vsctl to a list of dictionaries.
+
+    :param data: ovs-vsctl --format=json output, as a string or decoded.
+    :param columns: optional list, or comma separated string, of the columns
+        to convert. Other columns are skipped. All columns by default.
+    """
+    selected, indices, rows = _load_table(data, columns)
+    columns_indices = list(zip(selected, indices))
     results: List[Dict[str, Any]] = []
     for row in rows:
         record: Dict[str, Any] = {}
-        for heading, value in zip(headings, row):
-            record[heading] = _convert_ovsdb_value(value)
+        for heading, index in columns_indices:
+            if index < len(row):
+                record[heading] = _convert_ovsdb_value(row[index])
         results.append(record)
     return results
 
 
+def ovsdb_columns(data: Any, columns: Any = None) -> Dict[str, List[Any]]:
+    """Convert the JSON output of ovs-vsctl to a dictionary of columns.
+
+    Each requested column maps to the list of its values, in row order.
+    """
+    selected, indices, rows = _load_table(data, columns)
+    return {
+        heading: [_convert_ovsdb_value(row[index]) if index < len(row) else None for row in rows]
+        for heading, index in zip(selected, indices)
+    }
+
+
 def _canonical_sequence(value: Iterable[Any]) -> Tuple[Any, ...]:
     return tuple(sorted(ovsdb_canonical(item) for item in value))
 
@@ -76,6 +151,56 @@ def ovsdb_canonical(value: Any) -> Any:
     return str(value)
 
 
+def _canonical_equal(current: Any, desired: Any) -> bool:
+    """Compare two values, computing canonical forms only when needed."""
+    if type(current) is type(desired) and isinstance(current, (str, bool, type(None))):
+        return current == desired
+    return ovsdb_canonical(current) == ovsdb_canonical(desired)
+
+
+def ovsdb_diff(current: Any, desired: Any, key: str = "name") -> List[Dict[str, Any]]:
+    """Return the desired rows which differ from the current OVSDB rows.
+
+    Only the columns of the desired rows are decoded and compared. Canonical
+    forms are computed for a column only when its raw values differ.
+
+    :param current: ovs-vsctl --format=json output, as a string or decoded,
+        or a list of rows as returned by ovsdb_rows.
+    :param desired: list of rows, dicts with the key column and the columns
+        to set, or a dict of such column dicts by key.
+    :param key: name of the column identifying rows.
+    :returns: a list of dicts with the key column and the columns which
+        differ. Rows missing from the current state are returned with all of
+        their columns.
+    """
+    if isinstance(desired, dict):
+        desired = [dict(columns, **{key: name}) for name, columns in desired.items()]
+    if isinstance(current, list):
+        current_rows = current
+    else:
+        wanted = {key}
+        for row in desired:
+            wanted.update(row)
+        current_rows = ovsdb_rows(current, sorted(wanted))
+    by_key = {row.get(key): row for row in current_rows}
+
+    changes: List[Dict[str, Any]] = []
+    for row in desired:
+        existing = by_key.get(row[key])
+        if existing is None:
+            changes.append(dict(row))
+            continue
+        changed = {
+            column: value
+            for column, value in row.items()
+            if column != key and not _canonical_equal(existing.get(column), value)
+        }
+        if changed:
+            changed[key] = row[key]
+            changes.append(changed)
+    return changes
+
+
 def _quote_string(value: str) -> str:
     escaped = value.replace("\\", "\\\\").replace('"', '\\"')
     return f'"{escaped}"'
@@ -105,12 +230,110 @@ def to_ovsdb(value: Any) -> str:
     return _quote_string(str(value))
 
 
+def _fail_mode(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ""
+    return str(value or "").strip().strip("\"'").strip().lower()
+
+
+def ovsdb_provider_commands(
+    mappings: Any,
+    bridge_rows: Any,
+    port_rows: Any = None,
+    bridges: Any = None,
+    fail_mode: str = "",
+) -> List[List[str]]:
+    """Return the ovs-vsctl commands bringing provider bridges to a state.
+
+    Only the differences between the desired state and the current rows are
+    returned, in an order suitable for a single ovs-vsctl transaction.
+
+    :param mappings: list of dicts with bridge, port and optional options
+        keys, as built by the openvswitch role.
+    :param bridge_rows: Bridge table, with at least the name, fail_mode and
+        ports columns, as ovs-vsctl JSON output or rows from ovsdb_rows.
+    :param port_rows: Port table, with at least the _uuid and name columns
+        and any option column, in the same formats.
+    :param bridges: additional bridges which should exist.
+    :param fail_mode: desired fail_mode of the bridges, unmanaged if empty.
+    :returns: a list of commands, each a list of ovs-vsctl arguments.
+    """
+    if not isinstance(bridge_rows, list):
+        bridge_rows = ovsdb_rows(bridge_rows, ["name", "fail_mode", "ports"])
+    if not isinstance(port_rows, list):
+        port_rows = ovsdb_rows(port_rows) if port_rows else []
+    mappings = [
+        mapping for mapping in mappings or []
+        if mapping.get("bridge") and mapping.get("port") and mapping["bridge"] != mapping["port"]
+    ]
+    fail_mode = _fail_mode(fail_mode)
+
+    ports_by_name = {row.get("name"): row for row in port_rows}
+    port_names = {row.get("_uuid"): row.get("name") for row in port_rows}
+    port_bridges: Dict[str, str] = {}
+    current_bridges: Dict[str, Dict[str, Any]] = {}
+    for row in bridge_rows:
+        current_bridges[row.get("name")] = row
+        ports = row.get("ports", [])
+        for uuid in [ports] if isinstance(ports, str) else ports:
+            if uuid in port_names:
+                port_bridges[port_names[uuid]] = row.get("name")
+
+    commands: List[List[str]] = []
+    wanted = list(_as_list(bridges)) + [mapping["bridge"] for mapping in mappings]
+    for bridge in dict.fromkeys(wanted):
+        current = current_bridges.get(bridge)
+        if current is None:
+            commands.append(["--may-exist", "add-br", bridge])
+        if fail_mode and (current is None or _fail_mode(current.get("fail_mode")) != fail_mode):
+            commands.append(["set-fail-mode", bridge, fail_mode])
+
+    for mapping in mappings:
+        bridge, port = mapping["bridge"], mapping["port"]
+        current_bridge = port_bridges.get(port)
+        if current_bridge is None:
+            commands.append(["--may-exist", "add-port", bridge, port])
+        elif current_bridge != bridge:
+            raise AnsibleFilterError(
+                f"Provider interface {port} is currently attached to bridge {current_bridge} "
+                f"and cannot be moved automatically to {bridge}."
+            )
+        options = mapping.get("options") or {}
+        row = ports_by_name.get(port, {})
+        changed = [
+            f"{field}={to_ovsdb(options[field] or default)}"
+            for field, default in PORT_OPTION_DEFAULTS.items()
+            if field in options and not _canonical_equal(row.get(field, default), options[field] or default)
+        ]
+        if changed:
+            commands.append(["set", "Port", port] + changed)
+    return commands
+
+
+def ovs_vsctl_transaction(commands: Iterable[Iterable[Any]], timeout: Any = 10) -> str:
+    """Return a command line running commands in one ovs-vsctl transaction.
+
+    The arguments are quoted for the command module.
+    """
+    argv = ["ovs-vsctl"]
+    if timeout:
+        argv.append(f"--timeout={timeout}")
+    for command in commands:
+        argv.append("--")
+        argv.extend(str(arg) for arg in command)
+    return " ".join(shlex.quote(arg) for arg in argv)
+
+
 class FilterModule(object):
     """Expose OVSDB helpers as Jinja2 filters."""
 
     def filters(self) -> Dict[str, Any]:
         return {
             "ovsdb_rows": ovsdb_rows,
+            "ovsdb_columns": ovsdb_columns,
             "ovsdb_canonical": ovsdb_canonical,
+            "ovsdb_diff": ovsdb_diff,
+            "ovsdb_provider_commands": ovsdb_provider_commands,
+            "ovs_vsctl_transaction": ovs_vsctl_transaction,
             "to_ovsdb": to_ovsdb,
         }
@@ -88,6 +88,14 @@ options:
       - The command to execute in the container
     required: False
     type: str
+  compare_all:
+    description:
+      - With compare_container, run every comparison instead of stopping at
+        the first difference, and check that the systemd unit is enabled and
+        running
+    required: False
+    type: bool
+    default: False
   container_engine:
     description:
       - Name of container engine to use
@@ -395,6 +403,7 @@ def generate_module():
         auth_registry=dict(required=False, type='str'),
         auth_username=dict(required=False, type='str'),
         command=dict(required=False, type='str'),
+        compare_all=dict(required=False, type='bool', default=False),
         container_engine=dict(required=False, type='str'),
         detach=dict(required=False, type='bool', default=True),
         labels=dict(required=False, type='dict', default=dict()),
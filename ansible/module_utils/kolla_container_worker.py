@@ -488,22 +488,57 @@ class ContainerWorker(ABC):
     def check_container(self):
         pass
 
+    def set_config_diff(self, output):
+        """Return the output of a configuration check which found changes.
+
+        The output of ``kolla_set_configs --check`` lists the configuration
+        files which differ, and is returned in ``config_diff``.
+        """
+        if isinstance(output, bytes):
+            output = output.decode("utf-8", "replace")
+        self.result["config_diff"] = output
+
     def compare_container(self):
+        """Compare the container with its specification.
+
+        The differences found are returned in ``drift_reasons``, along with
+        ``config_diff`` when the configuration changed. Unless the
+        ``compare_all`` parameter is set, the comparison stops at the first
+        difference and the state of the systemd unit is not checked.
+        """
+        compare_all = self.params.get("compare_all", False)
         container = self.check_container()
-        differs = False
-        if container:
-            differs = self.check_container_differs()
-        if (
-            not container or
-            differs or
-            self.compare_config() or
-            self.systemd.check_unit_change()
-        ):
-            self.changed = True
-        if container and differs:
+        reasons = []
+        if not container:
+            reasons.append("container_missing")
+        elif self.check_container_differs():
+            reasons.append("container_differs")
             self.emit_diff()
+        if container and (compare_all or not reasons) and self.compare_config():
+            reasons.append("config_changed")
+        if (compare_all or not reasons) and self.systemd.check_unit_change():
+            reasons.append("unit_changed")
+        if compare_all:
+            reasons.extend(self.check_unit_state())
+        if reasons:
+            self.changed = True
+        self.result["drift_reasons"] = reasons
         return self.changed
 
+    def check_unit_state(self):
+        """Return the differences of the systemd unit with its desired state."""
+        if (
+            not self.systemd.manage_unit_file or
+            not self.systemd.check_unit_file()
+        ):
+            return []
+        reasons = []
+        if self.systemd.get_unit_file_state() != "enabled":
+            reasons.append("unit_disabled")
+        if self.systemd.get_unit_state() != "running":
+            reasons.append("unit_inactive")
+        return reasons
+
     def check_container_differs(self):
         container_info = self.get_container_info()
         if not container_info:
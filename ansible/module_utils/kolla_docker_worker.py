@@ -179,6 +179,7 @@ class DockerWorker(ContainerWorker):
                     "exit_code=1 decision=changed" % (attempt, attempts)
                 )
                 self._debug("compare_config final_decision=changed reason=explicit_diff")
+                self.set_config_diff(output)
                 return True
             if exit_code == 137:
                 failure_mode = "exit_code_137"
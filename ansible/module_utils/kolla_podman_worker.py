@@ -325,17 +325,6 @@ class PodmanWorker(ContainerWorker):
 
         return container.attrs
 
-    def compare_container(self):
-        container = self.check_container()
-        if (
-            not container or
-            self.check_container_differs() or
-            self.compare_config() or
-            self.systemd.check_unit_change()
-        ):
-            self.changed = True
-        return self.changed
-
     def compare_pid_mode(self, container_info):
         if not self.option_specified("pid_mode", "pid"):
             return False
@@ -551,6 +540,7 @@ class PodmanWorker(ContainerWorker):
                     "exit_code=1 decision=changed" % (attempt, attempts)
                 )
                 self._debug("compare_config final_decision=changed reason=explicit_diff")
+                self.set_config_diff(raw_output)
                 return True
 
             raise Exception(
@@ -229,6 +229,14 @@ class SystemdWorker(object):
 
         return None
 
+    def get_unit_file_state(self):
+        try:
+            return str(self.manager.GetUnitFileState(
+                self.container_dict['service_name']
+            ))
+        except Exception:
+            return None
+
     def wait_for_unit(self, timeout, state='running'):
         delay = 5
         elapsed = 0
@@ -12,11 +12,16 @@
 
 import threading
 
-import pbr.version
-
-
-__version__ = pbr.version.VersionInfo(
-    'kolla-ansible').version_string()
 
 # Make a project global TLS trace storage repository
 TLS = threading.local()
+
+
+def __getattr__(name):
+    # NOTE: The version is looked up on first access, as pbr falls back to
+    # setuptools and git when the package is not installed, which is slow
+    # and not needed by most users of the package.
+    if name == '__version__':
+        from kolla_ansible import version
+        return version.version_info.version_string()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -10,18 +10,32 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
+import glob
 import logging
 import os
 import subprocess  # nosec
 import sys
+import tempfile
 
+from kolla_ansible import fanout
+from kolla_ansible import inventory as kolla_inventory
+from kolla_ansible import performance
 from kolla_ansible import utils
+from kolla_ansible import vars_bundle
+from kolla_ansible import waves
+from typing import Dict
 from typing import List
 from typing import Tuple
 
 
 DEFAULT_CONFIG_PATH = "/etc/kolla"
 
+PROFILE_CALLBACK = "kolla_profile"
+
+# Directory of the fact cache managed by Kolla Ansible in the config path.
+FACT_CACHE_DIR = "facts"
+
 CONFIG_PATH_ENV = "KOLLA_CONFIG_PATH"
 
 LOG = logging.getLogger(__name__)
@@ -139,9 +153,45 @@ def add_kolla_ansible_args(parser):
         dest="kolla_passwords",
         help="Path to the kolla ansible passwords file"
     )
+    parser.add_argument(
+        "--fact-cache",
+        action="store_true",
+        help="cache host facts in <configdir>/%s and only gather the facts "
+             "of hosts which are not cached or expired" % FACT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--fact-cache-timeout",
+        metavar="SECONDS",
+        type=int,
+        default=86400,
+        help="time after which the cached facts of a host expire, 0 for "
+             "never (default=%(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record the duration of tasks, roles and hosts, and report "
+             "the slowest ones at the end of the run",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        metavar="PATH",
+        default=".",
+        help="directory of the JSON and CSV profile reports "
+             "(default=current directory)",
+    )
+    parser.add_argument(
+        "--performance-profile",
+        choices=sorted(performance.PROFILES),
+        help="run Ansible with a configuration generated in "
+             "<configdir>/%s, which adds pipelining, persistent SSH "
+             "connections, forks sized from the number of hosts and Mitogen "
+             "if installed to the Ansible configuration" %
+             (performance.CONFIG_FILE % "<profile>"),
+    )
 
 
-def _get_inventory_paths(parsed_args) -> List[str]:
+def get_inventory_paths(parsed_args) -> List[str]:
     """Return path to the Kolla Ansible inventory."""
     if parsed_args.inventory:
         return parsed_args.inventory
@@ -164,7 +214,7 @@ def _validate_args(parsed_args, playbooks: list) -> None:
         )
         sys.exit(1)
 
-    inventories = _get_inventory_paths(parsed_args)
+    inventories = get_inventory_paths(parsed_args)
     for inventory in inventories:
         result = utils.is_readable_dir(inventory)
         if not result["result"]:
@@ -214,21 +264,33 @@ def _get_vars_files(config_path: os.path) -> List[str]:
     file, but ordering of file is kept to allow overrides.
     """
     vars_path = os.path.join(config_path, "globals.d")
-    result = utils.is_readable_dir(vars_path)
-    if not result["result"]:
-        return []
-
     vars_files = []
-    for vars_file in os.listdir(vars_path):
-        abs_path = os.path.join(vars_path, vars_file)
-        if utils.is_readable_file(abs_path)["result"]:
-            root, ext = os.path.splitext(vars_file)
-            if ext in (".yml", ".yaml", ".json"):
-                vars_files.append(abs_path)
+    # NOTE: The type of entries is known from the listing of the directory,
+    # which avoids a stat for each file but symbolic links.
+    try:
+        with os.scandir(vars_path) as entries:
+            for entry in entries:
+                root, ext = os.path.splitext(entry.name)
+                if (ext in (".yml", ".yaml", ".json") and entry.is_file() and
+                        os.access(entry.path, os.R_OK)):
+                    vars_files.append(entry.path)
+    except OSError:
+        return []
 
     return sorted(vars_files)
 
 
+def get_extra_vars_files(parsed_args) -> List[str]:
+    """Return the variable files passed to Ansible as extra vars, in order.
+
+    These are globals.yml, passwords.yml and the files in globals.d.
+    """
+    config_path = os.path.abspath(parsed_args.kolla_config_path)
+    return ([os.path.join(config_path, "globals.yml"),
+             os.path.join(config_path, "passwords.yml")] +
+            _get_vars_files(config_path))
+
+
 def build_args(parsed_args,
                playbooks: list,
                extra_vars: dict = {},
@@ -239,25 +301,21 @@ def build_args(parsed_args,
         args += ["-" + "v" * verbose_level]
     if parsed_args.list_tasks:
         args += ["--list-tasks"]
-    inventories = _get_inventory_paths(parsed_args)
+    inventories = kolla_inventory.resolve_inventory_paths(
+        parsed_args, get_inventory_paths(parsed_args))
     for inventory in inventories:
         args += ["--inventory", inventory]
-    args += ["-e", "@%s" % os.path.join(
-        os.path.abspath(parsed_args.kolla_config_path),
-        "globals.yml")]
-    args += ["-e", "@%s" % os.path.join(
-        os.path.abspath(parsed_args.kolla_config_path),
-        "passwords.yml")]
+    hash_behaviour, _ = _get_config_value("DEFAULT_HASH_BEHAVIOUR")
+    for vars_file in vars_bundle.get_vars_files(
+            parsed_args.kolla_config_path, get_extra_vars_files(parsed_args),
+            hash_behaviour):
+        args += ["-e", "@%s" % vars_file]
     for vault_id in parsed_args.vault_id:
         args += ["--vault-id", vault_id]
     for vault_pass_file in parsed_args.vault_password_file:
         args += ["--vault-password-file", vault_pass_file]
     if parsed_args.ask_vault_password:
         args += ["--ask-vault-password"]
-    vars_files = _get_vars_files(
-        os.path.abspath(parsed_args.kolla_config_path))
-    for vars_file in vars_files:
-        args += ["-e", "@%s" % vars_file]
     if parsed_args.extra_vars:
         for extra_var in parsed_args.extra_vars:
             args += ["-e", extra_var]
@@ -282,18 +340,12 @@ def build_args(parsed_args,
     return ("ansible-playbook", args)
 
 
-def run_playbooks(parsed_args, playbooks: list, extra_vars: dict = {},
-                  quiet: bool = False, verbose_level: int = 0) -> None:
-    """Run a Kolla Ansible playbook."""
-    LOG.debug("Parsed arguments: %s" % parsed_args)
-    _validate_args(parsed_args, playbooks)
-    (executable, args) = build_args(
-        parsed_args,
-        playbooks,
-        extra_vars=extra_vars,
-        verbose_level=verbose_level,
-    )
+def _get_environment(parsed_args, extra_vars: dict,
+                     processes: int = 1) -> dict:
+    """Return the environment of ansible-playbook.
 
+    :param processes: number of ansible-playbook processes run at a time.
+    """
     env = os.environ.copy()
     # Propagate kolla_action_debug to module environment so that
     # container actions can emit debug output when requested. This is
@@ -310,6 +362,30 @@ def run_playbooks(parsed_args, playbooks: list, extra_vars: dict = {},
         else:
             env["KOLLA_ACTION_DEBUG"] = "false"
 
+    if getattr(parsed_args, "fact_cache", False):
+        _enable_fact_cache(
+            env, get_fact_cache_path(parsed_args),
+            parsed_args.fact_cache_timeout)
+    if getattr(parsed_args, "profile", False):
+        _enable_profile(env, parsed_args.profile_dir)
+    if getattr(parsed_args, "performance_profile", None):
+        _enable_performance_profile(env, parsed_args, processes)
+    return env
+
+
+def run_playbooks(parsed_args, playbooks: list, extra_vars: dict = {},
+                  quiet: bool = False, verbose_level: int = 0) -> None:
+    """Run a Kolla Ansible playbook."""
+    LOG.debug("Parsed arguments: %s" % parsed_args)
+    _validate_args(parsed_args, playbooks)
+    (executable, args) = build_args(
+        parsed_args,
+        playbooks,
+        extra_vars=extra_vars,
+        verbose_level=verbose_level,
+    )
+    env = _get_environment(parsed_args, extra_vars)
+
     try:
         utils.run_command(executable, args, quiet=quiet, env=env)
     except subprocess.CalledProcessError as e:
@@ -320,6 +396,228 @@ def run_playbooks(parsed_args, playbooks: list, extra_vars: dict = {},
         sys.exit(e.returncode)
 
 
+def run_playbooks_sharded(parsed_args, playbooks: list,
+                          shards: Dict[str, List[str]],
+                          max_parallel: int, extra_vars: dict = {},
+                          quiet: bool = False,
+                          verbose_level: int = 0) -> None:
+    """Run Kolla Ansible playbooks concurrently on shards of hosts.
+
+    An ansible-playbook process is run for each shard, limited to the hosts
+    of the shard, with at most max_parallel processes at a time. The output
+    of each process is prefixed with the name of its shard.
+
+    :param shards: a dict of the hosts of each shard by name.
+    """
+    LOG.debug("Parsed arguments: %s" % parsed_args)
+    _validate_args(parsed_args, playbooks)
+    env = _get_environment(parsed_args, extra_vars,
+                           processes=min(max_parallel, len(shards)))
+
+    with tempfile.TemporaryDirectory(prefix="kolla-ansible-") as path:
+        commands = {}
+        for name, hosts in shards.items():
+            shard_args = _limit_args(parsed_args, path, name, hosts)
+            shard_env = env
+            if getattr(parsed_args, "profile", False):
+                shard_env = dict(env, KOLLA_ANSIBLE_PROFILE_DIR=os.path.join(
+                    env["KOLLA_ANSIBLE_PROFILE_DIR"], name))
+            executable, args = build_args(shard_args, playbooks,
+                                          extra_vars=extra_vars,
+                                          verbose_level=verbose_level)
+            commands[name] = ([executable] + args, shard_env)
+        results = fanout.run_parallel(commands, max_parallel, quiet=quiet)
+
+    failed = dict((name, code) for name, code in results.items() if code)
+    for name, code in sorted(failed.items()):
+        LOG.error("Kolla Ansible playbook(s) %s exited %d for shard %s",
+                  ", ".join(playbooks), code, name)
+    if failed:
+        sys.exit(max(failed.values()))
+
+
+def _limit_args(parsed_args, path: str, name: str, hosts: List[str]):
+    """Return a copy of parsed arguments limited to some hosts."""
+    # NOTE: Hosts are passed in a file, as the limit may be too long for the
+    # command line of large inventories.
+    limit_file = os.path.join(path, "%s.limit" % name)
+    with open(limit_file, "w") as f:
+        f.write("".join("%s\n" % host for host in hosts))
+    limited_args = copy.copy(parsed_args)
+    limited_args.limit = "@%s" % limit_file
+    return limited_args
+
+
+def _run_wave(parsed_args, playbooks: list, hosts: List[str], path: str,
+              env: dict, extra_vars: dict, quiet: bool,
+              verbose_level: int) -> List[str]:
+    """Run playbooks on the hosts of a wave.
+
+    :returns: the hosts of the wave which failed or were unreachable.
+    """
+    wave_args = _limit_args(parsed_args, path, "wave", hosts)
+    executable, args = build_args(wave_args, playbooks, extra_vars=extra_vars,
+                                  verbose_level=verbose_level)
+    retry_path = os.path.join(path, "retry")
+    os.makedirs(retry_path, exist_ok=True)
+    env = dict(env, ANSIBLE_RETRY_FILES_ENABLED="True",
+               ANSIBLE_RETRY_FILES_SAVE_PATH=retry_path)
+    try:
+        utils.run_command(executable, args, quiet=quiet, env=env)
+        return []
+    except subprocess.CalledProcessError:
+        pass
+    # NOTE: Ansible writes the hosts which failed to a retry file. If it
+    # failed without writing one, the whole wave is considered failed.
+    failed = set()
+    retry_files = glob.glob(os.path.join(retry_path, "*.retry"))
+    for retry_file in retry_files:
+        failed.update(utils.read_file(retry_file).split())
+        os.remove(retry_file)
+    if not retry_files:
+        return list(hosts)
+    return [host for host in hosts if host in failed]
+
+
+def run_playbooks_in_waves(parsed_args, playbooks: list,
+                           groups: Dict[str, Tuple[List[str], List[str]]],
+                           max_fail_ratio: float, extra_vars: dict = {},
+                           quiet: bool = False,
+                           verbose_level: int = 0) -> None:
+    """Run Kolla Ansible playbooks on waves of hosts, one at a time.
+
+    The hosts of each group are divided into waves whose sizes grow while
+    waves succeed. After each wave, the containers of its hosts must become
+    running and healthy. The run is aborted when the ratio of failed hosts
+    exceeds max_fail_ratio.
+
+    :param groups: a dict of the hosts and wave sizes of each group by name,
+        see waves.WavePlan.
+    """
+    LOG.debug("Parsed arguments: %s" % parsed_args)
+    health_playbook = utils.get_data_files_path("ansible", "wave-health.yml")
+    _validate_args(parsed_args, playbooks + [health_playbook])
+    env = _get_environment(parsed_args, extra_vars)
+
+    done = []
+    failed = []
+    with tempfile.TemporaryDirectory(prefix="kolla-ansible-") as path:
+        for group, (hosts, steps) in groups.items():
+            plan = waves.WavePlan(hosts, steps)
+            for number, wave in enumerate(plan, 1):
+                LOG.info("Group %s wave %d: %d hosts (%d/%d)", group, number,
+                         len(wave), len(done) + len(wave),
+                         sum(len(h) for h, _ in groups.values()))
+                wave_failed = _run_wave(parsed_args, playbooks, wave, path,
+                                        env, extra_vars, quiet, verbose_level)
+                healthy = [host for host in wave if host not in wave_failed]
+                if healthy:
+                    wave_failed += _run_wave(parsed_args, [health_playbook],
+                                             healthy, path, env, {}, quiet,
+                                             verbose_level)
+                done += wave
+                failed += wave_failed
+                if wave_failed:
+                    plan.failed = True
+                    LOG.warning("Group %s wave %d: %d hosts failed: %s",
+                                group, number, len(wave_failed),
+                                ", ".join(wave_failed))
+                if len(failed) > max_fail_ratio * len(done):
+                    LOG.error("Kolla Ansible playbook(s) %s aborted, %d of "
+                              "%d hosts failed, more than the maximum ratio "
+                              "of %s", ", ".join(playbooks), len(failed),
+                              len(done), max_fail_ratio)
+                    sys.exit(2)
+    if failed:
+        LOG.error("Kolla Ansible playbook(s) %s failed on hosts: %s",
+                  ", ".join(playbooks), ", ".join(failed))
+        sys.exit(2)
+
+
+def get_fact_cache_path(parsed_args) -> str:
+    """Return the path of the fact cache managed by Kolla Ansible."""
+    return os.path.join(os.path.abspath(parsed_args.kolla_config_path),
+                        FACT_CACHE_DIR)
+
+
+def _get_config_value(name: str) -> tuple:
+    """Return the value of an Ansible option and its origin.
+
+    The value is read from the configuration file Ansible would use, or is
+    the default of the option, whose origin is then 'default'.
+    """
+    from ansible.config.manager import ConfigManager
+    manager = ConfigManager(performance.find_base_config())
+    return manager.get_config_value_and_origin(name)
+
+
+def _enable_fact_cache(env: dict, path: str, timeout: int) -> None:
+    """Enable the jsonfile fact cache in an Ansible environment.
+
+    The facts of each host are stored in a file, which expires after the
+    timeout. A cache plugin configured through the environment or the
+    Ansible configuration file is kept.
+    """
+    plugin, origin = env.get("ANSIBLE_CACHE_PLUGIN"), "ANSIBLE_CACHE_PLUGIN"
+    if not plugin:
+        plugin, origin = _get_config_value("CACHE_PLUGIN")
+    if plugin and origin != "default":
+        LOG.warning("Fact cache plugin %s is configured by %s, not using %s",
+                    plugin, origin, path)
+        return
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    env["ANSIBLE_CACHE_PLUGIN"] = "jsonfile"
+    env["ANSIBLE_CACHE_PLUGIN_CONNECTION"] = path
+    env["ANSIBLE_CACHE_PLUGIN_TIMEOUT"] = str(timeout)
+
+
+def _enable_profile(env: dict, profile_dir: str) -> None:
+    """Enable the profiling callback plugin in an Ansible environment.
+
+    Callback plugins and callbacks enabled through the environment or the
+    Ansible configuration file are kept, as the variables set here override
+    the configuration file.
+    """
+    plugins = env.get("ANSIBLE_CALLBACK_PLUGINS")
+    if not plugins:
+        value, _ = _get_config_value("DEFAULT_CALLBACK_PLUGIN_PATH")
+        plugins = os.pathsep.join(value or [])
+    plugins = [plugins,
+               utils.get_data_files_path("ansible", "callback_plugins")]
+    env["ANSIBLE_CALLBACK_PLUGINS"] = os.pathsep.join(filter(None, plugins))
+    callbacks = env.get("ANSIBLE_CALLBACKS_ENABLED")
+    if not callbacks:
+        value, _ = _get_config_value("CALLBACKS_ENABLED")
+        callbacks = ",".join(value or [])
+    callbacks = [callbacks, PROFILE_CALLBACK]
+    env["ANSIBLE_CALLBACKS_ENABLED"] = ",".join(filter(None, callbacks))
+    env["KOLLA_ANSIBLE_PROFILE_DIR"] = os.path.abspath(profile_dir)
+
+
+def _enable_performance_profile(env: dict, parsed_args,
+                                processes: int) -> None:
+    """Use the Ansible configuration of a performance profile.
+
+    The configuration is generated from the one Ansible would otherwise use,
+    whose options and the environment take precedence over the profile.
+    """
+    profile = parsed_args.performance_profile
+    inventories = kolla_inventory.resolve_inventory_paths(
+        parsed_args, get_inventory_paths(parsed_args))
+    hosts = fanout.list_hosts(parsed_args, inventories, "all",
+                              parsed_args.limit)
+    path = performance.get_config_path(parsed_args.kolla_config_path, profile)
+    settings = performance.write_config(
+        path, profile, len(hosts), processes=processes,
+        free_strategy=getattr(parsed_args, "free_strategy", False),
+        base=performance.find_base_config(), env=env)
+    LOG.info("Using Ansible configuration %s of the %s performance profile",
+             path, profile)
+    for line in performance.describe(settings):
+        LOG.info("Performance profile %s: %s", profile, line)
+    env["ANSIBLE_CONFIG"] = path
+
+
 def install_galaxy_collections(force: bool = True) -> None:
     """Install Ansible Galaxy collection dependencies.
 
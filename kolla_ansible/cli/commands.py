@@ -10,12 +10,22 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import os
+import subprocess  # nosec
 import sys
+import tempfile
 
 from cliff.command import Command
 
 from kolla_ansible import ansible
+from kolla_ansible import drift
+from kolla_ansible import fanout
+from kolla_ansible import incremental
+from kolla_ansible import inventory as kolla_inventory
+from kolla_ansible import playbooks as kolla_playbooks
 from kolla_ansible import utils
+from kolla_ansible import waves
 
 # Serial is not recommended and disabled by default.
 # Users can enable it by configuring the variable.
@@ -39,12 +49,18 @@ def _choose_playbooks(parsed_args, kolla_playbook="site"):
 class KollaAnsibleMixin:
     """Mixin class for commands running Kolla Ansible."""
 
+    # Whether the plays of the command may use the free strategy with a
+    # performance profile, that is whether no task of a host depends on
+    # other hosts having run the previous tasks.
+    free_strategy = False
+
     def get_parser(self, prog_name):
         parser = super(KollaAnsibleMixin, self).get_parser(prog_name)
         ansible_group = parser.add_argument_group("Ansible arguments")
         ka_group = parser.add_argument_group("Kolla Ansible arguments")
         self.add_ansible_args(ansible_group)
         self.add_kolla_ansible_args(ka_group)
+        parser.set_defaults(free_strategy=self.free_strategy)
         return parser
 
     def add_kolla_ansible_args(self, group):
@@ -64,7 +80,7 @@ class KollaAnsibleMixin:
             verbosity_args["quiet"] = True
         return verbosity_args
 
-    def run_playbooks(self, parsed_args, *args, **kwargs):
+    def _get_run_kwargs(self, parsed_args, kwargs):
         # If the user knows what they're doing and explicitly sets
         # ansible_python_interpreter, respect their choice and avoid
         # overriding it by kolla-ansible.
@@ -74,18 +90,241 @@ class KollaAnsibleMixin:
                 extra.pop("ansible_python_interpreter", None)
                 break
         kwargs.update(self._get_verbosity_args())
+        return kwargs
+
+    def run_playbooks(self, parsed_args, *args, **kwargs):
+        kwargs = self._get_run_kwargs(parsed_args, kwargs)
         return ansible.run_playbooks(parsed_args, *args, **kwargs)
 
 
+class ServiceScopeMixin(KollaAnsibleMixin):
+    """Mixin class for commands which may be limited to some services.
+
+    Only the plays applying to the services are run, which avoids loading
+    and evaluating the plays of every other service as is done with --tags.
+    """
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        group = parser.add_argument_group("Service scope")
+        group.add_argument(
+            "--service",
+            metavar="SERVICE",
+            action="append",
+            dest="services",
+            help="only run the plays for this service, as named by the tags "
+                 "of its role. This argument may be specified multiple "
+                 "times. Implies --tags with the services unless tags are "
+                 "given.",
+        )
+        return parser
+
+    def run_playbooks(self, parsed_args, playbooks, *args, **kwargs):
+        if not getattr(parsed_args, "services", None):
+            return super().run_playbooks(parsed_args, playbooks, *args,
+                                         **kwargs)
+        with tempfile.TemporaryDirectory(prefix="kolla-ansible-") as path:
+            scoped = []
+            for index, playbook in enumerate(playbooks):
+                try:
+                    scoped.append(kolla_playbooks.write_scoped_playbook(
+                        playbook, parsed_args.services,
+                        os.path.join(path, str(index))))
+                except ValueError as e:
+                    self.app.LOG.error("Kolla Ansible playbook %s: %s",
+                                       playbook, e)
+                    sys.exit(1)
+            if not parsed_args.tags:
+                parsed_args.tags = ",".join(parsed_args.services)
+            return super().run_playbooks(parsed_args, scoped, *args,
+                                         **kwargs)
+
+
+class FanOutMixin(KollaAnsibleMixin):
+    """Mixin class for commands which may run on shards of hosts at once.
+
+    Only suitable for commands whose operations on a host do not depend on
+    the other hosts of the shard being run, as each shard is run by a
+    separate ansible-playbook process limited to its hosts.
+    """
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        group = parser.add_argument_group("Parallel execution")
+        shards = group.add_mutually_exclusive_group()
+        shards.add_argument(
+            "--shards",
+            metavar="COUNT",
+            type=int,
+            help="divide the hosts into this number of shards and run "
+                 "Ansible on the shards concurrently",
+        )
+        shards.add_argument(
+            "--shard-groups",
+            metavar="GROUPS",
+            help="comma separated list of inventory groups with distinct "
+                 "hosts, Ansible is run on the groups concurrently",
+        )
+        group.add_argument(
+            "--max-parallel",
+            metavar="COUNT",
+            type=int,
+            default=4,
+            help="maximum number of shards run at a time "
+                 "(default=%(default)s)",
+        )
+        return parser
+
+    def _get_shards(self, parsed_args):
+        inventories = ansible.get_inventory_paths(parsed_args)
+        if parsed_args.shard_groups:
+            groups = [group.strip()
+                      for group in parsed_args.shard_groups.split(",")
+                      if group.strip()]
+            hosts = dict(
+                (group, fanout.list_hosts(parsed_args, inventories, group,
+                                          parsed_args.limit))
+                for group in groups)
+            return fanout.partition_groups(hosts)
+        if parsed_args.shards < 1:
+            raise ValueError("The number of shards must be positive")
+        hosts = fanout.list_hosts(parsed_args, inventories, "all",
+                                  parsed_args.limit)
+        return fanout.partition(hosts, parsed_args.shards)
+
+    def run_playbooks(self, parsed_args, playbooks, *args, **kwargs):
+        if not (getattr(parsed_args, "shards", None) or
+                getattr(parsed_args, "shard_groups", None)):
+            return super().run_playbooks(parsed_args, playbooks, *args,
+                                         **kwargs)
+        try:
+            shards = self._get_shards(parsed_args)
+        except ValueError as e:
+            self.app.LOG.error("Unable to divide hosts into shards: %s", e)
+            sys.exit(1)
+        if not shards:
+            self.app.LOG.error("No hosts matched, nothing to do")
+            sys.exit(1)
+        for name, hosts in shards.items():
+            self.app.LOG.info("Shard %s: %d hosts", name, len(hosts))
+        kwargs = self._get_run_kwargs(parsed_args, kwargs)
+        return ansible.run_playbooks_sharded(
+            parsed_args, playbooks, shards, parsed_args.max_parallel, *args,
+            **kwargs)
+
+
+class WavesMixin(KollaAnsibleMixin):
+    """Mixin class for commands which may be run on waves of hosts.
+
+    Hosts are divided into waves, which are run one at a time and must have
+    healthy containers before the next wave is run.
+    """
+
+    # Name of the group of the hosts which are not in any group with waves.
+    OTHER_HOSTS = "(other hosts)"
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        group = parser.add_argument_group("Rolling waves")
+        group.add_argument(
+            "--waves",
+            metavar="[GROUP=]SIZES",
+            action="append",
+            help="run the hosts of an inventory group, all by default, in "
+                 "waves of the given comma separated sizes, as numbers of "
+                 "hosts, percentages of the group or '%s', for example "
+                 "compute=1,5,25%%%%,%s. The size of waves grows while waves "
+                 "succeed, the last size is used for the remaining hosts. "
+                 "This argument may be specified multiple times, groups are "
+                 "run in order, after the hosts not in any group." %
+                 (waves.REST, waves.REST),
+        )
+        group.add_argument(
+            "--wave-max-fail-ratio",
+            metavar="RATIO",
+            type=float,
+            default=0.0,
+            help="abort when the ratio of failed hosts to the hosts run in "
+                 "waves exceeds this value, between 0 and 1 "
+                 "(default=%(default)s)",
+        )
+        return parser
+
+    def _get_wave_groups(self, parsed_args):
+        if not 0 <= parsed_args.wave_max_fail_ratio <= 1:
+            raise ValueError("The maximum fail ratio must be between 0 "
+                             "and 1")
+        specs = [waves.parse_spec(spec) for spec in parsed_args.waves]
+        inventories = ansible.get_inventory_paths(parsed_args)
+        seen = set()
+        groups = collections.OrderedDict()
+        for group, steps in specs:
+            if group in groups:
+                raise ValueError("Waves of group %s given more than once" %
+                                 group)
+            hosts = [host for host in fanout.list_hosts(
+                parsed_args, inventories, group, parsed_args.limit)
+                if host not in seen]
+            seen.update(hosts)
+            groups[group] = (hosts, steps)
+        others = [host for host in fanout.list_hosts(
+            parsed_args, inventories, "all", parsed_args.limit)
+            if host not in seen]
+        result = collections.OrderedDict()
+        if others:
+            result[self.OTHER_HOSTS] = (others, [waves.REST])
+        result.update((group, (hosts, steps))
+                      for group, (hosts, steps) in groups.items() if hosts)
+        return result
+
+    def run_playbooks(self, parsed_args, playbooks, *args, **kwargs):
+        if not getattr(parsed_args, "waves", None):
+            return super().run_playbooks(parsed_args, playbooks, *args,
+                                         **kwargs)
+        try:
+            groups = self._get_wave_groups(parsed_args)
+        except ValueError as e:
+            self.app.LOG.error("Unable to divide hosts into waves: %s", e)
+            sys.exit(1)
+        if not groups:
+            self.app.LOG.error("No hosts matched, nothing to do")
+            sys.exit(1)
+        for name, (hosts, steps) in groups.items():
+            self.app.LOG.info("Group %s: %d hosts in waves of %s", name,
+                              len(hosts), ",".join(steps))
+        kwargs = self._get_run_kwargs(parsed_args, kwargs)
+        return ansible.run_playbooks_in_waves(
+            parsed_args, playbooks, groups, parsed_args.wave_max_fail_ratio,
+            *args, **kwargs)
+
+
 class GatherFacts(KollaAnsibleMixin, Command):
     """Gather Ansible facts on hosts"""
 
+    free_strategy = True
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        group = parser.add_argument_group("Fact cache")
+        group.add_argument(
+            "--refresh",
+            action="store_true",
+            help="gather the facts of hosts even if they are cached, and "
+                 "update the fact cache. Implies --fact-cache.",
+        )
+        return parser
+
     def take_action(self, parsed_args):
         self.app.LOG.info("Gathering Ansible facts")
 
+        extra_vars = {}
+        if parsed_args.refresh:
+            parsed_args.fact_cache = True
+            extra_vars["kolla_ansible_refresh_facts"] = "true"
+
         playbooks = _choose_playbooks(parsed_args, "gather-facts")
 
-        self.run_playbooks(parsed_args, playbooks)
+        self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
 
 class InstallDeps(KollaAnsibleMixin, Command):
@@ -113,6 +352,23 @@ class Prechecks(KollaAnsibleMixin, Command):
 class GenConfig(KollaAnsibleMixin, Command):
     """Generate configuration files for services. No container changes!"""
 
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        group = parser.add_argument_group("Incremental config generation")
+        group.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Skip roles whose inputs have not changed since the last "
+                 "successful incremental run",
+        )
+        group.add_argument(
+            "--incremental-state",
+            metavar="PATH",
+            help="Path of the incremental state file "
+                 "(default=<configdir>/%s)" % incremental.STATE_FILE,
+        )
+        return parser
+
     def take_action(self, parsed_args):
         self.app.LOG.info(
             "Generate configuration files for enabled OpenStack services")
@@ -122,10 +378,32 @@ class GenConfig(KollaAnsibleMixin, Command):
 
         playbooks = _choose_playbooks(parsed_args)
 
+        plan = None
+        # NOTE: Runs restricted to some hosts or tags do not generate the
+        # configuration of all roles, their fingerprints are not recorded.
+        restricted = (parsed_args.limit or parsed_args.tags or
+                      parsed_args.skip_tags)
+        if parsed_args.incremental:
+            plan = incremental.get_genconfig_plan(
+                parsed_args, playbooks, extra_vars)
+            for line in plan.report():
+                self.app.LOG.info(line)
+            if not plan.changed_roles:
+                self.app.LOG.info("No role inputs changed since the last "
+                                  "successful run, nothing to do")
+                return
+            skip_tags = plan.skip_tags
+            if parsed_args.skip_tags:
+                skip_tags.insert(0, parsed_args.skip_tags)
+            parsed_args.skip_tags = ",".join(skip_tags) or None
+
         self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
+        if plan and not restricted:
+            plan.save()
+
 
-class Reconfigure(KollaAnsibleMixin, Command):
+class Reconfigure(ServiceScopeMixin, WavesMixin, Command):
     """Reconfigure enabled OpenStack service"""
 
     def take_action(self, parsed_args):
@@ -155,7 +433,7 @@ class ValidateConfig(KollaAnsibleMixin, Command):
         self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
 
-class BootstrapServers(KollaAnsibleMixin, Command):
+class BootstrapServers(FanOutMixin, Command):
     """Bootstrap servers with Kolla Ansible deploy dependencies"""
 
     def take_action(self, parsed_args):
@@ -242,7 +520,7 @@ class DistributeSecrets(KollaAnsibleMixin, Command):
         self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
 
-class Deploy(KollaAnsibleMixin, Command):
+class Deploy(ServiceScopeMixin, WavesMixin, Command):
     """Generate config, bootstrap and start all Kolla Ansible containers"""
 
     def take_action(self, parsed_args):
@@ -281,7 +559,7 @@ class Postdeploy(KollaAnsibleMixin, Command):
         self.run_playbooks(parsed_args, playbooks)
 
 
-class Upgrade(KollaAnsibleMixin, Command):
+class Upgrade(ServiceScopeMixin, WavesMixin, Command):
     """Upgrades existing OpenStack Environment"""
 
     def take_action(self, parsed_args):
@@ -373,9 +651,11 @@ class Destroy(KollaAnsibleMixin, Command):
         self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
 
-class PruneImages(KollaAnsibleMixin, Command):
+class PruneImages(FanOutMixin, Command):
     """Prune orphaned Kolla Ansible docker images"""
 
+    free_strategy = True
+
     def get_parser(self, prog_name):
         parser = super().get_parser(prog_name)
         group = parser.add_argument_group("Prune images action")
@@ -495,7 +775,7 @@ class MariaDBRecovery(KollaAnsibleMixin, Command):
         self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
 
-class NovaLibvirtCleanup(KollaAnsibleMixin, Command):
+class NovaLibvirtCleanup(FanOutMixin, Command):
     """Clean up disabled nova_libvirt containers"""
 
     def take_action(self, parsed_args):
@@ -520,6 +800,51 @@ class Check(KollaAnsibleMixin, Command):
         self.run_playbooks(parsed_args, playbooks, extra_vars=extra_vars)
 
 
+class Drift(ServiceScopeMixin, FanOutMixin, Command):
+    """Report drift of containers from their configuration"""
+
+    free_strategy = True
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        group = parser.add_argument_group("Drift report")
+        group.add_argument(
+            "--report",
+            metavar="FILE",
+            help="write the drift report as JSON to this file",
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        self.app.LOG.info("Reporting drift of containers of enabled "
+                          "services")
+
+        playbooks = _choose_playbooks(parsed_args)
+
+        returncode = 0
+        with tempfile.TemporaryDirectory(prefix="kolla-ansible-") as path:
+            extra_vars = {}
+            extra_vars["kolla_action"] = "drift"
+            extra_vars["kolla_drift_report_dir"] = path
+            # NOTE: The report of hosts which failed or were unreachable is
+            # incomplete, it is still written for the other hosts.
+            try:
+                self.run_playbooks(parsed_args, playbooks,
+                                   extra_vars=extra_vars)
+            except SystemExit as e:
+                returncode = e.code
+            report = drift.aggregate(drift.load_results(path))
+
+        if parsed_args.report:
+            drift.write_report(parsed_args.report, report)
+        for line in drift.describe(report):
+            self.app.stdout.write(line + "\n")
+        if returncode:
+            self.app.LOG.error("The drift report is incomplete, Kolla "
+                               "Ansible failed on some hosts")
+            sys.exit(returncode)
+
+
 class MigrateContainerEngine(KollaAnsibleMixin, Command):
     """Migrate the container engine of the deployed OpenStack"""
 
@@ -531,3 +856,20 @@ class MigrateContainerEngine(KollaAnsibleMixin, Command):
         playbooks = _choose_playbooks(parsed_args, "migrate-container-engine")
 
         self.run_playbooks(parsed_args, playbooks)
+
+
+class InventoryCompile(KollaAnsibleMixin, Command):
+    """Compile inventories to JSON for faster loading"""
+
+    def take_action(self, parsed_args):
+        for source in ansible.get_inventory_paths(parsed_args):
+            self.app.LOG.info("Compiling inventory %s", source)
+            try:
+                path = kolla_inventory.compile_inventory(parsed_args, source)
+            except subprocess.CalledProcessError as e:
+                self.app.LOG.error("Unable to compile inventory %s: "
+                                   "ansible-inventory exited %d",
+                                   source, e.returncode)
+                sys.exit(1)
+            self.app.LOG.info("Inventory %s compiled to %s, it is used "
+                              "until %s changes", source, path, source)
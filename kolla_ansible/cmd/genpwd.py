@@ -27,7 +27,6 @@ from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
 from hashlib import md5
 from oslo_utils import uuidutils
-import yaml
 
 # NOTE(SamYaple): Update the search path to prefer PROJECT_ROOT as the source
 #                 of packages to import if we are using local tools instead of
@@ -37,6 +36,8 @@ PROJECT_ROOT = os.path.abspath(os.path.join(
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+from kolla_ansible import yaml_utils  # noqa: E402
+
 
 def generate_RSA(bits=4096):
     new_key = rsa.generate_private_key(
@@ -60,7 +61,7 @@ def genpwd(passwords_file, length, uuid_keys, ssh_keys, blank_keys,
            fernet_keys, hmac_md5_keys, bcrypt_keys):
     try:
         with open(passwords_file, 'r') as f:
-            passwords = yaml.safe_load(f.read())
+            passwords = yaml_utils.safe_load(f.read())
     except FileNotFoundError:
         print(f"ERROR: Passwords file \"{passwords_file}\" is missing")
         sys.exit(1)
@@ -137,7 +138,7 @@ def genpwd(passwords_file, length, uuid_keys, ssh_keys, blank_keys,
     mode = 0o640
 
     with os.fdopen(os.open(passwords_file, flags, mode=mode), 'w') as f:
-        f.write(yaml.safe_dump(passwords, default_flow_style=False))
+        f.write(yaml_utils.safe_dump(passwords, default_flow_style=False))
 
 
 def main():
@@ -10,6 +10,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import argparse
+import importlib.metadata
 import sys
 
 from cliff.app import App
@@ -18,17 +20,68 @@ from cliff.commandmanager import CommandManager
 from kolla_ansible import version
 
 
+class LazyCommandManager(CommandManager):
+    """Command manager resolving entry points only when a command runs.
+
+    The stevedore based manager of cliff imports every command module when
+    the application starts, which is not needed to run a single command,
+    print the version or complete a command name.
+    """
+
+    def _command_name(self, entry_point):
+        if self.convert_underscores:
+            return entry_point.name.replace('_', ' ')
+        return entry_point.name
+
+    def load_commands(self, namespace):
+        self.group_list.append(namespace)
+        for ep in importlib.metadata.entry_points(group=namespace):
+            if self._is_module_ignored(ep.module, self.ignored_modules):
+                continue
+            self.commands.setdefault(self._command_name(ep), ep)
+
+    def get_command_names(self, group=None):
+        if group is None:
+            return list(self.commands.keys())
+        return [self._command_name(ep)
+                for ep in importlib.metadata.entry_points(group=group)]
+
+
+class VersionAction(argparse.Action):
+    """Print the release version, which is only looked up when asked."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings=option_strings, dest=dest,
+                         default=default, nargs=0,
+                         help=help or "show program's version number and "
+                                      "exit")
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        sys.stdout.write("%s %s\n" % (
+            App.NAME, version.version_info.release_string()))
+        parser.exit()
+
+
 class KollaAnsibleApp(App):
 
     def __init__(self):
-        release_version = version.version_info.release_string()
         super().__init__(
             description="Kolla Ansible Command Line Interface (CLI)",
-            version=release_version,
-            command_manager=CommandManager("kolla_ansible.cli"),
+            version=None,
+            command_manager=LazyCommandManager("kolla_ansible.cli"),
             deferred_help=True,
         )
 
+    def build_option_parser(self, description, version,
+                            argparse_kwargs=None):
+        argparse_kwargs = dict(argparse_kwargs or {},
+                               conflict_handler="resolve")
+        parser = super().build_option_parser(description, version,
+                                             argparse_kwargs)
+        parser.add_argument("--version", action=VersionAction)
+        return parser
+
     def initialize_app(self, argv):
         self.LOG.debug("initialize_app")
 
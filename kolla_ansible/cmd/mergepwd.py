@@ -16,12 +16,21 @@ import argparse
 import os
 import stat
 import sys
-import yaml
+
+# NOTE: Update the search path to prefer PROJECT_ROOT as the source of
+#       packages to import if we are using local tools instead of pip
+#       installed kolla tools
+PROJECT_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '../..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from kolla_ansible import yaml_utils  # noqa: E402
 
 
 def mergepwd(old, new, final, clean=False):
     with open(old, "r") as old_file:
-        old_passwords = yaml.safe_load(old_file)
+        old_passwords = yaml_utils.safe_load(old_file)
 
     if os.stat(old).st_mode & stat.S_IROTH:
         print(f"WARNING: Passwords file \"{old}\" is world-readable.")
@@ -30,7 +39,7 @@ def mergepwd(old, new, final, clean=False):
         print(f"WARNING: Passwords file \"{old}\" is world-writeable.")
 
     with open(new, "r") as new_file:
-        new_passwords = yaml.safe_load(new_file)
+        new_passwords = yaml_utils.safe_load(new_file)
 
     if os.stat(new).st_mode & stat.S_IROTH:
         print(f"WARNING: Passwords file \"{new}\" is world-readable.")
@@ -64,7 +73,8 @@ def mergepwd(old, new, final, clean=False):
     mode = 0o640
 
     with os.fdopen(os.open(final, flags, mode=mode), 'w') as destination:
-        yaml.safe_dump(new_passwords, destination, default_flow_style=False)
+        yaml_utils.safe_dump(new_passwords, destination,
+                             default_flow_style=False)
 
 
 def main():
@@ -18,9 +18,9 @@ import stat
 import sys
 
 import hvac
-import yaml
 
 from kolla_ansible.hashi_vault import hashicorp_vault_client
+from kolla_ansible import yaml_utils
 
 
 def writepwd(passwords_file, vault_kv_path, vault_mount_point, vault_namespace,
@@ -28,7 +28,7 @@ def writepwd(passwords_file, vault_kv_path, vault_mount_point, vault_namespace,
              vault_cacert):
 
     with open(passwords_file, 'r') as f:
-        passwords = yaml.safe_load(f.read())
+        passwords = yaml_utils.safe_load(f.read())
 
     if os.stat(passwords_file).st_mode & stat.S_IROTH:
         print(f"WARNING: Passwords file \"{passwords_file}\" is"
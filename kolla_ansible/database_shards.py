@@ -19,6 +19,7 @@ from jinja2.runtime import Undefined
 
 from kolla_ansible.exception import FilterError
 from kolla_ansible.helpers import _call_bool_filter
+from kolla_ansible.helpers import get_task_cache
 
 
 @pass_context
@@ -77,8 +78,19 @@ def database_shards_info(context, hostnames):
     if isinstance(hostvars, Undefined):
         raise FilterError("'hostvars' variable is unavailable")
 
-    shards_info = {'shards': {}, 'users': []}
-
+    # NOTE: mariadb_shards_info may be referenced several times while a task
+    # is rendered, e.g. for each item of a loop over the shard users, results
+    # are cached for the task. Each task is rendered in a new worker process
+    # and computes them again.
+    cache = get_task_cache(hostvars)
+    key = ('database_shards_info', tuple(hostnames))
+    if cache is not None and key in cache:
+        return _copy_shards_info(cache[key])
+
+    # Group hosts by shard in a single pass, keeping the variables of the
+    # first host of each shard.
+    shards = {}
+    first_hosts = {}
     for hostname in hostnames:
 
         host = hostvars.get(hostname)
@@ -89,43 +101,61 @@ def database_shards_info(context, hostnames):
         if host_shard_id is None:
             raise FilterError("'mariadb_shard_id' is undefined "
                               f"for host '{hostname}'")
+        host_shard_id = str(host_shard_id)
+
+        if host_shard_id in shards:
+            shards[host_shard_id]['hosts'].append(hostname)
         else:
-            host_shard_id = str(host_shard_id)
-
-        if host_shard_id not in shards_info['shards']:
-            shards_info['shards'][host_shard_id] = {'hosts': [hostname]}
-
-            backup_enabled = host.get('enable_mariabackup')
-            if backup_enabled is None:
-                raise FilterError("'enable_mariabackup' variable is "
-                                  "unavailable")
-            backup_enabled = _call_bool_filter(context, backup_enabled)
-
-            db_password = host.get('database_password')
-            if db_password is None:
-                raise FilterError("'database_password' variable is "
-                                  "unavailable")
-
-            db_root_prefix = host.get('mariadb_shard_root_user_prefix')
-            if db_root_prefix is None:
-                raise FilterError("'mariadb_shard_root_user_prefix' variable "
-                                  "is unavailable")
-            db_user = f"{db_root_prefix}{host_shard_id}"
-            user_dict = {'password': db_password, 'user': db_user,
-                         'shard_id': host_shard_id}
-            shards_info['users'].append(user_dict)
-
-            if backup_enabled:
-                db_backup_prefix = host.get('mariadb_shard_backup_user_prefix')
-                if db_backup_prefix is None:
-                    raise FilterError("'mariadb_shard_backup_user_prefix' "
-                                      "variable is unavailable")
-                db_user = f"{db_backup_prefix}{host_shard_id}"
-                db_password = host.get('mariadb_backup_database_password')
-                user_dict = {'password': db_password, 'user': db_user,
-                             'shard_id': host_shard_id}
-                shards_info['users'].append(user_dict)
-        else:
-            shards_info['shards'][host_shard_id]['hosts'].append(hostname)
+            shards[host_shard_id] = {'hosts': [hostname]}
+            first_hosts[host_shard_id] = host
 
+    users = []
+    for host_shard_id, host in first_hosts.items():
+        users += _shard_users(context, host, host_shard_id)
+
+    shards_info = {'shards': shards, 'users': users}
+    if cache is not None:
+        cache[key] = _copy_shards_info(shards_info)
     return shards_info
+
+
+def _shard_users(context, host, host_shard_id):
+    """Return the database users of a shard from the variables of a host."""
+    backup_enabled = host.get('enable_mariabackup')
+    if backup_enabled is None:
+        raise FilterError("'enable_mariabackup' variable is "
+                          "unavailable")
+    backup_enabled = _call_bool_filter(context, backup_enabled)
+
+    db_password = host.get('database_password')
+    if db_password is None:
+        raise FilterError("'database_password' variable is "
+                          "unavailable")
+
+    db_root_prefix = host.get('mariadb_shard_root_user_prefix')
+    if db_root_prefix is None:
+        raise FilterError("'mariadb_shard_root_user_prefix' variable "
+                          "is unavailable")
+    db_user = f"{db_root_prefix}{host_shard_id}"
+    users = [{'password': db_password, 'user': db_user,
+              'shard_id': host_shard_id}]
+
+    if backup_enabled:
+        db_backup_prefix = host.get('mariadb_shard_backup_user_prefix')
+        if db_backup_prefix is None:
+            raise FilterError("'mariadb_shard_backup_user_prefix' "
+                              "variable is unavailable")
+        db_user = f"{db_backup_prefix}{host_shard_id}"
+        db_password = host.get('mariadb_backup_database_password')
+        users.append({'password': db_password, 'user': db_user,
+                      'shard_id': host_shard_id})
+    return users
+
+
+def _copy_shards_info(shards_info):
+    """Return a copy of shards info, which templates may modify."""
+    return {
+        'shards': {shard_id: {'hosts': list(shard['hosts'])}
+                   for shard_id, shard in shards_info['shards'].items()},
+        'users': [dict(user) for user in shards_info['users']],
+    }
@@ -0,0 +1,108 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Reports of the drift of containers from their specification.
+
+The drift action compares the containers of the enabled services of each host
+with their specification without changing them, and writes the differences
+found for the services of a role on a host to a JSON file of a report
+directory, along with the output of the check of their configuration files. Those files are aggregated into a single report, in which a drift
+found on several hosts is reported once along with the hosts.
+"""
+
+import json
+import os
+
+from typing import List
+
+# Descriptions of the reasons of drift reported by the compare_container
+# action of the kolla_container module, or by the drift action.
+REASONS = {
+    "container_missing": "container is missing",
+    "container_differs": "container differs from its specification",
+    "config_changed": "configuration changed since the container started",
+    "unit_changed": "systemd unit file differs",
+    "unit_disabled": "systemd unit is not enabled",
+    "unit_inactive": "systemd unit is not running",
+    "compare_failed": "comparison failed",
+}
+
+# Attributes of a drift which must be equal for hosts to be grouped.
+DRIFT_KEYS = ("project", "service", "container", "reasons",
+              "recreate_reasons", "diff", "config_diff", "error")
+
+
+def load_results(path: str) -> List[dict]:
+    """Load the drift of roles on hosts written to a report directory."""
+    results = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".json"):
+            with open(os.path.join(path, name)) as f:
+                results.append(json.load(f))
+    return results
+
+
+def aggregate(results: List[dict]) -> dict:
+    """Aggregate the drift of roles on hosts into a report.
+
+    :returns: a dict with the sorted hosts which drifted, and the list of
+        drifts sorted by project and service, each with its hosts.
+    """
+    hosts = set()
+    drifts = {}
+    for result in results:
+        hosts.add(result["host"])
+        for service in result["services"]:
+            drift = dict(service, project=result["project"])
+            key = json.dumps([drift.get(k) for k in DRIFT_KEYS])
+            drifts.setdefault(key, dict(drift, hosts=[]))
+            drifts[key]["hosts"].append(result["host"])
+    for drift in drifts.values():
+        drift["hosts"].sort()
+    return {
+        "hosts": sorted(hosts),
+        "drift": sorted(drifts.values(),
+                        key=lambda d: (d["project"], d["service"],
+                                       -len(d["hosts"]), d["hosts"])),
+    }
+
+
+def describe(report: dict) -> List[str]:
+    """Return the lines of a human readable summary of a report."""
+    if not report["drift"]:
+        return ["No drift found"]
+    lines = ["Drift found for %d services on %d hosts" %
+             (len(set((d["project"], d["service"]) for d in report["drift"])),
+              len(report["hosts"]))]
+    for drift in report["drift"]:
+        lines.append("")
+        lines.append("%s on %d hosts: %s" % (
+            drift["service"], len(drift["hosts"]), ", ".join(drift["hosts"])))
+        for reason in drift["reasons"]:
+            description = REASONS.get(reason, reason)
+            if reason == "container_differs" and drift["recreate_reasons"]:
+                description += ", recreate needed for %s" % ", ".join(
+                    drift["recreate_reasons"])
+            lines.append("  - %s" % description)
+        output = (drift["error"], drift["diff"], drift.get("config_diff", ""))
+        for line in "\n".join(output).splitlines():
+            if line:
+                lines.append("    %s" % line)
+    return lines
+
+
+def write_report(path: str, report: dict) -> None:
+    """Write a report as JSON."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
@@ -0,0 +1,120 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Concurrent execution of Ansible on independent shards of hosts."""
+
+import collections
+import concurrent.futures
+import logging
+import subprocess  # nosec
+import sys
+import threading
+
+from kolla_ansible import utils
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+LOG = logging.getLogger(__name__)
+
+
+def list_hosts(parsed_args, inventories: List[str], pattern: str,
+               limit: str = None) -> List[str]:
+    """Return the hosts of the inventory matching a pattern and a limit."""
+    args = [pattern, "--list-hosts"]
+    for inventory in inventories:
+        args += ["--inventory", inventory]
+    for vault_id in parsed_args.vault_id:
+        args += ["--vault-id", vault_id]
+    for vault_pass_file in parsed_args.vault_password_file:
+        args += ["--vault-password-file", vault_pass_file]
+    if limit:
+        args += ["--limit", limit]
+    result = utils.run_command("ansible", args, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    # The first line is a header with the number of hosts.
+    return [line.strip() for line in result.stdout.splitlines()[1:]
+            if line.strip()]
+
+
+def partition(hosts: List[str], count: int) -> Dict[str, List[str]]:
+    """Divide hosts into at most count shards of similar sizes.
+
+    The order of the hosts is kept, so that hosts next to each other in the
+    inventory are in the same shard.
+    """
+    shards = collections.OrderedDict()
+    if not hosts:
+        return shards
+    count = max(1, min(count, len(hosts)))
+    size, extra = divmod(len(hosts), count)
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        shards["shard-%d" % (index + 1)] = hosts[start:end]
+        start = end
+    return shards
+
+
+def partition_groups(hosts: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Return a shard for each group of hosts.
+
+    :param hosts: a dict of the hosts of each group by name.
+    :raises ValueError: if a host is in several groups.
+    """
+    owners = {}
+    for group, group_hosts in hosts.items():
+        for host in group_hosts:
+            if host in owners:
+                raise ValueError(
+                    "Host %s is in groups %s and %s, shards must not "
+                    "overlap" % (host, owners[host], group))
+            owners[host] = group
+    return collections.OrderedDict(
+        (group, group_hosts) for group, group_hosts in hosts.items()
+        if group_hosts)
+
+
+def _run(name: str, cmd: List[str], env: dict, quiet: bool,
+         lock: threading.Lock) -> int:
+    LOG.debug("Running command for shard %s: %s", name, " ".join(cmd))
+    if quiet:
+        return subprocess.run(cmd, env=env, shell=False,  # nosec
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode
+    proc = subprocess.Popen(cmd, env=env, shell=False,  # nosec
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, bufsize=1)
+    with proc.stdout:
+        for line in proc.stdout:
+            with lock:
+                sys.stdout.write("[%s] %s" % (name, line))
+                sys.stdout.flush()
+    return proc.wait()
+
+
+def run_parallel(commands: Dict[str, Tuple[List[str], dict]],
+                 max_parallel: int, quiet: bool = False) -> Dict[str, int]:
+    """Run commands concurrently, prefixing their output with their name.
+
+    :param commands: a dict of the command line and environment of each
+        command by name.
+    :param max_parallel: maximum number of commands running at a time.
+    :returns: a dict of the exit code of each command by name.
+    """
+    lock = threading.Lock()
+    with concurrent.futures.ThreadPoolExecutor(max(1, max_parallel)) as pool:
+        futures = collections.OrderedDict(
+            (name, pool.submit(_run, name, cmd, env, quiet, lock))
+            for name, (cmd, env) in commands.items())
+        return collections.OrderedDict(
+            (name, future.result()) for name, future in futures.items())
@@ -12,12 +12,37 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import weakref
+
 import jinja2
 
 from kolla_ansible import exception
 from kolla_ansible.helpers import _call_bool_filter
 
 
+# Group names of the host of each templating context, as a frozenset.
+_GROUP_NAMES = weakref.WeakKeyDictionary()
+
+
+def _group_names(context):
+    """Return the group names of the host as a frozenset.
+
+    The set is built once per Jinja2 context, which does not outlive the
+    rendering of a template, instead of scanning the group_names list for
+    each service.
+
+    :param context: Jinja2 Context object.
+    :returns: A frozenset of group names.
+    """
+    try:
+        return _GROUP_NAMES[context]
+    except KeyError:
+        pass
+    group_names = frozenset(context.get("group_names") or ())
+    _GROUP_NAMES[context] = group_names
+    return group_names
+
+
 @jinja2.pass_context
 def service_enabled(context, service):
     """Return whether a service is enabled.
@@ -48,7 +73,8 @@ def extract_haproxy_services(context, services):
         if service_enabled(context, service):
             service_haproxy = service.get('haproxy')
             if service_haproxy:
-                if not set(haproxy).isdisjoint(set(service_haproxy)):
+                # The keys of haproxy are the names seen so far.
+                if any(name in haproxy for name in service_haproxy):
                     raise exception.FilterError(
                         "haproxy service names should be unique")
                 haproxy.update(service_haproxy)
@@ -76,7 +102,7 @@ def service_mapped_to_host(context, service):
 
     group = service.get("group")
     if group is not None:
-        return group in context.get("group_names") or group == "all"
+        return group == "all" or group in _group_names(context)
 
     raise exception.FilterError(
         "Service definition for '%s' does not have a 'group' or "
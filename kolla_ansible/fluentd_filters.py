@@ -12,33 +12,77 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import os.path
 
+# Sections of the fluentd configuration, in order, with their titles.
+FLUENTD_SECTIONS = collections.OrderedDict([
+    ('input', 'Inputs'),
+    ('filter', 'Filters'),
+    ('format', 'Formats'),
+    ('output', 'Outputs'),
+])
 
-def customise_fluentd(default_paths, customised_paths):
-    """Return a sorted list of templates for fluentd.
 
-    :param default_paths: Iterable of default template paths.
-    :param customised_paths: Iterable of customised template paths.
-    :returns: A sorted combined list of template paths.
-    """
+def _basename_no_ext(path):
+    """Return the basename of a path, stripping off any extension."""
+    return os.path.splitext(os.path.basename(path))[0]
 
-    def _basename_no_ext(path):
-        """Return the basename of a path, stripping off any extension."""
-        return os.path.splitext(os.path.basename(path))[0]
 
-    customised_file_names = {os.path.basename(f) for f in customised_paths}
+def _customise(default_paths, customised_names, customised_paths):
+    """Return sorted templates, given the basenames of customised ones."""
     # Starting with the default paths, remove any that have been overridden,
     # ignoring the .j2 extension of default paths.
     result = {f for f in default_paths
-              if _basename_no_ext(f) not in customised_file_names}
+              if _basename_no_ext(f) not in customised_names}
     # Add all customised paths.
     result.update(customised_paths)
     # Sort by the basename of the paths.
     return sorted(result, key=os.path.basename)
 
 
+def customise_fluentd(default_paths, customised_paths):
+    """Return a sorted list of templates for fluentd.
+
+    :param default_paths: Iterable of default template paths.
+    :param customised_paths: Iterable of customised template paths.
+    :returns: A sorted combined list of template paths.
+    """
+    customised_paths = list(customised_paths)
+    return _customise(default_paths,
+                      {os.path.basename(f) for f in customised_paths},
+                      customised_paths)
+
+
+def compile_fluentd_config(default_paths, customised_paths):
+    """Return the templates of all sections of the fluentd configuration.
+
+    Customised templates are indexed once by section and basename, the
+    section being the name of their parent directory, e.g.
+    /etc/kolla/config/fluentd/input/foo.conf.
+
+    :param default_paths: dict of iterables of default template paths, by
+                          section.
+    :param customised_paths: Iterable of customised template paths of all
+                             sections.
+    :returns: A list of sections in order, dicts with the name and title of
+              the section and a sorted list of its template paths.
+    """
+    index = {section: {} for section in FLUENTD_SECTIONS}
+    for path in customised_paths:
+        section = os.path.basename(os.path.dirname(path))
+        if section in index:
+            index[section][os.path.basename(path)] = path
+    return [
+        {'name': section, 'title': title,
+         'paths': _customise(default_paths.get(section) or [],
+                             index[section], index[section].values())}
+        for section, title in FLUENTD_SECTIONS.items()
+    ]
+
+
 def get_filters():
     return {
+        "compile_fluentd_config": compile_fluentd_config,
         "customise_fluentd": customise_fluentd,
     }
@@ -10,6 +10,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import weakref
+
+from jinja2.runtime import Undefined
+
+# Caches of filter results, keyed by the identity of the hostvars mapping of
+# the templating context and by process. Ansible renders each task of a host
+# in a forked worker process, so a cache lasts while a task is rendered: it
+# is shared by the templates, arguments and loop items of the task, and
+# discarded with the worker.
+_TASK_CACHES = {}
+
 
 def _call_bool_filter(context, value):
     """Pass a value through the 'bool' filter.
@@ -19,3 +31,37 @@ def _call_bool_filter(context, value):
     :returns: A boolean.
     """
     return context.environment.call_filter("bool", value, context=context)
+
+
+def _drop_task_cache(ref, key):
+    entry = _TASK_CACHES.get(key)
+    if entry is not None and entry[0] is ref:
+        del _TASK_CACHES[key]
+
+
+def get_task_cache(hostvars):
+    """Return a cache of filter results for the task being rendered.
+
+    Keys of the cache are tuples starting with the name of the filter.
+
+    :param hostvars: hostvars mapping, usually an Ansible HostVars object.
+    :returns: a dict, or None if results can not be cached for this mapping.
+    """
+    if hostvars is None or isinstance(hostvars, Undefined):
+        return None
+    # NOTE: HostVars is a Mapping and thus not hashable, caches are keyed by
+    # id() and dropped when the mapping is garbage collected.
+    key = id(hostvars)
+    pid = os.getpid()
+    entry = _TASK_CACHES.get(key)
+    if entry is not None and entry[0]() is hostvars and entry[1] == pid:
+        return entry[2]
+    try:
+        ref = weakref.ref(hostvars,
+                          lambda ref, key=key: _drop_task_cache(ref, key))
+    except TypeError:
+        # Not weak referenceable, e.g. a plain dict.
+        return None
+    cache = {}
+    _TASK_CACHES[key] = (ref, pid, cache)
+    return cache
@@ -0,0 +1,489 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Incremental generation of service configuration.
+
+The inputs of each role are fingerprinted for every host the role is applied
+to. The inputs are the files of the role and of the roles it uses, the
+configuration overrides of the services of the role, the variables and
+passwords referenced by those files and the inventory groups they use.
+Roles whose fingerprint matches the one recorded by the last successful run
+on every host are skipped using their tags.
+
+Host facts are not part of the fingerprint. If facts such as IP addresses
+change, the state file should be removed to regenerate all configuration.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess  # nosec
+
+from kolla_ansible import ansible
+from kolla_ansible import playbooks as kolla_playbooks
+from kolla_ansible import utils
+from kolla_ansible import yaml_utils
+from typing import Dict
+from typing import List
+from typing import Set
+
+LOG = logging.getLogger(__name__)
+
+STATE_FILE = ".genconfig-state.json"
+STATE_VERSION = 1
+
+# Tags which are never used to skip roles.
+_ALWAYS_TAGS = {"always", "never"}
+
+# Directories of Kolla Ansible which contain code used by all roles.
+_PLUGIN_DIRS = ("action_plugins", "filter_plugins", "library", "module_utils")
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_-]*")
+
+# Maximum number of changed inputs reported per role.
+_MAX_REASONS = 10
+
+
+def _digest(data) -> str:
+    if not isinstance(data, bytes):
+        data = json.dumps(data, sort_keys=True, default=str).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _tokens(text: str) -> Set[str]:
+    """Return the identifiers and group names found in a text."""
+    tokens = set(_TOKEN_RE.findall(text))
+    tokens.update(part for token in list(tokens) if "-" in token
+                  for part in token.split("-"))
+    return tokens
+
+
+class _FileCache(object):
+    """Digests and tokens of files, computed once per file."""
+
+    def __init__(self):
+        self._digests = {}
+        self._tokens = {}
+
+    def digest(self, path: str) -> str:
+        if path not in self._digests:
+            self._digests[path] = _digest(utils.read_file(path, "rb"))
+        return self._digests[path]
+
+    def tokens(self, path: str) -> Set[str]:
+        if path not in self._tokens:
+            content = utils.read_file(path, "rb")
+            self._tokens[path] = _tokens(content.decode(errors="ignore"))
+        return self._tokens[path]
+
+    def tree(self, path: str) -> Dict[str, str]:
+        """Return the digests of all files below a directory."""
+        result = {}
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                abs_path = os.path.join(root, name)
+                result[os.path.relpath(abs_path, path)] = self.digest(
+                    abs_path)
+        return result
+
+
+def _load_vars_file(path: str):
+    """Return the variables of a file, or None if it is vault encrypted."""
+    content = utils.read_file(path)
+    if content.lstrip().startswith("$ANSIBLE_VAULT"):
+        return None
+    return yaml_utils.safe_load(content) or {}
+
+
+def _load_group_vars(path: str) -> Dict[str, dict]:
+    """Return the variables of each group of a group_vars directory."""
+    group_vars = {}
+    if not os.path.isdir(path):
+        return group_vars
+    for name in sorted(os.listdir(path)):
+        group, ext = os.path.splitext(name)
+        file_path = os.path.join(path, name)
+        if os.path.isdir(file_path):
+            files = [os.path.join(file_path, f)
+                     for f in sorted(os.listdir(file_path))]
+            group = name
+        elif ext in (".yml", ".yaml", ".json"):
+            files = [file_path]
+        else:
+            continue
+        for vars_file in files:
+            if os.path.isfile(vars_file):
+                group_vars.setdefault(group, {}).update(
+                    utils.read_yaml_file(vars_file) or {})
+    return group_vars
+
+
+def load_inventory(parsed_args, inventories: List[str]) -> dict:
+    """Return the inventory as produced by ansible-inventory --list."""
+    args = ["--list"]
+    for inventory in inventories:
+        args += ["--inventory", inventory]
+    for vault_id in parsed_args.vault_id:
+        args += ["--vault-id", vault_id]
+    for vault_pass_file in parsed_args.vault_password_file:
+        args += ["--vault-password-file", vault_pass_file]
+    result = utils.run_command("ansible-inventory", args,
+                               stdout=subprocess.PIPE, text=True)
+    return json.loads(result.stdout)
+
+
+def _inventory_groups(inventory: dict) -> Dict[str, Set[str]]:
+    """Return the hosts of each group of an ansible-inventory listing."""
+    groups = {}
+
+    def resolve(name, seen):
+        if name in groups:
+            return groups[name]
+        group = inventory.get(name) or {}
+        hosts = set(group.get("hosts", []))
+        for child in group.get("children", []):
+            if child not in seen:
+                hosts |= resolve(child, seen | {child})
+        groups[name] = hosts
+        return hosts
+
+    for name in inventory:
+        if name != "_meta":
+            resolve(name, {name})
+    groups["all"] = (groups.get("all", set()) |
+                     set(inventory.get("_meta", {}).get("hostvars", {})))
+    return groups
+
+
+class GenConfigPlan(object):
+    """Roles to run for an incremental configuration generation.
+
+    :param roles_path: Path of the directory containing the roles.
+    :param units: Roles applied by the playbooks, list of PlayUnit.
+    :param inventory: Inventory as produced by ansible-inventory --list.
+    :param defaults: Default variables of all hosts, dict.
+    :param vars_files: Paths of the variable files passed as extra vars.
+    :param overrides_path: Path of the configuration overrides directory.
+    :param extra_vars: Other extra variables, list of strings.
+    :param state_path: Path of the state file of the previous runs.
+    :param group_defaults: Default variables of the hosts of other groups,
+        dict of dicts by group.
+    """
+
+    def __init__(self, roles_path, units, inventory, defaults, vars_files,
+                 overrides_path, extra_vars, state_path, plugins_path=None,
+                 group_defaults=None):
+        self.roles_path = roles_path
+        self.units = [unit for unit in units
+                      if set(unit.tags) - _ALWAYS_TAGS]
+        self.overrides_path = overrides_path
+        self.state_path = state_path
+        self._files = _FileCache()
+        self._role_deps = {}
+
+        self.groups = _inventory_groups(inventory)
+        self.hostvars = inventory.get("_meta", {}).get("hostvars", {})
+        self.group_defaults = group_defaults or {}
+
+        # Variables passed as extra vars and defaults, by name. The value of
+        # each source is kept as they may be used by different roles.
+        self.variables = {}
+        self.global_inputs = {"extra vars": _digest(sorted(extra_vars))}
+        for name, value in (defaults or {}).items():
+            self.variables.setdefault(name, []).append(("defaults", value))
+        for path in vars_files:
+            if not os.path.isfile(path):
+                continue
+            source = os.path.basename(path)
+            content = _load_vars_file(path)
+            if content is None:
+                # Vault encrypted files invalidate all roles when changed.
+                self.global_inputs[source] = self._files.digest(path)
+                continue
+            for name, value in content.items():
+                self.variables.setdefault(name, []).append((source, value))
+        if plugins_path:
+            self.global_inputs["plugins"] = _digest([
+                self._files.tree(os.path.join(plugins_path, d))
+                for d in _PLUGIN_DIRS])
+        self._definitions = {}
+        for name, values in self.variables.items():
+            self._definitions[name] = _tokens(json.dumps(values, default=str))
+        for host_vars in (list(self.group_defaults.values()) +
+                          list(self.hostvars.values())):
+            for name, value in host_vars.items():
+                self._definitions.setdefault(name, set()).update(
+                    _tokens(json.dumps(value, default=str)))
+
+        self._host_names = set(self.groups["all"])
+        self._host_groups = {}
+        for group, members in sorted(self.groups.items()):
+            for host in members:
+                self._host_groups.setdefault(host, []).append(group)
+        self.inputs = self._compute()
+        self.state = self._load_state()
+        self.changes = self._compare()
+
+    def _load_state(self) -> dict:
+        if not os.path.isfile(self.state_path):
+            return {}
+        try:
+            state = json.loads(utils.read_file(self.state_path))
+        except ValueError:
+            LOG.warning("Ignoring invalid incremental state file %s",
+                        self.state_path)
+            return {}
+        if state.get("version") != STATE_VERSION:
+            return {}
+        return state.get("roles", {})
+
+    def _role_files(self, role: str) -> Dict[str, str]:
+        deps = kolla_playbooks.get_role_dependencies(
+            self.roles_path, role, self._role_deps)
+        files = {}
+        for dep in sorted(deps):
+            tree = self._files.tree(os.path.join(self.roles_path, dep))
+            files.update((os.path.join(dep, k), v) for k, v in tree.items())
+        return files
+
+    def _role_tokens(self, role_files) -> Set[str]:
+        tokens = set()
+        for path in role_files:
+            tokens |= self._files.tokens(os.path.join(self.roles_path, path))
+        return tokens
+
+    def _relevant_variables(self, tokens: Set[str]) -> Set[str]:
+        """Return the variables used directly or indirectly by a role."""
+        relevant = set()
+        stack = [t for t in tokens if t in self._definitions]
+        while stack:
+            name = stack.pop()
+            if name in relevant:
+                continue
+            relevant.add(name)
+            stack.extend(t for t in self._definitions[name]
+                         if t in self._definitions and t not in relevant)
+        return relevant
+
+    def _role_hosts(self, role: str) -> Set[str]:
+        hosts = set()
+        for unit in self.units:
+            if unit.role != role:
+                continue
+            for pattern in unit.hosts:
+                if pattern.startswith(("&", "!")):
+                    continue
+                if pattern in self.groups:
+                    hosts |= self.groups[pattern]
+                elif pattern in self._host_names:
+                    hosts.add(pattern)
+                else:
+                    # Dynamic group or complex pattern.
+                    return set(self._host_names)
+        return hosts
+
+    def _overrides(self, role: str) -> (Dict[str, str], Dict[str, dict]):
+        """Return the common and per host configuration overrides."""
+        common = {}
+        per_host = {}
+        if not os.path.isdir(self.overrides_path):
+            return common, per_host
+        names = {role}
+        for unit in self.units:
+            if unit.role == role:
+                names.update(unit.tags)
+        for name in sorted(os.listdir(self.overrides_path)):
+            path = os.path.join(self.overrides_path, name)
+            if os.path.isfile(path):
+                # Global overrides such as global.conf.
+                common[name] = self._files.digest(path)
+                continue
+            if name not in names:
+                continue
+            for rel_path, digest in self._files.tree(path).items():
+                rel_path = os.path.join(name, rel_path)
+                hosts = set(rel_path.split(os.sep)) & self._host_names
+                if hosts:
+                    for host in hosts:
+                        per_host.setdefault(host, {})[rel_path] = digest
+                else:
+                    common[rel_path] = digest
+        return common, per_host
+
+    def _compute(self) -> Dict[str, dict]:
+        """Return the inputs of each role, common and for each host."""
+        inputs = {}
+        for role in sorted(set(unit.role for unit in self.units)):
+            if not os.path.isdir(os.path.join(self.roles_path, role)):
+                continue
+            role_files = self._role_files(role)
+            tokens = self._role_tokens(role_files)
+            relevant = self._relevant_variables(tokens)
+            common_overrides, host_overrides = self._overrides(role)
+            common = {
+                "global": self.global_inputs,
+                "role files": role_files,
+                "config overrides": common_overrides,
+                "variables": dict(
+                    (name, _digest(self.variables[name]))
+                    for name in relevant if name in self.variables),
+                "inventory groups": dict(
+                    (group, _digest(sorted(hosts)))
+                    for group, hosts in self.groups.items()
+                    if group in tokens),
+            }
+            common_digest = _digest(common)
+            hosts = {}
+            for host in sorted(self._role_hosts(role)):
+                host_vars = self.hostvars.get(host, {})
+                host_inputs = {
+                    "group defaults": dict(
+                        ("%s: %s" % (group, name), _digest(group_vars[name]))
+                        for group, group_vars in self.group_defaults.items()
+                        if host in self.groups.get(group, ())
+                        for name in relevant if name in group_vars),
+                    "host variables": dict(
+                        (name, _digest(host_vars[name]))
+                        for name in relevant if name in host_vars),
+                    "host groups": {"group_names": _digest(
+                        self._host_groups.get(host, []))},
+                    "host config overrides": host_overrides.get(host, {}),
+                }
+                hosts[host] = {
+                    "fingerprint": _digest([common_digest,
+                                            _digest(host_inputs)]),
+                    "inputs": host_inputs,
+                }
+            inputs[role] = {"inputs": common, "hosts": hosts}
+        return inputs
+
+    @staticmethod
+    def _diff_inputs(old: dict, new: dict) -> List[str]:
+        reasons = []
+        for kind in sorted(set(old) | set(new)):
+            old_kind = old.get(kind, {})
+            new_kind = new.get(kind, {})
+            for key in sorted(set(old_kind) | set(new_kind)):
+                if old_kind.get(key) != new_kind.get(key):
+                    reasons.append("%s: %s" % (kind, key))
+        return reasons
+
+    def _compare(self) -> Dict[str, dict]:
+        """Return the hosts and invalidated inputs of each changed role."""
+        changes = {}
+        for role, current in self.inputs.items():
+            previous = self.state.get(role)
+            hosts = []
+            reasons = []
+            for host, host_current in current["hosts"].items():
+                host_previous = (previous or {}).get("hosts", {}).get(host)
+                if (host_previous and host_previous["fingerprint"] ==
+                        host_current["fingerprint"]):
+                    continue
+                hosts.append(host)
+                if not host_previous:
+                    reason = "no previous run"
+                    if reason not in reasons:
+                        reasons.append(reason)
+                    continue
+                old = dict(previous["inputs"], **host_previous["inputs"])
+                new = dict(current["inputs"], **host_current["inputs"])
+                for reason in self._diff_inputs(old, new):
+                    if reason not in reasons:
+                        reasons.append(reason)
+            if hosts:
+                changes[role] = {"hosts": hosts, "reasons": reasons}
+        return changes
+
+    @property
+    def changed_roles(self) -> Set[str]:
+        return set(self.changes)
+
+    @property
+    def skip_tags(self) -> List[str]:
+        """Return the tags selecting only unchanged roles."""
+        tags = set()
+        for unit in self.units:
+            tags.update(set(unit.tags) - _ALWAYS_TAGS)
+        skip = []
+        for tag in sorted(tags):
+            if all(unit.role in self.inputs and
+                   unit.role not in self.changes
+                   for unit in self.units if tag in unit.tags):
+                skip.append(tag)
+        return skip
+
+    def report(self) -> List[str]:
+        """Return a human readable description of the plan."""
+        lines = []
+        for role in sorted(self.inputs):
+            change = self.changes.get(role)
+            if not change:
+                lines.append("%s: unchanged, skipping" % role)
+                continue
+            reasons = change["reasons"][:_MAX_REASONS]
+            if len(change["reasons"]) > _MAX_REASONS:
+                reasons.append("and %d more" %
+                               (len(change["reasons"]) - _MAX_REASONS))
+            lines.append("%s: changed on %d host(s) (%s): %s" % (
+                role, len(change["hosts"]), ", ".join(change["hosts"]),
+                "; ".join(reasons)))
+        return lines
+
+    def save(self) -> None:
+        """Record the fingerprints after a successful run."""
+        roles = dict(self.state)
+        roles.update(self.inputs)
+        content = json.dumps({"version": STATE_VERSION, "roles": roles},
+                             sort_keys=True)
+        tmp_path = self.state_path + ".tmp"
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        with os.fdopen(os.open(tmp_path, flags, mode=0o600), "w") as f:
+            f.write(content)
+        os.replace(tmp_path, self.state_path)
+
+
+def get_genconfig_plan(parsed_args, playbooks: List[str],
+                       extra_vars: dict) -> GenConfigPlan:
+    """Return the incremental plan of a genconfig command."""
+    config_path = os.path.abspath(parsed_args.kolla_config_path)
+    ansible_path = utils.get_data_files_path("ansible")
+
+    units = []
+    for playbook in playbooks:
+        units += kolla_playbooks.get_play_units(playbook)
+    roles_path = os.path.join(ansible_path, "roles")
+    group_defaults = _load_group_vars(os.path.join(ansible_path, "group_vars"))
+    defaults = group_defaults.pop("all", {})
+
+    overrides_path = os.path.join(config_path, "config")
+    globals_file = os.path.join(config_path, "globals.yml")
+    if os.path.isfile(globals_file):
+        custom = (_load_vars_file(globals_file) or {}).get(
+            "node_custom_config")
+        if isinstance(custom, str) and "{{" not in custom:
+            overrides_path = custom
+
+    cli_extra_vars = list(parsed_args.extra_vars or [])
+    cli_extra_vars += ["%s=%s" % item for item in sorted(extra_vars.items())]
+
+    state_path = (parsed_args.incremental_state or
+                  os.path.join(config_path, STATE_FILE))
+    return GenConfigPlan(
+        roles_path, units,
+        load_inventory(parsed_args, ansible.get_inventory_paths(parsed_args)),
+        defaults, ansible.get_extra_vars_files(parsed_args), overrides_path,
+        cli_extra_vars, state_path,
+        plugins_path=ansible_path, group_defaults=group_defaults)
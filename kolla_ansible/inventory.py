@@ -0,0 +1,174 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compilation of inventories to JSON.
+
+An inventory source, either a file or a directory of files, is compiled into
+a directory of the Kolla configuration path containing a JSON inventory,
+which Ansible loads faster than the INI inventories with many groups of
+children. The group_vars and host_vars directories next to the source are
+linked into the compiled directory, so that Ansible loads them as it does for
+the source with the same precedence.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import subprocess  # nosec
+
+from kolla_ansible import utils
+from typing import List
+
+# Directory of the compiled inventories in the config path.
+COMPILED_INVENTORY_DIR = "compiled-inventory"
+
+COMPILED_INVENTORY_FILE = "inventory.json"
+
+VARS_DIRS = ("group_vars", "host_vars")
+
+LOG = logging.getLogger(__name__)
+
+
+def _get_vars_path(source: str) -> str:
+    """Return the directory of the group_vars and host_vars of a source."""
+    if os.path.isdir(source):
+        return source
+    return os.path.dirname(source)
+
+
+def get_compiled_path(parsed_args, source: str) -> str:
+    """Return the path of the compiled directory of an inventory source."""
+    source = os.path.abspath(source)
+    digest = hashlib.sha256(source.encode()).hexdigest()[:12]
+    name = "%s-%s" % (os.path.basename(source.rstrip(os.sep)), digest)
+    return os.path.join(os.path.abspath(parsed_args.kolla_config_path),
+                        COMPILED_INVENTORY_DIR, name)
+
+
+def get_source_paths(source: str) -> List[str]:
+    """Return the paths whose changes affect the hosts and groups of a source.
+
+    The group_vars and host_vars directories are not included, as they are
+    loaded by Ansible from their original location.
+    """
+    if not os.path.isdir(source):
+        return [source]
+    paths = []
+    for root, dirs, files in os.walk(source):
+        if root == source:
+            dirs[:] = [d for d in dirs if d not in VARS_DIRS]
+        paths.append(root)
+        paths += [os.path.join(root, f) for f in files]
+    return paths
+
+
+def is_fresh(parsed_args, source: str) -> bool:
+    """Return whether the compiled inventory of a source is up to date."""
+    compiled = os.path.join(get_compiled_path(parsed_args, source),
+                            COMPILED_INVENTORY_FILE)
+    try:
+        compiled_mtime = os.stat(compiled).st_mtime_ns
+        return all(os.stat(path).st_mtime_ns < compiled_mtime
+                   for path in get_source_paths(source))
+    except OSError:
+        return False
+
+
+def _convert(listing: dict) -> dict:
+    """Convert an ansible-inventory --export listing to the YAML format.
+
+    Groups keep their own hosts, variables and children, so that the depth
+    and therefore the precedence of the variables of groups are unchanged.
+    """
+    hostvars = listing.pop("_meta", {}).get("hostvars", {})
+    seen = set()
+    groups = collections.OrderedDict()
+    for name, data in listing.items():
+        group = collections.OrderedDict()
+        if data.get("hosts"):
+            group["hosts"] = collections.OrderedDict()
+            for host in data["hosts"]:
+                # Variables of a host are set once, where it first appears.
+                host_vars = None if host in seen else hostvars.get(host)
+                group["hosts"][host] = host_vars or None
+                seen.add(host)
+        if data.get("children"):
+            group["children"] = collections.OrderedDict(
+                (child, None) for child in data["children"])
+        if data.get("vars"):
+            group["vars"] = data["vars"]
+        groups[name] = group
+    return groups
+
+
+def _link_vars_dirs(source: str, path: str) -> None:
+    vars_path = _get_vars_path(source)
+    for name in VARS_DIRS:
+        link = os.path.join(path, name)
+        if os.path.lexists(link):
+            os.remove(link)
+        target = os.path.join(vars_path, name)
+        if os.path.isdir(target):
+            os.symlink(target, link)
+
+
+def compile_inventory(parsed_args, source: str) -> str:
+    """Compile an inventory source to JSON.
+
+    Only the hosts, groups and variables defined by the source are compiled,
+    variables of the group_vars and host_vars directories are not.
+
+    :returns: the path of the compiled directory, to use as inventory.
+    :raises subprocess.CalledProcessError: if the source cannot be parsed.
+    """
+    source = os.path.abspath(source)
+    args = ["--list", "--export", "--inventory", source]
+    for vault_id in parsed_args.vault_id:
+        args += ["--vault-id", vault_id]
+    for vault_pass_file in parsed_args.vault_password_file:
+        args += ["--vault-password-file", vault_pass_file]
+    # NOTE: Vars plugins are disabled, so that the variables of group_vars
+    # and host_vars are not merged into the variables of the inventory.
+    env = dict(os.environ, ANSIBLE_VARS_ENABLED="")
+    result = utils.run_command("ansible-inventory", args, env=env,
+                               stdout=subprocess.PIPE, text=True)
+    groups = _convert(json.loads(result.stdout))
+
+    path = get_compiled_path(parsed_args, source)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    _link_vars_dirs(source, path)
+    compiled = os.path.join(path, COMPILED_INVENTORY_FILE)
+    tmp = compiled + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(groups, f)
+    os.replace(tmp, compiled)
+    return path
+
+
+def resolve_inventory_paths(parsed_args, sources: List[str]) -> List[str]:
+    """Return the inventories to use, compiled ones when they are fresh."""
+    inventories = []
+    for source in sources:
+        path = get_compiled_path(parsed_args, source)
+        if is_fresh(parsed_args, source):
+            LOG.debug("Using compiled inventory %s for %s", path, source)
+            inventories.append(path)
+            continue
+        if os.path.isdir(path):
+            LOG.warning("Compiled inventory %s is older than %s and is not "
+                        "used, run 'kolla-ansible inventory compile' to "
+                        "update it", path, source)
+        inventories.append(source)
+    return inventories
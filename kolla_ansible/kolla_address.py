@@ -21,6 +21,7 @@ from jinja2.runtime import Undefined
 
 from kolla_ansible.exception import FilterError
 from kolla_ansible.helpers import _call_bool_filter
+from kolla_ansible.helpers import get_task_cache
 
 
 @pass_context
@@ -55,6 +56,25 @@ def kolla_address(context, network_name, hostname=None, override_var=None):
     if hostvars is None or isinstance(hostvars, Undefined):
         raise FilterError("'hostvars' variable is unavailable")
 
+    # NOTE: Looking up hostvars of a host merges and templates all of its
+    # variables, which is the main cost of this filter. Addresses are
+    # computed once for each host and network while a task is rendered, e.g.
+    # by a template listing the addresses of a group several times. Ansible
+    # renders each task in a forked worker, results are not shared by tasks.
+    cache = get_task_cache(hostvars)
+    if cache is None:
+        return _resolve_address(context, hostvars, network_name, hostname,
+                                override_var)
+    key = ('kolla_address', hostname, network_name, override_var)
+    address = cache.get(key)
+    if address is None:
+        address = cache[key] = _resolve_address(
+            context, hostvars, network_name, hostname, override_var)
+    return address
+
+
+def _resolve_address(context, hostvars, network_name, hostname,
+                     override_var):
     host = hostvars.get(hostname)
     if isinstance(host, Undefined):
         raise FilterError("'{hostname}' not in 'hostvars'"
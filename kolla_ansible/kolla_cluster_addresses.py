@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from jinja2.filters import pass_context
+from jinja2.runtime import Undefined
+
+from kolla_ansible.exception import FilterError
+from kolla_ansible.helpers import get_task_cache
+from kolla_ansible.kolla_address import kolla_address
+from kolla_ansible.kolla_url import kolla_url
+from kolla_ansible.put_address_in_context import put_address_in_context
+
+
+@pass_context
+def kolla_cluster_addresses(context, hosts, network_name,
+                            address_context=None, port=None, protocol=None,
+                            path='', override_var=None):
+    """returns IP addresses of a list of hosts on the requested network
+
+    Replaces loops calling kolla_address and put_address_in_context for each
+    member of a group, e.g.:
+
+    {{ groups['memcached'] | kolla_cluster_addresses('api', 'memcache',
+                                                     memcached_port)
+                           | join(',') }}
+
+    :param context: Jinja2 Context
+    :param hosts: list of hostnames, e.g. groups['rabbitmq']
+    :param network_name: string denoting the name of the network to get IP
+                         addresses for, e.g. 'api'
+    :param address_context: context of the addresses, as accepted by
+                            put_address_in_context, or None for raw
+                            addresses
+    :param port: optional port appended to each address
+    :param protocol: optional protocol, formats each address as an URL with
+                     kolla_url, port is then required
+    :param path: path of URLs, used with protocol
+    :param override_var: optional name of a host variable that can be used
+                         to override the IP address
+    :returns: list of strings, in the order of hosts
+    """
+    if hosts is None or isinstance(hosts, Undefined):
+        raise FilterError("List of hosts is undefined")
+    if protocol is not None and port is None:
+        raise FilterError("Port is required to format URLs")
+    hosts = tuple(hosts)
+
+    # NOTE: Lists are cached along with the addresses while a task is
+    # rendered, so that a template using a member list several times only
+    # computes it once. Each host still computes the list for each task.
+    cache = get_task_cache(context.get('hostvars'))
+    key = ('kolla_cluster_addresses', hosts, network_name, address_context,
+           port, protocol, path, override_var)
+    if cache is not None and key in cache:
+        return list(cache[key])
+
+    addresses = []
+    for host in hosts:
+        address = kolla_address(context, network_name, host, override_var)
+        if protocol is not None:
+            address = kolla_url(address, protocol, port, path,
+                                address_context or 'url')
+        else:
+            if address_context is not None:
+                address = put_address_in_context(address, address_context)
+            if port is not None:
+                address = '{address}:{port}'.format(address=address,
+                                                    port=port)
+        addresses.append(address)
+
+    if cache is not None:
+        cache[key] = tuple(addresses)
+    return addresses
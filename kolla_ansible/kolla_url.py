@@ -14,7 +14,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from kolla_ansible.put_address_in_context import put_address_in_context
+import functools
+
+from kolla_ansible.put_address_in_context import format_address
+
+# Ports omitted from URLs of a protocol.
+DEFAULT_PORTS = {('http', 80), ('https', 443), ('ws', 80), ('wss', 443)}
 
 
 def kolla_url(fqdn, protocol, port, path='', context='url'):
@@ -26,16 +31,24 @@ def kolla_url(fqdn, protocol, port, path='', context='url'):
     :param path: path - optional
     :returns: string with url
     """
+    # NOTE: Arguments are cached along with their type, unhashable arguments
+    # are formatted without the cache.
+    try:
+        return _cached_kolla_url(fqdn, protocol, port, path, context)
+    except TypeError:
+        return _kolla_url(fqdn, protocol, port, path, context)
+
 
-    fqdn = put_address_in_context(fqdn, context)
+def _kolla_url(fqdn, protocol, port, path, context):
+    fqdn = format_address(fqdn, context)
     port = int(port)
 
-    if ((protocol == 'http' and port == 80) or
-       (protocol == 'https' and port == 443) or
-       (protocol == 'ws' and port == 80) or
-       (protocol == 'wss' and port == 443)):
+    if (protocol, port) in DEFAULT_PORTS:
         address = f"{protocol}://{fqdn}{path}"
     else:
         address = f"{protocol}://{fqdn}:{port}{path}"
 
     return address
+
+
+_cached_kolla_url = functools.lru_cache(maxsize=4096, typed=True)(_kolla_url)
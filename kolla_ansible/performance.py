@@ -0,0 +1,208 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Ansible configuration tuned for the performance of large deployments.
+
+A performance profile generates an Ansible configuration file from the one
+Ansible would otherwise use, adding the connection and execution settings of
+the profile which it does not set. Options set in the base configuration or
+in the environment therefore override those of the profile.
+"""
+
+import configparser
+import importlib.util
+import os
+
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+# Sizing of the forks of each profile, which are limited by the number of
+# hosts, the number of CPUs of the control host and a maximum.
+PROFILES = {
+    "default": {"forks_per_cpu": 4, "max_forks": 50,
+                "control_persist": "60s"},
+    "large": {"forks_per_cpu": 10, "max_forks": 200,
+              "control_persist": "30m"},
+}
+
+# Default number of forks of Ansible, the minimum used by profiles.
+MIN_FORKS = 5
+
+# Name of the generated configuration file in the config path.
+CONFIG_FILE = "ansible-%s.cfg"
+
+PATH_TYPES = {"path": os.pathsep, "pathspec": os.pathsep, "pathlist": ","}
+
+
+class Setting(NamedTuple):
+    """An option of the Ansible configuration set by a profile.
+
+    The option is not set if the base configuration sets it under any of its
+    names, or if any of its environment variables is set.
+    """
+    section: str
+    key: str
+    value: str
+    aliases: Tuple[Tuple[str, str], ...] = ()
+    env: Tuple[str, ...] = ()
+
+
+def get_forks(profile: str, hosts: int, processes: int = 1,
+              cpus: int = None) -> int:
+    """Return the number of forks of a profile.
+
+    :param hosts: number of hosts targeted by Ansible.
+    :param processes: number of Ansible processes run at the same time,
+        which share the forks.
+    """
+    sizing = PROFILES[profile]
+    cpus = cpus or os.cpu_count() or 1
+    forks = min(hosts, cpus * sizing["forks_per_cpu"], sizing["max_forks"])
+    return max(MIN_FORKS, forks // max(1, processes))
+
+
+def _get_mitogen_strategy_path() -> Optional[str]:
+    """Return the path of the Mitogen strategy plugins, if it is installed."""
+    spec = importlib.util.find_spec("ansible_mitogen")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(list(spec.submodule_search_locations)[0], "plugins",
+                        "strategy")
+
+
+def get_settings(profile: str, hosts: int, processes: int = 1,
+                 free_strategy: bool = False) -> List[List[Setting]]:
+    """Return the settings of a profile.
+
+    Settings are grouped, the settings of a group are only set if none of
+    them is set by the base configuration.
+
+    :param free_strategy: whether the plays may use the free strategy, which
+        does not wait for every host to finish a task before the next one.
+    """
+    forks = get_forks(profile, hosts, processes)
+    control_persist = PROFILES[profile]["control_persist"]
+    settings = [
+        [Setting("defaults", "forks", str(forks), env=("ANSIBLE_FORKS",))],
+        [Setting("ssh_connection", "pipelining", "True",
+                 aliases=(("defaults", "pipelining"),
+                          ("connection", "pipelining")),
+                 env=("ANSIBLE_PIPELINING", "ANSIBLE_SSH_PIPELINING"))],
+        [Setting("ssh_connection", "ssh_args",
+                 "-C -o ControlMaster=auto -o ControlPersist=%s" %
+                 control_persist,
+                 env=("ANSIBLE_SSH_ARGS",))],
+    ]
+    strategy = "free" if free_strategy else "linear"
+    strategy_plugins = _get_mitogen_strategy_path()
+    strategy_settings = []
+    if strategy_plugins:
+        strategy_settings.append(
+            Setting("defaults", "strategy_plugins", strategy_plugins,
+                    env=("ANSIBLE_STRATEGY_PLUGINS",)))
+        strategy = "mitogen_%s" % strategy
+    if strategy != "linear":
+        strategy_settings.append(
+            Setting("defaults", "strategy", strategy,
+                    env=("ANSIBLE_STRATEGY",)))
+        settings.append(strategy_settings)
+    return settings
+
+
+def find_base_config() -> Optional[str]:
+    """Return the configuration file Ansible would use, if any."""
+    from ansible.config.manager import find_ini_config_file
+    return find_ini_config_file()
+
+
+def _read_base_config(base: Optional[str]) -> configparser.ConfigParser:
+    """Read a configuration file, making its relative paths absolute.
+
+    Ansible resolves relative paths relative to the directory of the
+    configuration file, which differs from that of the generated file.
+    """
+    parser = configparser.ConfigParser(interpolation=None,
+                                       inline_comment_prefixes=(";",))
+    if not base:
+        return parser
+    parser.read(base)
+
+    from ansible.config.manager import ConfigManager
+    manager = ConfigManager(base)
+    for name, definition in manager.get_configuration_definitions().items():
+        separator = PATH_TYPES.get(definition.get("type"))
+        if not separator:
+            continue
+        value, origin = manager.get_config_value_and_origin(name)
+        if origin != base:
+            continue
+        if isinstance(value, list):
+            value = separator.join(value)
+        for ini in definition.get("ini", []):
+            if parser.has_option(ini["section"], ini["key"]):
+                parser.set(ini["section"], ini["key"], value)
+    return parser
+
+
+def _is_set(parser: configparser.ConfigParser, setting: Setting,
+            env: dict) -> bool:
+    names = ((setting.section, setting.key),) + setting.aliases
+    return (any(parser.has_option(section, key) for section, key in names) or
+            any(env.get(name) for name in setting.env))
+
+
+def write_config(path: str, profile: str, hosts: int, processes: int = 1,
+                 free_strategy: bool = False, base: str = None,
+                 env: dict = None) -> List[Setting]:
+    """Write the Ansible configuration of a profile.
+
+    :param base: the configuration file to which the settings of the profile
+        are added.
+    :param env: the environment of Ansible, whose variables override the
+        settings of the profile.
+    :returns: the settings added to the base configuration.
+    """
+    env = os.environ if env is None else env
+    parser = _read_base_config(base)
+    applied = []
+    for group in get_settings(profile, hosts, processes, free_strategy):
+        if any(_is_set(parser, setting, env) for setting in group):
+            continue
+        for setting in group:
+            if not parser.has_section(setting.section):
+                parser.add_section(setting.section)
+            parser.set(setting.section, setting.key, setting.value)
+            applied.append(setting)
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("# Generated by kolla-ansible for the %s performance "
+                "profile.\n" % profile)
+        f.write("# Base configuration: %s\n" % (base or "none"))
+        f.write("# Set options in the base configuration to override "
+                "those of the profile.\n\n")
+        parser.write(f)
+    os.replace(tmp, path)
+    return applied
+
+
+def get_config_path(config_path: str, profile: str) -> str:
+    """Return the path of the generated configuration of a profile."""
+    return os.path.join(os.path.abspath(config_path), CONFIG_FILE % profile)
+
+
+def describe(settings: List[Setting]) -> List[str]:
+    """Return a line describing each setting added by a profile."""
+    return ["[%s] %s = %s" % (setting.section, setting.key, setting.value)
+            for setting in settings]
@@ -0,0 +1,261 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Static inspection of Kolla Ansible playbooks and roles."""
+
+import collections
+import os
+
+from kolla_ansible import utils
+from kolla_ansible import yaml_utils
+from typing import Dict
+from typing import List
+from typing import Set
+
+# A role applied by a play, either through the play's roles or through an
+# include_role or import_role task. Tags contains all tags inherited by the
+# role's tasks and hosts the plain host patterns of the play.
+PlayUnit = collections.namedtuple(
+    "PlayUnit", ["play", "role", "tags", "hosts", "playbook"])
+
+_ROLE_INCLUDE_KEYS = (
+    "include_role", "import_role",
+    "ansible.builtin.include_role", "ansible.builtin.import_role",
+)
+_TASK_LIST_KEYS = ("tasks", "pre_tasks", "post_tasks", "handlers",
+                   "block", "rescue", "always")
+_IMPORT_PLAYBOOK_ACTIONS = ("import_playbook",
+                            "ansible.builtin.import_playbook")
+# Keywords of import_playbook which can be applied to the imported plays.
+_IMPORT_PLAYBOOK_KEYS = ("name", "tags", "vars", "when")
+
+
+def _as_list(value) -> List[str]:
+    """Return tags or host patterns as a list of strings."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _walk_tasks(tasks, tags, units, play, hosts, playbook):
+    for task in tasks or []:
+        if not isinstance(task, dict):
+            continue
+        task_tags = tags | set(_as_list(task.get("tags")))
+        for key in _ROLE_INCLUDE_KEYS:
+            include = task.get(key)
+            if isinstance(include, dict) and include.get("name"):
+                units.append(PlayUnit(play, include["name"],
+                                      frozenset(task_tags), hosts, playbook))
+        for key in _TASK_LIST_KEYS:
+            if key in task:
+                _walk_tasks(task[key], task_tags, units, play, hosts,
+                            playbook)
+
+
+def _apply_import(play: dict, imported: dict, path: str,
+                  strict: bool) -> dict:
+    """Return a play of an imported playbook with the keywords of the import.
+
+    As done by Ansible, the tags and variables of the import are merged into
+    those of the play, and its condition is added to the blocks and roles of
+    the play.
+
+    :raises ValueError: if strict and a keyword of the import cannot be
+        applied.
+    """
+    unsupported = set(imported) - set(_IMPORT_PLAYBOOK_KEYS)
+    if strict and unsupported:
+        raise ValueError("Unsupported keywords for the import of %s: %s" %
+                         (path, ", ".join(sorted(unsupported))))
+    play = dict(play)
+    tags = _as_list(play.get("tags"))
+    tags += [tag for tag in _as_list(imported.get("tags"))
+             if tag not in tags]
+    if tags:
+        play["tags"] = tags
+    if imported.get("vars"):
+        play["vars"] = dict(play.get("vars") or {}, **imported["vars"])
+    when = imported.get("when")
+    if when is None:
+        return play
+    when = when if isinstance(when, list) else [when]
+    if strict and play.get("gather_facts", True) not in (False, "false",
+                                                         "no"):
+        raise ValueError("The condition of the import of %s cannot be "
+                         "applied to the facts gathered by play %s" %
+                         (path, play.get("name", "")))
+    for key in ("pre_tasks", "tasks", "post_tasks"):
+        if play.get(key):
+            play[key] = [{"block": play[key], "when": when}]
+    roles = []
+    for role in play.get("roles") or []:
+        role = {"role": role} if isinstance(role, str) else dict(role)
+        role_when = role.get("when")
+        if role_when is None:
+            role_when = []
+        role["when"] = when + (role_when if isinstance(role_when, list)
+                               else [role_when])
+        roles.append(role)
+    if roles:
+        play["roles"] = roles
+    return play
+
+
+def _get_plays(playbook_path: str, strict: bool = False) -> List[tuple]:
+    """Return the plays of a playbook and the playbooks they are in.
+
+    Playbooks imported with import_playbook are followed, and the keywords
+    of the import are applied to their plays.
+
+    :raises ValueError: if strict and a keyword of an import cannot be
+        applied.
+    """
+    result = []
+    plays = utils.read_yaml_file(playbook_path) or []
+    for play in plays:
+        if not isinstance(play, dict):
+            continue
+        imported = next((play[k] for k in _IMPORT_PLAYBOOK_ACTIONS
+                         if k in play), None)
+        if imported:
+            path = os.path.join(os.path.dirname(playbook_path), imported)
+            keywords = dict((k, v) for k, v in play.items()
+                            if k not in _IMPORT_PLAYBOOK_ACTIONS)
+            result += [(_apply_import(p, keywords, imported, strict), p_path)
+                       for p, p_path in _get_plays(path, strict)]
+            continue
+        result.append((play, playbook_path))
+    return result
+
+
+def _get_play_units(play: dict, playbook_path: str) -> List[PlayUnit]:
+    units = []
+    name = play.get("name", "")
+    tags = set(_as_list(play.get("tags")))
+    hosts = tuple(_as_list(play.get("hosts")))
+    for role in play.get("roles") or []:
+        if isinstance(role, str):
+            role = {"role": role}
+        role_name = role.get("role", role.get("name"))
+        if role_name:
+            role_tags = tags | set(_as_list(role.get("tags")))
+            units.append(PlayUnit(name, role_name, frozenset(role_tags),
+                                  hosts, playbook_path))
+    for key in ("pre_tasks", "tasks", "post_tasks", "handlers"):
+        _walk_tasks(play.get(key), tags, units, name, hosts, playbook_path)
+    return units
+
+
+def get_play_units(playbook_path: str) -> List[PlayUnit]:
+    """Return the roles applied by a playbook in execution order.
+
+    Playbooks imported with import_playbook are followed.
+    """
+    units = []
+    for play, path in _get_plays(playbook_path):
+        units += _get_play_units(play, path)
+    return units
+
+
+def select_plays(playbook_path: str, services: List[str]) -> List[dict]:
+    """Return the plays of a playbook which apply to some services.
+
+    A play is selected when it is tagged with a service or always, or when
+    it applies a role tagged with or named after a service, including
+    through include_role and import_role tasks. The plays of imported
+    playbooks are returned in place of the import.
+
+    :raises ValueError: if no role or play matches a service, or if a
+        keyword of an import cannot be applied to the imported plays.
+    """
+    services = set(services)
+    matched = set()
+    selected = []
+    for play, path in _get_plays(playbook_path, strict=True):
+        play_tags = set(_as_list(play.get("tags")))
+        names = set(play_tags)
+        for unit in _get_play_units(play, path):
+            names |= unit.tags | {unit.role}
+        matched |= names & services
+        if (play_tags | names) & (services | {"always"}):
+            selected.append(play)
+    unknown = services - matched
+    if unknown:
+        raise ValueError("Unknown services: %s" % ", ".join(sorted(unknown)))
+    return selected
+
+
+def write_scoped_playbook(playbook_path: str, services: List[str],
+                          dest: str) -> str:
+    """Write a playbook containing only the plays for some services.
+
+    The playbook is written to a new directory which mirrors the directory
+    of the original playbook with symbolic links, so that roles, plugins and
+    group variables next to the playbook are still found by Ansible.
+
+    :returns: the path of the new playbook.
+    """
+    plays = select_plays(playbook_path, services)
+    source_dir = os.path.dirname(os.path.abspath(playbook_path))
+    os.makedirs(dest)
+    for entry in os.listdir(source_dir):
+        if not entry.endswith((".yml", ".yaml")):
+            os.symlink(os.path.join(source_dir, entry),
+                       os.path.join(dest, entry))
+    path = os.path.join(dest, os.path.basename(playbook_path))
+    with open(path, "w") as f:
+        yaml_utils.safe_dump(plays, f, default_flow_style=False)
+    return path
+
+
+def get_role_dependencies(roles_path: str, role: str,
+                          _cache: Dict[str, Set[str]] = None) -> Set[str]:
+    """Return the roles used by a role, including the role itself.
+
+    Roles are found through meta dependencies and through include_role and
+    import_role tasks with a static name.
+    """
+    if _cache is None:
+        _cache = {}
+    if role in _cache:
+        return _cache[role]
+    result = _cache[role] = {role}
+    role_path = os.path.join(roles_path, role)
+    direct = set()
+    meta = os.path.join(role_path, "meta", "main.yml")
+    if os.path.isfile(meta):
+        for dep in (utils.read_yaml_file(meta) or {}).get("dependencies",
+                                                          []) or []:
+            if isinstance(dep, dict):
+                dep = dep.get("role", dep.get("name"))
+            if isinstance(dep, str):
+                direct.add(dep)
+    for subdir in ("tasks", "handlers"):
+        path = os.path.join(role_path, subdir)
+        if not os.path.isdir(path):
+            continue
+        for filename in sorted(os.listdir(path)):
+            if not filename.endswith((".yml", ".yaml")):
+                continue
+            units = []
+            tasks = utils.read_yaml_file(os.path.join(path, filename))
+            if isinstance(tasks, list):
+                _walk_tasks(tasks, set(), units, None, (), None)
+            direct.update(unit.role for unit in units)
+    for dep in sorted(direct):
+        if "{{" in dep or not os.path.isdir(os.path.join(roles_path, dep)):
+            continue
+        result.update(get_role_dependencies(roles_path, dep, _cache))
+    return result
@@ -14,21 +14,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 from ipaddress import ip_address
+
 from kolla_ansible.exception import FilterError
 
+CONTEXTS = ('url', 'memcache', 'rabbitmq')
 
-def put_address_in_context(address, context):
-    """puts address in context
 
-    :param address: the address to contextify
-    :param context: describes context in which the address appears,
-                    either 'url' or 'memcache',
-                    affects only IPv6 addresses format
-    :returns: string with address in proper context
+def format_address(address, context):
+    """Return an address in a context, memoised by address and context.
+
+    Templates format the same addresses for every service endpoint and every
+    host, see put_address_in_context. Arguments are cached along with their
+    type, so that a str subclass such as Ansible's unsafe text is returned as
+    given, and unhashable arguments are formatted without the cache.
     """
+    try:
+        return _cached_format_address(address, context)
+    except TypeError:
+        return _format_address(address, context)
 
-    if context not in ['url', 'memcache', 'rabbitmq']:
+
+def _format_address(address, context):
+    if context not in CONTEXTS:
         raise FilterError("Unknown context '{context}'"
                           .format(context=context))
 
@@ -48,12 +57,38 @@ def put_address_in_context(address, context):
     # and converting IPv6 as described here:
     # https://www.erlang.org/doc/man/inet.html#type-ip6_address
 
-    if context == 'rabbitmq':
-        if ip_address(address).version == 6:
-            return (",".join(['16#%x' % int(x, 16)
-                    for x in
-                    ip_address(address).exploded.split(':')]))
+    parsed = ip_address(address)
+    if parsed.version == 6:
+        return ",".join('16#%x' % int(x, 16)
+                        for x in parsed.exploded.split(':'))
+
+    return address.replace('.', ',')
+
+
+_cached_format_address = functools.lru_cache(maxsize=4096, typed=True)(
+    _format_address)
+
 
-        return address.replace('.', ',')
+def put_address_in_context(address, context):
+    """puts address in context
+
+    :param address: the address to contextify
+    :param context: describes context in which the address appears,
+                    either 'url' or 'memcache',
+                    affects only IPv6 addresses format
+    :returns: string with address in proper context
+    """
+    return format_address(address, context)
+
+
+def put_addresses_in_context(addresses, context):
+    """puts a list of addresses in context
 
-    return address
+    :param addresses: the addresses to contextify
+    :param context: context of the addresses, see put_address_in_context
+    :returns: list of strings with addresses in proper context
+    """
+    if context not in CONTEXTS:
+        raise FilterError("Unknown context '{context}'"
+                          .format(context=context))
+    return [format_address(address, context) for address in addresses]
@@ -10,6 +10,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections.abc
+
 
 def _to_bool(value):
     """Simplified version of the bool filter.
@@ -21,3 +23,24 @@ def _to_bool(value):
     if value == 'no':
         return False
     return bool(value)
+
+
+class FakeHostVars(collections.abc.Mapping):
+    """Mapping of host variables mimicking Ansible's HostVars.
+
+    Unlike a dict, it may be weakly referenced. Lookups of hosts are counted.
+    """
+
+    def __init__(self, hostvars):
+        self._hostvars = hostvars
+        self.lookups = 0
+
+    def __getitem__(self, hostname):
+        self.lookups += 1
+        return self._hostvars[hostname]
+
+    def __iter__(self):
+        return iter(self._hostvars)
+
+    def __len__(self):
+        return len(self._hostvars)
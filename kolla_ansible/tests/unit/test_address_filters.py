@@ -15,15 +15,20 @@
 # limitations under the License.
 
 import unittest
+from unittest import mock
 
 import jinja2
 
 from kolla_ansible.exception import FilterError
+from kolla_ansible import helpers
 from kolla_ansible.kolla_address import kolla_address
+from kolla_ansible.kolla_cluster_addresses import kolla_cluster_addresses
 from kolla_ansible.kolla_url import kolla_url
 from kolla_ansible.put_address_in_context import put_address_in_context
+from kolla_ansible.put_address_in_context import put_addresses_in_context
 
 from kolla_ansible.tests.unit.helpers import _to_bool
+from kolla_ansible.tests.unit.helpers import FakeHostVars
 
 
 class TestAddressContextFilter(unittest.TestCase):
@@ -63,6 +68,25 @@ class TestAddressContextFilter(unittest.TestCase):
 
     def test_unknown_context(self):
         self.assertRaises(FilterError, put_address_in_context, '', 'lol')
+        self.assertRaises(FilterError, put_addresses_in_context, [], 'lol')
+
+    def test_bulk(self):
+        self.assertEqual(
+            ['192,168,1,1', '16#fd,16#0,16#0,16#0,16#0,16#0,16#0,16#1'],
+            put_addresses_in_context(['192.168.1.1', 'fd::1'], 'rabbitmq'))
+        self.assertEqual([], put_addresses_in_context([], 'url'))
+
+    def test_cached_by_type(self):
+        class Text(str):
+            pass
+
+        addr = '192.0.2.1'
+        self.assertIs(str, type(put_address_in_context(addr, 'url')))
+        self.assertIs(Text, type(put_address_in_context(Text(addr), 'url')))
+
+    def test_unhashable_context(self):
+        self.assertRaises(FilterError, put_address_in_context, 'fd::',
+                          ['url'])
 
 
 class TestKollaAddressFilter(unittest.TestCase):
@@ -391,6 +415,167 @@ class TestKollaAddressFilter(unittest.TestCase):
             addr, kolla_address(context, 'api', None, override_var))
 
 
+class TestKollaAddressCache(unittest.TestCase):
+
+    def setUp(self):
+        # Bandit complains about Jinja2 autoescaping without nosec.
+        self.env = jinja2.Environment()  # nosec
+        self.env.filters['bool'] = _to_bool
+        self.hostvars = FakeHostVars({
+            'primary': {
+                'api_address_family': 'ipv4',
+                'api_interface': 'eth0',
+                'storage_address_family': 'ipv4',
+                'storage_interface': 'eth1',
+                'my_ip_address': '192.0.2.10',
+                'ansible_facts': {
+                    'eth0': {'ipv4': {'address': '192.0.2.1'}},
+                    'eth1': {'ipv4': {'address': '198.51.100.1'}},
+                },
+            },
+            'secondary': {
+                'api_address_family': 'ipv4',
+                'api_interface': 'eth0',
+                'ansible_facts': {
+                    'eth0': {'ipv4': {'address': '192.0.2.2'}},
+                },
+            },
+        })
+        self.context = self.env.context_class(
+            self.env, name='dummy', blocks={},
+            parent={'inventory_hostname': 'primary',
+                    'hostvars': self.hostvars})
+
+    def test_cached(self):
+        for _ in range(3):
+            self.assertEqual('192.0.2.1', kolla_address(self.context, 'api'))
+            self.assertEqual('192.0.2.2',
+                             kolla_address(self.context, 'api', 'secondary'))
+        self.assertEqual(2, self.hostvars.lookups)
+
+    def test_cached_per_network_and_override_var(self):
+        self.assertEqual('192.0.2.1', kolla_address(self.context, 'api'))
+        self.assertEqual('198.51.100.1',
+                         kolla_address(self.context, 'storage'))
+        self.assertEqual(
+            '192.0.2.10',
+            kolla_address(self.context, 'api', override_var='my_ip_address'))
+        self.assertEqual(3, self.hostvars.lookups)
+
+    def test_errors_not_cached(self):
+        for _ in range(2):
+            self.assertRaises(FilterError, kolla_address, self.context,
+                              'tunnel')
+        self.assertEqual(2, self.hostvars.lookups)
+
+    def test_table_per_hostvars(self):
+        kolla_address(self.context, 'api')
+        hostvars = FakeHostVars(self.hostvars._hostvars)
+        context = self.env.context_class(
+            self.env, name='dummy', blocks={},
+            parent={'inventory_hostname': 'primary', 'hostvars': hostvars})
+        kolla_address(context, 'api')
+        self.assertEqual(1, hostvars.lookups)
+
+    def test_table_per_process(self):
+        kolla_address(self.context, 'api')
+        with mock.patch('os.getpid', return_value=-1):
+            kolla_address(self.context, 'api')
+        self.assertEqual(2, self.hostvars.lookups)
+
+    def test_table_dropped_with_hostvars(self):
+        kolla_address(self.context, 'api')
+        key = id(self.hostvars)
+        self.assertIn(key, helpers._TASK_CACHES)
+        del self.context, self.hostvars
+        self.assertNotIn(key, helpers._TASK_CACHES)
+
+
+class TestKollaClusterAddressesFilter(unittest.TestCase):
+
+    def setUp(self):
+        # Bandit complains about Jinja2 autoescaping without nosec.
+        self.env = jinja2.Environment()  # nosec
+        self.env.filters['bool'] = _to_bool
+        self.env.filters['kolla_cluster_addresses'] = kolla_cluster_addresses
+        self.hosts = ['primary', 'secondary']
+        self.hostvars = FakeHostVars({
+            'primary': {
+                'api_address_family': 'ipv4',
+                'api_interface': 'eth0',
+                'ansible_facts': {
+                    'eth0': {'ipv4': {'address': '192.0.2.1'}},
+                },
+            },
+            'secondary': {
+                'enable_haproxy': 'no',
+                'api_address_family': 'ipv6',
+                'api_interface': 'eth0',
+                'ansible_facts': {
+                    'eth0': {'ipv6': [{'address': 'fd::2',
+                                       'scope': 'global'}]},
+                },
+            },
+        })
+        self.context = self.env.context_class(
+            self.env, name='dummy', blocks={},
+            parent={'inventory_hostname': 'primary',
+                    'hostvars': self.hostvars})
+
+    def _addresses(self, *args, **kwargs):
+        return kolla_cluster_addresses(self.context, self.hosts, 'api',
+                                       *args, **kwargs)
+
+    def test_raw(self):
+        self.assertEqual(['192.0.2.1', 'fd::2'], self._addresses())
+
+    def test_port(self):
+        self.assertEqual(['192.0.2.1:11211', 'fd::2:11211'],
+                         self._addresses(port=11211))
+
+    def test_url_context(self):
+        self.assertEqual(['192.0.2.1:5672', '[fd::2]:5672'],
+                         self._addresses('url', 5672))
+
+    def test_memcache_context(self):
+        self.assertEqual(['192.0.2.1:11211', 'inet6:[fd::2]:11211'],
+                         self._addresses('memcache', 11211))
+
+    def test_rabbitmq_context(self):
+        self.assertEqual(
+            ['192,0,2,1', '16#fd,16#0,16#0,16#0,16#0,16#0,16#0,16#2'],
+            self._addresses('rabbitmq'))
+
+    def test_url(self):
+        self.assertEqual(['https://192.0.2.1:8443/v2', 'https://[fd::2]/v2'],
+                         [self._addresses(protocol='https', port=8443,
+                                          path='/v2')[0],
+                          self._addresses(protocol='https', port=443,
+                                          path='/v2')[1]])
+
+    def test_url_requires_port(self):
+        self.assertRaises(FilterError, self._addresses, protocol='https')
+
+    def test_undefined_hosts(self):
+        self.assertRaises(FilterError, kolla_cluster_addresses, self.context,
+                          jinja2.Undefined(), 'api')
+
+    def test_cached(self):
+        template = self.env.from_string(
+            "{{ hosts | kolla_cluster_addresses('api', 'url', 80)"
+            " | join(',') }}")
+        for hostname in self.hosts:
+            self.assertEqual(
+                '192.0.2.1:80,[fd::2]:80',
+                template.render(hosts=self.hosts, hostvars=self.hostvars,
+                                inventory_hostname=hostname))
+        self.assertEqual(2, self.hostvars.lookups)
+
+    def test_cached_list_not_shared(self):
+        self._addresses().append('198.51.100.1')
+        self.assertEqual(['192.0.2.1', 'fd::2'], self._addresses())
+
+
 class TestKollaUrlFilter(unittest.TestCase):
 
     def test_https_443_path(self):
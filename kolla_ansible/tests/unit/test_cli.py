@@ -0,0 +1,537 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import contextlib
+import importlib.metadata
+import io
+import json
+import os
+import shutil
+import subprocess  # nosec
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from kolla_ansible import ansible
+from kolla_ansible.cli import commands
+from kolla_ansible.cmd import kolla_ansible
+from kolla_ansible import fanout
+from kolla_ansible import performance
+from kolla_ansible import utils
+
+ENTRY_POINTS = [
+    importlib.metadata.EntryPoint(
+        name=name, value=value, group="kolla_ansible.cli")
+    for name, value in [
+        ("gather-facts", "kolla_ansible.cli.commands:GatherFacts"),
+        ("mariadb_backup", "kolla_ansible.cli.commands:MariaDBBackup"),
+        ("broken", "kolla_ansible.cli.missing:Command"),
+    ]
+]
+
+
+def _entry_points(group):
+    return [ep for ep in ENTRY_POINTS if ep.group == group]
+
+
+class TestLazyCommandManager(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(importlib.metadata, "entry_points",
+                                    side_effect=_entry_points)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = kolla_ansible.LazyCommandManager("kolla_ansible.cli")
+
+    def test_command_names(self):
+        self.assertEqual(["gather-facts", "mariadb backup", "broken"],
+                         self.manager.get_command_names())
+        self.assertEqual(
+            ["gather-facts", "mariadb backup", "broken"],
+            self.manager.get_command_names("kolla_ansible.cli"))
+        self.assertEqual(["kolla_ansible.cli"],
+                         self.manager.get_command_groups())
+
+    def test_find_command(self):
+        # The entry point of a missing module is never loaded.
+        cmd, name, args = self.manager.find_command(
+            ["mariadb", "backup", "--full"])
+        self.assertIs(commands.MariaDBBackup, cmd)
+        self.assertEqual("mariadb backup", name)
+        self.assertEqual(["--full"], args)
+
+    def test_find_command_unknown(self):
+        self.assertRaises(ValueError, self.manager.find_command, ["deploy"])
+
+    def test_ignored_modules(self):
+        manager = kolla_ansible.LazyCommandManager(
+            "kolla_ansible.cli", ignored_modules=["kolla_ansible.cli.missing"])
+        self.assertEqual(["gather-facts", "mariadb backup"],
+                         manager.get_command_names())
+
+
+class TestKollaAnsibleApp(unittest.TestCase):
+
+    def test_startup_imports(self):
+        # A new interpreter is needed, as the modules are already imported
+        # by the tests.
+        code = ("import sys; "
+                "from kolla_ansible.cmd import kolla_ansible; "
+                "kolla_ansible.KollaAnsibleApp(); "
+                "print('\\n'.join(sys.modules))")
+        output = subprocess.check_output(  # nosec
+            [sys.executable, "-c", code], universal_newlines=True)
+        modules = output.splitlines()
+        for name in ("kolla_ansible.cli.commands", "pbr.packaging", "yaml"):
+            self.assertNotIn(name, modules)
+
+    @mock.patch.object(kolla_ansible.version.version_info, "release_string",
+                       return_value="1.2.3")
+    def test_version(self, mock_release):
+        app = kolla_ansible.KollaAnsibleApp()
+        mock_release.assert_not_called()
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertRaises(SystemExit, app.run, ["--version"])
+        self.assertEqual("%s 1.2.3\n" % kolla_ansible.App.NAME,
+                         stdout.getvalue())
+
+
+class TestServiceScope(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.playbook = os.path.join(self.path, "site.yml")
+        with open(self.playbook, "w") as f:
+            f.write("- name: Apply role foo\n  hosts: foo\n  tags: foo\n"
+                    "- name: Apply role bar\n  hosts: bar\n  tags: bar\n")
+        app = mock.Mock()
+        app.options.verbose_level = 1
+        self.command = commands.Deploy(app, None)
+        self.parser = self.command.get_parser("deploy")
+
+    def _run(self, *argv):
+        parsed_args = self.parser.parse_args(list(argv))
+        runs = []
+
+        def run_playbooks(parsed_args, playbooks, **kwargs):
+            runs.append((parsed_args.tags,
+                         [[play["name"] for play in
+                           utils.read_yaml_file(playbook)]
+                          for playbook in playbooks]))
+
+        with mock.patch.object(ansible, "run_playbooks",
+                               side_effect=run_playbooks):
+            self.command.run_playbooks(parsed_args, [self.playbook],
+                                       extra_vars={})
+        return runs
+
+    def test_not_scoped(self):
+        self.assertEqual(
+            [(None, [["Apply role foo", "Apply role bar"]])], self._run())
+
+    def test_scoped(self):
+        self.assertEqual([("bar", [["Apply role bar"]])],
+                         self._run("--service", "bar"))
+
+    def test_scoped_with_tags(self):
+        self.assertEqual([("config", [["Apply role foo"]])],
+                         self._run("--service", "foo", "--tags", "config"))
+
+    def test_unknown_service(self):
+        self.assertRaises(SystemExit, self._run, "--service", "baz")
+
+
+class TestFactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    @mock.patch.object(ansible, "_get_config_value",
+                       return_value=("memory", "default"))
+    def test_enable_fact_cache(self, mock_config):
+        env = {}
+        path = os.path.join(self.path, "facts")
+        ansible._enable_fact_cache(env, path, 3600)
+        self.assertEqual(
+            {"ANSIBLE_CACHE_PLUGIN": "jsonfile",
+             "ANSIBLE_CACHE_PLUGIN_CONNECTION": path,
+             "ANSIBLE_CACHE_PLUGIN_TIMEOUT": "3600"}, env)
+        self.assertEqual(0o700, os.stat(path).st_mode & 0o777)
+
+    def test_configured_cache_plugin_kept(self):
+        env = {"ANSIBLE_CACHE_PLUGIN": "redis"}
+        ansible._enable_fact_cache(env, os.path.join(self.path, "facts"), 0)
+        self.assertEqual({"ANSIBLE_CACHE_PLUGIN": "redis"}, env)
+
+    def test_configured_cache_plugin_in_config_file_kept(self):
+        config = os.path.join(self.path, "ansible.cfg")
+        with open(config, "w") as f:
+            f.write("[defaults]\nfact_caching = redis\n")
+        env = {}
+        with mock.patch.object(performance, "find_base_config",
+                               return_value=config):
+            ansible._enable_fact_cache(env, os.path.join(self.path, "facts"),
+                                       0)
+        self.assertEqual({}, env)
+
+    def _gather_facts(self, *argv):
+        app = mock.Mock()
+        app.options.verbose_level = 1
+        command = commands.GatherFacts(app, None)
+        parsed_args = command.get_parser("gather-facts").parse_args(
+            ["--configdir", self.path] + list(argv))
+        with mock.patch.object(ansible, "run_playbooks") as mock_run:
+            command.take_action(parsed_args)
+        (parsed_args, playbooks), kwargs = mock_run.call_args
+        return parsed_args, kwargs["extra_vars"]
+
+    def test_gather_facts(self):
+        parsed_args, extra_vars = self._gather_facts()
+        self.assertFalse(parsed_args.fact_cache)
+        self.assertEqual({}, extra_vars)
+
+    def test_gather_facts_refresh(self):
+        parsed_args, extra_vars = self._gather_facts("--refresh")
+        self.assertTrue(parsed_args.fact_cache)
+        self.assertEqual(86400, parsed_args.fact_cache_timeout)
+        self.assertEqual({"kolla_ansible_refresh_facts": "true"}, extra_vars)
+        self.assertEqual(os.path.join(self.path, "facts"),
+                         ansible.get_fact_cache_path(parsed_args))
+
+
+class TestFanOut(unittest.TestCase):
+
+    HOSTS = {"all": ["a1", "a2", "b1", "b2", "b3"],
+             "a": ["a1", "a2"], "b": ["b1", "b2", "b3"], "ab": ["a1", "b1"]}
+
+    def _run(self, *argv):
+        app = mock.Mock()
+        app.options.verbose_level = 1
+        command = commands.PruneImages(app, None)
+        parsed_args = command.get_parser("prune-images").parse_args(
+            ["--yes-i-really-really-mean-it"] + list(argv))
+
+        def list_hosts(parsed_args, inventories, pattern, limit=None):
+            return [host for host in self.HOSTS[pattern]
+                    if not limit or host.startswith(limit)]
+
+        with mock.patch.object(fanout, "list_hosts",
+                               side_effect=list_hosts), \
+                mock.patch.object(ansible, "run_playbooks") as mock_run, \
+                mock.patch.object(ansible,
+                                  "run_playbooks_sharded") as mock_sharded:
+            command.run_playbooks(parsed_args, ["prune-images.yml"])
+        return mock_run, mock_sharded
+
+    def test_not_sharded(self):
+        mock_run, mock_sharded = self._run()
+        self.assertEqual(1, mock_run.call_count)
+        mock_sharded.assert_not_called()
+
+    def test_shards(self):
+        mock_run, mock_sharded = self._run("--shards", "2", "--limit", "b")
+        mock_run.assert_not_called()
+        args, kwargs = mock_sharded.call_args
+        self.assertEqual(["prune-images.yml"], args[1])
+        self.assertEqual({"shard-1": ["b1", "b2"], "shard-2": ["b3"]},
+                         args[2])
+        self.assertEqual(4, args[3])
+        self.assertEqual({"verbose_level": 0}, kwargs)
+
+    def test_shard_groups(self):
+        mock_run, mock_sharded = self._run("--shard-groups", "a,b",
+                                           "--max-parallel", "8")
+        args, kwargs = mock_sharded.call_args
+        self.assertEqual({"a": ["a1", "a2"], "b": ["b1", "b2", "b3"]},
+                         args[2])
+        self.assertEqual(8, args[3])
+
+    def test_rabbitmq_reset_state_not_sharded(self):
+        # Nodes of a RabbitMQ cluster are reset together.
+        command = commands.RabbitMQResetState(mock.Mock(), None)
+        parser = command.get_parser("rabbitmq-reset-state")
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parser.parse_args,
+                              ["--shards", "2"])
+
+    def test_shard_groups_overlap(self):
+        self.assertRaises(SystemExit, self._run, "--shard-groups", "a,ab")
+
+    def test_no_hosts(self):
+        self.assertRaises(SystemExit, self._run, "--shards", "2",
+                          "--limit", "c")
+
+    def test_invalid_shards(self):
+        self.assertRaises(SystemExit, self._run, "--shards", "-1")
+
+
+class TestProfile(unittest.TestCase):
+
+    @mock.patch.object(ansible, "_get_config_value",
+                       return_value=([], "default"))
+    @mock.patch.object(utils, "get_data_files_path",
+                       return_value="/ka/ansible/callback_plugins")
+    def test_enable_profile(self, mock_path, mock_config):
+        env = {}
+        ansible._enable_profile(env, "/tmp/profile")
+        self.assertEqual(
+            {"ANSIBLE_CALLBACK_PLUGINS": "/ka/ansible/callback_plugins",
+             "ANSIBLE_CALLBACKS_ENABLED": "kolla_profile",
+             "KOLLA_ANSIBLE_PROFILE_DIR": "/tmp/profile"}, env)
+
+    @mock.patch.object(utils, "get_data_files_path",
+                       return_value="/ka/ansible/callback_plugins")
+    def test_enable_profile_keeps_configured_callbacks(self, mock_path):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        config = os.path.join(path, "ansible.cfg")
+        with open(config, "w") as f:
+            f.write("[defaults]\n"
+                    "callback_plugins = /plugins\n"
+                    "callbacks_enabled = ara_default\n")
+        env = {}
+        with mock.patch.object(performance, "find_base_config",
+                               return_value=config):
+            ansible._enable_profile(env, "/tmp/profile")
+        self.assertEqual("/plugins:/ka/ansible/callback_plugins",
+                         env["ANSIBLE_CALLBACK_PLUGINS"])
+        self.assertEqual("ara_default,kolla_profile",
+                         env["ANSIBLE_CALLBACKS_ENABLED"])
+
+    @mock.patch.object(utils, "get_data_files_path",
+                       return_value="/ka/ansible/callback_plugins")
+    def test_enable_profile_keeps_callbacks(self, mock_path):
+        env = {"ANSIBLE_CALLBACK_PLUGINS": "/plugins",
+               "ANSIBLE_CALLBACKS_ENABLED": "ara_default"}
+        ansible._enable_profile(env, "/tmp/profile")
+        self.assertEqual("/plugins:/ka/ansible/callback_plugins",
+                         env["ANSIBLE_CALLBACK_PLUGINS"])
+        self.assertEqual("ara_default,kolla_profile",
+                         env["ANSIBLE_CALLBACKS_ENABLED"])
+
+
+class TestPerformanceProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    @mock.patch.object(performance, "_get_mitogen_strategy_path",
+                       return_value=None)
+    @mock.patch.object(performance, "find_base_config", return_value=None)
+    @mock.patch.object(fanout, "list_hosts",
+                       return_value=["host%d" % i for i in range(40)])
+    def _get_environment(self, command, mock_hosts, mock_base,
+                         mock_mitogen):
+        command = command(mock.Mock(), None)
+        parsed_args = command.get_parser("test").parse_args(
+            ["--configdir", self.path, "--performance-profile", "default",
+             "--limit", "host1*"])
+        env = ansible._get_environment(parsed_args, {})
+        self.assertEqual("host1*", mock_hosts.call_args[0][3])
+        return env
+
+    def test_performance_profile(self):
+        env = self._get_environment(commands.Deploy)
+        path = os.path.join(self.path, "ansible-default.cfg")
+        self.assertEqual(path, env["ANSIBLE_CONFIG"])
+        with open(path) as f:
+            config = f.read()
+        self.assertIn("pipelining = True", config)
+        self.assertNotIn("strategy", config)
+
+    def test_performance_profile_free_strategy(self):
+        env = self._get_environment(commands.GatherFacts)
+        with open(env["ANSIBLE_CONFIG"]) as f:
+            self.assertIn("strategy = free", f.read())
+
+
+class TestWaves(unittest.TestCase):
+
+    HOSTS = {"all": ["c1", "c2", "n1", "n2", "n3", "s1"],
+             "control": ["c1", "c2"], "compute": ["n1", "n2", "n3", "s1"],
+             "storage": ["s1"]}
+
+    def _run(self, *argv):
+        app = mock.Mock()
+        app.options.verbose_level = 1
+        command = commands.Deploy(app, None)
+        parsed_args = command.get_parser("deploy").parse_args(list(argv))
+
+        def list_hosts(parsed_args, inventories, pattern, limit=None):
+            return list(self.HOSTS[pattern])
+
+        with mock.patch.object(fanout, "list_hosts",
+                               side_effect=list_hosts), \
+                mock.patch.object(ansible, "run_playbooks") as mock_run, \
+                mock.patch.object(ansible,
+                                  "run_playbooks_in_waves") as mock_waves:
+            command.run_playbooks(parsed_args, ["site.yml"])
+        return mock_run, mock_waves
+
+    def test_no_waves(self):
+        mock_run, mock_waves = self._run()
+        self.assertEqual(1, mock_run.call_count)
+        mock_waves.assert_not_called()
+
+    def test_waves(self):
+        mock_run, mock_waves = self._run(
+            "--waves", "storage=1", "--waves", "compute=1,50%",
+            "--wave-max-fail-ratio", "0.1")
+        mock_run.assert_not_called()
+        args, kwargs = mock_waves.call_args
+        self.assertEqual(
+            [("(other hosts)", (["c1", "c2"], ["rest"])),
+             ("storage", (["s1"], ["1"])),
+             ("compute", (["n1", "n2", "n3"], ["1", "50%"]))],
+            list(args[2].items()))
+        self.assertEqual(0.1, args[3])
+
+    def test_waves_invalid(self):
+        self.assertRaises(SystemExit, self._run, "--waves", "compute=0")
+        self.assertRaises(SystemExit, self._run, "--waves", "1",
+                          "--wave-max-fail-ratio", "2")
+
+
+@mock.patch.object(ansible, "_validate_args")
+@mock.patch.object(ansible, "_get_environment", return_value={})
+@mock.patch.object(utils, "get_data_files_path", return_value="health.yml")
+class TestRunPlaybooksInWaves(unittest.TestCase):
+
+    HOSTS = ["host%d" % i for i in range(1, 11)]
+
+    def _run(self, failed, max_fail_ratio=0.0):
+        calls = []
+
+        def run_wave(parsed_args, playbooks, hosts, *args):
+            calls.append((playbooks, hosts))
+            return [host for host in hosts if host in failed and
+                    playbooks == ["health.yml"]]
+
+        with mock.patch.object(ansible, "_run_wave", side_effect=run_wave):
+            try:
+                ansible.run_playbooks_in_waves(
+                    mock.Mock(), ["site.yml"],
+                    {"compute": (self.HOSTS, ["1", "2", "rest"])},
+                    max_fail_ratio)
+            except SystemExit as e:
+                return calls, e.code
+        return calls, 0
+
+    def test_waves(self, *mocks):
+        calls, code = self._run(failed=[])
+        self.assertEqual(0, code)
+        self.assertEqual(
+            [(["site.yml"], ["host1"]), (["health.yml"], ["host1"]),
+             (["site.yml"], ["host2", "host3"]),
+             (["health.yml"], ["host2", "host3"]),
+             (["site.yml"], self.HOSTS[3:]),
+             (["health.yml"], self.HOSTS[3:])],
+            calls)
+
+    def test_waves_abort(self, *mocks):
+        calls, code = self._run(failed=["host2"])
+        self.assertEqual(2, code)
+        self.assertEqual(4, len(calls))
+
+    def test_waves_max_fail_ratio(self, *mocks):
+        calls, code = self._run(failed=["host2"], max_fail_ratio=0.4)
+        # The run continues with waves of the same size, but fails.
+        self.assertEqual(2, code)
+        self.assertEqual(
+            [["host1"], ["host2", "host3"], ["host4", "host5"],
+             self.HOSTS[5:]],
+            [hosts for playbooks, hosts in calls
+             if playbooks == ["site.yml"]])
+
+
+class TestDrift(unittest.TestCase):
+
+    RESULT = {"host": "compute1", "project": "nova-cell",
+              "services": [{"service": "nova-libvirt",
+                            "container": "nova_libvirt",
+                            "reasons": ["unit_inactive"],
+                            "recreate_reasons": [], "diff": "",
+                            "error": ""}]}
+
+    def _run(self, *argv, returncode=0):
+        app = mock.Mock()
+        app.options.verbose_level = 1
+        app.stdout = io.StringIO()
+        command = commands.Drift(app, None)
+        parsed_args = command.get_parser("drift").parse_args(list(argv))
+
+        def run_playbooks(parsed_args, playbooks, extra_vars, **kwargs):
+            self.extra_vars = extra_vars
+            path = os.path.join(extra_vars["kolla_drift_report_dir"],
+                                "compute1.nova-cell.json")
+            with open(path, "w") as f:
+                f.write(json.dumps(self.RESULT))
+            if returncode:
+                sys.exit(returncode)
+
+        with mock.patch.object(ansible, "run_playbooks",
+                               side_effect=run_playbooks):
+            command.take_action(parsed_args)
+        return app.stdout.getvalue()
+
+    def test_drift(self):
+        output = self._run()
+        self.assertEqual("drift", self.extra_vars["kolla_action"])
+        self.assertFalse(
+            os.path.exists(self.extra_vars["kolla_drift_report_dir"]))
+        self.assertIn("nova-libvirt on 1 hosts: compute1\n"
+                      "  - systemd unit is not running\n", output)
+
+    def test_drift_report(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        report = os.path.join(path, "drift.json")
+        self._run("--report", report)
+        with open(report) as f:
+            self.assertEqual(["compute1"], json.load(f)["hosts"])
+
+    def test_drift_failed(self):
+        # The report is written before exiting with the code of Ansible.
+        with self.assertRaises(SystemExit) as cm:
+            self._run(returncode=4)
+        self.assertEqual(4, cm.exception.code)
+
+
+class TestGetBasePath(unittest.TestCase):
+
+    def setUp(self):
+        utils._find_base_path.cache_clear()
+        self.addCleanup(utils._find_base_path.cache_clear)
+
+    @mock.patch.dict(os.environ, {"KOLLA_ANSIBLE_DATA_FILES_PATH": ""})
+    @mock.patch.object(utils.Distribution, "discover", return_value=[])
+    def test_discovery_cached(self, mock_discover):
+        path = utils.get_data_files_path("ansible")
+        self.assertEqual(path, utils.get_data_files_path("ansible"))
+        self.assertEqual(1, mock_discover.call_count)
+
+    @mock.patch.object(utils.Distribution, "discover", return_value=[])
+    def test_override(self, mock_discover):
+        with mock.patch.dict(os.environ,
+                             {"KOLLA_ANSIBLE_DATA_FILES_PATH": "/opt/a"}):
+            self.assertEqual("/opt/a/ansible",
+                             utils.get_data_files_path("ansible"))
+        with mock.patch.dict(os.environ,
+                             {"KOLLA_ANSIBLE_DATA_FILES_PATH": "/opt/b"}):
+            self.assertEqual("/opt/b/ansible",
+                             utils.get_data_files_path("ansible"))
+        mock_discover.assert_not_called()
@@ -22,6 +22,7 @@ from kolla_ansible.database_shards import database_shards_info
 from kolla_ansible.exception import FilterError
 
 from kolla_ansible.tests.unit.helpers import _to_bool
+from kolla_ansible.tests.unit.helpers import FakeHostVars
 
 
 class TestKollaDatabaseShardsInfoFilter(unittest.TestCase):
@@ -257,3 +258,29 @@ class TestKollaDatabaseShardsInfoFilter(unittest.TestCase):
             ]
         }
         self.assertEqual(result, database_shards_info(context, hostnames))
+
+    def test_shards_info_cached(self):
+        hostnames = ['primary', 'secondary']
+        host = {
+            'mariadb_shard_id': 0,
+            'enable_mariabackup': 'no',
+            'database_password': 'SECRET',
+            'mariadb_shard_root_user_prefix': 'root_shard_',
+        }
+        hostvars = FakeHostVars({'primary': host, 'secondary': host})
+        context = self._make_context({
+            'inventory_hostname': 'primary',
+            'hostvars': hostvars,
+        })
+        result = {
+            'shards': {'0': {'hosts': ['primary', 'secondary']}},
+            'users': [{'password': 'SECRET', 'shard_id': '0',
+                       'user': 'root_shard_0'}],
+        }
+        first = database_shards_info(context, hostnames)
+        self.assertEqual(result, first)
+        first['shards']['0']['hosts'].append('tertiary')
+        self.assertEqual(result, database_shards_info(context, hostnames))
+        self.assertEqual(2, hostvars.lookups)
+        database_shards_info(context, ['primary'])
+        self.assertEqual(3, hostvars.lookups)
@@ -0,0 +1,111 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from kolla_ansible import drift
+
+
+def _service(name, reasons, recreate_reasons=(), diff="", config_diff="",
+             error=""):
+    return {"service": name, "container": name.replace("-", "_"),
+            "reasons": list(reasons),
+            "recreate_reasons": list(recreate_reasons), "diff": diff,
+            "config_diff": config_diff, "error": error}
+
+
+IMAGE_DIFF = "--- current\n+++ desired\n-  \"image\": \"a\"\n+  \"image\": \"b\""
+CONFIG_DIFF = ("INFO:__main__:/etc/keystone/keystone.conf does not match "
+               "/var/lib/kolla/config_files/keystone.conf")
+
+RESULTS = [
+    {"host": "compute2", "project": "nova-cell",
+     "services": [_service("nova-compute", ["container_differs"],
+                           ["image"], IMAGE_DIFF)]},
+    {"host": "compute1", "project": "nova-cell",
+     "services": [_service("nova-compute", ["container_differs"],
+                           ["image"], IMAGE_DIFF),
+                  _service("nova-libvirt", ["unit_inactive"])]},
+    {"host": "control1", "project": "keystone",
+     "services": [_service("keystone", ["config_changed"],
+                           config_diff=CONFIG_DIFF)]},
+]
+
+
+class TestDrift(unittest.TestCase):
+
+    def test_load_results(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for result in RESULTS:
+            name = "%s.%s.json" % (result["host"], result["project"])
+            with open(os.path.join(path, name), "w") as f:
+                json.dump(result, f)
+        self.assertEqual(
+            [("compute1", "nova-cell"), ("compute2", "nova-cell"),
+             ("control1", "keystone")],
+            [(r["host"], r["project"]) for r in drift.load_results(path)])
+
+    def test_aggregate(self):
+        report = drift.aggregate(RESULTS)
+        self.assertEqual(["compute1", "compute2", "control1"],
+                         report["hosts"])
+        # The same drift on several hosts is reported once.
+        self.assertEqual(
+            [("keystone", ["control1"]),
+             ("nova-compute", ["compute1", "compute2"]),
+             ("nova-libvirt", ["compute1"])],
+            [(d["service"], d["hosts"]) for d in report["drift"]])
+        self.assertEqual(["image"], report["drift"][1]["recreate_reasons"])
+
+    def test_aggregate_different_config_diff(self):
+        results = [
+            {"host": "control1", "project": "keystone",
+             "services": [_service("keystone", ["config_changed"],
+                                   config_diff="a")]},
+            {"host": "control2", "project": "keystone",
+             "services": [_service("keystone", ["config_changed"],
+                                   config_diff="b")]},
+        ]
+        report = drift.aggregate(results)
+        self.assertEqual(2, len(report["drift"]))
+
+    def test_aggregate_different_drift(self):
+        results = [
+            {"host": "control1", "project": "keystone",
+             "services": [_service("keystone", ["config_changed"])]},
+            {"host": "control2", "project": "keystone",
+             "services": [_service("keystone", ["container_missing"])]},
+        ]
+        report = drift.aggregate(results)
+        self.assertEqual(2, len(report["drift"]))
+
+    def test_describe(self):
+        lines = drift.describe(drift.aggregate(RESULTS))
+        self.assertEqual("Drift found for 3 services on 3 hosts", lines[0])
+        index = lines.index("nova-compute on 2 hosts: compute1, compute2")
+        self.assertEqual(
+            "  - container differs from its specification, recreate needed "
+            "for image", lines[index + 1])
+        self.assertIn("    +  \"image\": \"b\"", lines)
+        index = lines.index("keystone on 1 hosts: control1")
+        self.assertEqual(
+            ["  - configuration changed since the container started",
+             "    " + CONFIG_DIFF], lines[index + 1:index + 3])
+
+    def test_describe_no_drift(self):
+        self.assertEqual(["No drift found"],
+                         drift.describe(drift.aggregate([])))
@@ -0,0 +1,96 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+from kolla_ansible import fanout
+
+HOSTS = ["host%d" % i for i in range(1, 8)]
+
+
+def _python(code):
+    return ([sys.executable, "-c", code], dict(os.environ))
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_partition(self):
+        self.assertEqual(
+            {"shard-1": ["host1", "host2", "host3"],
+             "shard-2": ["host4", "host5"],
+             "shard-3": ["host6", "host7"]},
+            fanout.partition(HOSTS, 3))
+
+    def test_partition_more_shards_than_hosts(self):
+        self.assertEqual(
+            {"shard-1": ["host1"], "shard-2": ["host2"]},
+            fanout.partition(HOSTS[:2], 4))
+
+    def test_partition_no_hosts(self):
+        self.assertEqual({}, fanout.partition([], 2))
+
+    def test_partition_groups(self):
+        self.assertEqual(
+            ["rabbitmq", "outward_rabbitmq"],
+            list(fanout.partition_groups({
+                "rabbitmq": HOSTS[:3], "empty": [],
+                "outward_rabbitmq": HOSTS[3:]})))
+
+    def test_partition_groups_overlap(self):
+        self.assertRaisesRegex(
+            ValueError, "host3 is in groups rabbitmq and outward_rabbitmq",
+            fanout.partition_groups,
+            {"rabbitmq": HOSTS[:3], "outward_rabbitmq": HOSTS[2:]})
+
+
+class TestRunParallel(unittest.TestCase):
+
+    def _run(self, commands, max_parallel=2, quiet=False):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            results = fanout.run_parallel(commands, max_parallel, quiet=quiet)
+        return results, stdout.getvalue().splitlines()
+
+    def test_run_parallel(self):
+        results, lines = self._run({
+            "a": _python("print('one'); print('two')"),
+            "b": _python("import sys; print('three'); sys.exit(3)"),
+            "c": _python("import sys; sys.stderr.write('four\\n')"),
+        })
+        self.assertEqual({"a": 0, "b": 3, "c": 0}, results)
+        self.assertEqual(["a", "b", "c"], list(results))
+        self.assertEqual(
+            ["[a] one", "[a] two", "[b] three", "[c] four"], sorted(lines))
+        # Lines of each command are kept in order.
+        self.assertLess(lines.index("[a] one"), lines.index("[a] two"))
+
+    def test_run_parallel_limit(self):
+        # With one command at a time, the second starts after the first
+        # has finished.
+        results, lines = self._run({
+            "a": _python("import time; time.sleep(0.2); print('first')"),
+            "b": _python("print('second')"),
+        }, max_parallel=1)
+        self.assertEqual({"a": 0, "b": 0}, results)
+        self.assertEqual(["[a] first", "[b] second"], lines)
+
+    def test_run_parallel_quiet(self):
+        results, lines = self._run({
+            "a": _python("print('one')"),
+            "b": _python("import sys; sys.exit(1)"),
+        }, quiet=True)
+        self.assertEqual({"a": 0, "b": 1}, results)
+        self.assertEqual([], lines)
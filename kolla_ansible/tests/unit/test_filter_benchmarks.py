@@ -0,0 +1,263 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Micro-benchmarks of the service and address filters.
+
+The inputs are synthetic: a role with 100 services on a 500 host inventory.
+Each benchmark renders what a play would for every host, with a new Jinja2
+context for each template, as Ansible does.
+
+Run the module to print timings:
+
+    python -m kolla_ansible.tests.unit.test_filter_benchmarks --number 5
+
+As unit tests, each benchmark runs once to check its results.
+"""
+
+import argparse
+import json
+import sys
+import timeit
+import unittest
+
+import jinja2
+
+from kolla_ansible import filters
+from kolla_ansible.kolla_cluster_addresses import kolla_cluster_addresses
+from kolla_ansible import kolla_url
+from kolla_ansible import put_address_in_context
+
+from kolla_ansible.tests.unit.helpers import _to_bool
+from kolla_ansible.tests.unit.helpers import FakeHostVars
+
+SERVICES = 100
+HOSTS = 500
+GROUPS = 20
+# Number of tasks of a role selecting its services, e.g. config,
+# check-containers, pull and stop.
+SELECT_TASKS = 10
+# Endpoint URLs rendered for each host.
+ENDPOINTS = 50
+
+
+class Inputs(object):
+    """Synthetic services and inventory."""
+
+    def __init__(self, services=SERVICES, hosts=HOSTS, groups=GROUPS):
+        # Bandit complains about Jinja2 autoescaping without nosec.
+        self.env = jinja2.Environment()  # nosec
+        self.env.filters['bool'] = _to_bool
+        self.hosts = ['host%d' % i for i in range(hosts)]
+        self.group_names = dict(
+            (host, ['group%d' % (i % groups), 'group%d' % ((i + 1) % groups),
+                    'baremetal'])
+            for i, host in enumerate(self.hosts))
+        self.services = {}
+        for i in range(services):
+            service = {
+                'container_name': 'service%d' % i,
+                'enabled': 'yes' if i % 5 else 'no',
+                'haproxy': {
+                    'service%d' % i: {'enabled': 'yes', 'port': 8000 + i},
+                    'service%d_external' % i: {'enabled': 'yes',
+                                               'port': 8000 + i},
+                },
+            }
+            if i % 10:
+                service['group'] = 'group%d' % (i % groups)
+            else:
+                service['host_in_groups'] = 'yes' if i % 20 else 'no'
+            self.services['service%d' % i] = service
+        self.hostvars_data = dict(
+            (host, {
+                'api_interface': 'eth0',
+                'api_address_family': 'ipv4',
+                'ansible_facts': {'eth0': {'ipv4': {
+                    'address': '10.0.%d.%d' % (i // 250, i % 250 + 1)}}},
+            })
+            for i, host in enumerate(self.hosts))
+
+        # One in two hosts has an IPv6 address.
+        self.addresses = [
+            'fd00::%x:%x' % (i // 250, i % 250 + 1) if i % 2 else
+            '10.0.%d.%d' % (i // 250, i % 250 + 1)
+            for i in range(hosts)]
+
+    def play_hostvars(self):
+        """Return the hostvars of a new play."""
+        return FakeHostVars(self.hostvars_data)
+
+    def context(self, hostvars, host):
+        """Return the context of a template rendered for a host."""
+        return self.env.context_class(
+            self.env, name='dummy', blocks={}, parent={
+                'hostvars': hostvars,
+                'inventory_hostname': host,
+                'group_names': self.group_names[host],
+                'role_name': 'benchmark',
+            })
+
+
+def bench_service_mapped_to_host(inputs):
+    hostvars = inputs.play_hostvars()
+    mapped = 0
+    for host in inputs.hosts:
+        context = inputs.context(hostvars, host)
+        for service in inputs.services.values():
+            mapped += filters.service_mapped_to_host(context, service)
+    return mapped
+
+
+def bench_select_services(inputs):
+    hostvars = inputs.play_hostvars()
+    selected = 0
+    for host in inputs.hosts:
+        for _ in range(SELECT_TASKS):
+            context = inputs.context(hostvars, host)
+            selected += len(filters.select_services_enabled_and_mapped_to_host(
+                context, inputs.services))
+    return selected // SELECT_TASKS
+
+
+def bench_extract_haproxy_services(inputs):
+    hostvars = inputs.play_hostvars()
+    for host in inputs.hosts:
+        context = inputs.context(hostvars, host)
+        haproxy = filters.extract_haproxy_services(context, inputs.services)
+    return len(haproxy)
+
+
+def bench_cluster_addresses(inputs):
+    hostvars = inputs.play_hostvars()
+    for host in inputs.hosts:
+        context = inputs.context(hostvars, host)
+        addresses = kolla_cluster_addresses(context, inputs.hosts, 'api',
+                                            'memcache', 11211)
+    return len(addresses)
+
+
+def _format_addresses(inputs, format_address, url):
+    formatted = 0
+    for host in inputs.hosts:
+        for context in ('memcache', 'rabbitmq'):
+            formatted += len([format_address(address, context)
+                              for address in inputs.addresses])
+        for i in range(ENDPOINTS):
+            url(inputs.addresses[i], 'https', 8000 + i, '/v3', 'url')
+            formatted += 1
+    return formatted
+
+
+def bench_address_formatting_uncached(inputs):
+    return _format_addresses(
+        inputs, put_address_in_context._format_address,
+        kolla_url._kolla_url)
+
+
+def bench_address_formatting(inputs):
+    return _format_addresses(
+        inputs, put_address_in_context.put_address_in_context,
+        kolla_url.kolla_url)
+
+
+def bench_address_formatting_bulk(inputs):
+    formatted = 0
+    for host in inputs.hosts:
+        for context in ('memcache', 'rabbitmq'):
+            formatted += len(put_address_in_context.put_addresses_in_context(
+                inputs.addresses, context))
+        for i in range(ENDPOINTS):
+            kolla_url.kolla_url(inputs.addresses[i], 'https', 8000 + i,
+                                '/v3')
+            formatted += 1
+    return formatted
+
+
+BENCHMARKS = [
+    ('service_mapped_to_host', bench_service_mapped_to_host),
+    ('select_services_enabled_and_mapped_to_host', bench_select_services),
+    ('extract_haproxy_services', bench_extract_haproxy_services),
+    ('kolla_cluster_addresses', bench_cluster_addresses),
+    ('address formatting (uncached)', bench_address_formatting_uncached),
+    ('address formatting', bench_address_formatting),
+    ('address formatting (bulk)', bench_address_formatting_bulk),
+]
+
+
+class TestFilterBenchmarks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inputs = Inputs()
+
+    def test_service_mapped_to_host(self):
+        expected = sum(
+            1 for host in self.inputs.hosts
+            for service in self.inputs.services.values()
+            if service.get('host_in_groups') == 'yes' or
+            service.get('group') in self.inputs.group_names[host])
+        self.assertEqual(expected, bench_service_mapped_to_host(self.inputs))
+
+    def test_select_services(self):
+        expected = sum(
+            1 for host in self.inputs.hosts
+            for service in self.inputs.services.values()
+            if service['enabled'] == 'yes' and (
+                service.get('host_in_groups') == 'yes' or
+                service.get('group') in self.inputs.group_names[host]))
+        self.assertEqual(expected, bench_select_services(self.inputs))
+
+    def test_extract_haproxy_services(self):
+        # Two haproxy services for each enabled service.
+        self.assertEqual(2 * SERVICES * 4 // 5,
+                         bench_extract_haproxy_services(self.inputs))
+
+    def test_cluster_addresses(self):
+        self.assertEqual(HOSTS, bench_cluster_addresses(self.inputs))
+
+    def test_address_formatting(self):
+        expected = HOSTS * (2 * HOSTS + ENDPOINTS)
+        self.assertEqual(expected, bench_address_formatting(self.inputs))
+        self.assertEqual(expected, bench_address_formatting_bulk(self.inputs))
+        # The uncached benchmark is slow, check it on a smaller inventory.
+        inputs = Inputs(hosts=ENDPOINTS)
+        self.assertEqual(ENDPOINTS * 3 * ENDPOINTS,
+                         bench_address_formatting_uncached(inputs))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks of the service and address filters.")
+    parser.add_argument('--number', type=int, default=3,
+                        help="number of runs of each benchmark")
+    parser.add_argument('--json', action='store_true',
+                        help="print results as JSON")
+    args = parser.parse_args()
+
+    inputs = Inputs()
+    results = {}
+    for name, bench in BENCHMARKS:
+        results[name] = timeit.timeit(lambda: bench(inputs),
+                                      number=args.number) / args.number
+    if args.json:
+        json.dump({'services': SERVICES, 'hosts': HOSTS,
+                   'seconds': results}, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        print('%d services, %d hosts, mean of %d runs:' %
+              (SERVICES, HOSTS, args.number))
+        for name, seconds in results.items():
+            print('  %-44s %8.2f ms' % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import shutil
+import tempfile
 import unittest
 
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+
+from kolla_ansible import fluentd_filters
 from kolla_ansible.fluentd_filters import customise_fluentd
 
+TEMPLATES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                              "ansible", "roles", "common", "templates")
+
 
 class TestFilters(unittest.TestCase):
 
@@ -94,3 +104,57 @@ class TestFilters(unittest.TestCase):
         ]
         result = customise_fluentd(default_files, customised_files)
         self.assertEqual(expected, result)
+
+    def test_compile_fluentd_config(self):
+        default_files = {
+            "input": ["conf/input/00-global.conf.j2",
+                      "conf/input/01-syslog.conf.j2"],
+            "output": ["conf/output/00-local.conf.j2"],
+        }
+        customised_files = [
+            "/etc/kolla/config/fluentd/input/01-syslog.conf",
+            "/etc/kolla/config/fluentd/input/02-foo.conf",
+            "/etc/kolla/config/fluentd/filter/00-bar.conf",
+            "/etc/kolla/config/fluentd/unknown/00-baz.conf",
+        ]
+        expected = [
+            {"name": "input", "title": "Inputs",
+             "paths": ["conf/input/00-global.conf.j2",
+                       "/etc/kolla/config/fluentd/input/01-syslog.conf",
+                       "/etc/kolla/config/fluentd/input/02-foo.conf"]},
+            {"name": "filter", "title": "Filters",
+             "paths": ["/etc/kolla/config/fluentd/filter/00-bar.conf"]},
+            {"name": "format", "title": "Formats", "paths": []},
+            {"name": "output", "title": "Outputs",
+             "paths": ["conf/output/00-local.conf.j2"]},
+        ]
+        result = fluentd_filters.compile_fluentd_config(default_files,
+                                                        customised_files)
+        self.assertEqual(expected, result)
+
+    def test_fluentd_conf_customised_template(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        custom = os.path.join(path, "filter", "00-custom.conf")
+        os.mkdir(os.path.dirname(custom))
+        with open(custom, "w") as f:
+            f.write("<filter>\n"
+                    "{% if value %}\n"
+                    "  value {{ value }}\n"
+                    "{% endif %}\n"
+                    "</filter>\n")
+        loader = DataLoader()
+        loader.set_basedir(TEMPLATES_PATH)
+        templar = Templar(loader=loader, variables={
+            "value": 1,
+            "fluentd_config": fluentd_filters.compile_fluentd_config(
+                {}, [custom]),
+        })
+        with open(os.path.join(TEMPLATES_PATH, "fluentd.conf.j2")) as f:
+            config = templar.template(f.read())
+        # Customised templates are rendered as by the template lookup, with
+        # its trim_blocks setting.
+        fragment = templar.template("{{ lookup('template', '%s') }}" % custom)
+        self.assertEqual("<filter>\n  value 1\n</filter>\n", fragment)
+        self.assertEqual("\n\n# Inputs\n\n# Filters\n" + fragment +
+                         "\n\n# Formats\n\n# Outputs\n", config)
@@ -0,0 +1,255 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from kolla_ansible import incremental
+from kolla_ansible import playbooks
+
+PLAYBOOK = """
+- name: Group hosts
+  hosts: all
+  tags: always
+  tasks:
+    - group_by:
+        key: foo
+
+- name: Apply role foo
+  hosts:
+    - foo
+    - '&enable_foo_True'
+  roles:
+    - { role: foo,
+        tags: foo }
+
+- name: Apply role bar
+  hosts: bar
+  roles:
+    - { role: bar,
+        tags: bar }
+
+- name: Apply role loadbalancer
+  hosts: loadbalancer
+  tags: loadbalancer
+  roles:
+    - role: loadbalancer
+  tasks:
+    - include_role:
+        name: bar
+        tasks_from: loadbalancer
+      tags: bar
+"""
+
+INVENTORY = {
+    "_meta": {"hostvars": {
+        "host1": {},
+        "host2": {"bar_setting": "host2"},
+        "lb1": {},
+    }},
+    "all": {"children": ["ungrouped", "control", "loadbalancer"]},
+    "control": {"hosts": ["host1", "host2"]},
+    "foo": {"children": ["control"]},
+    "bar": {"hosts": ["host1", "host2"]},
+    "loadbalancer": {"hosts": ["lb1"]},
+}
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.roles_path = os.path.join(self.path, "roles")
+        self._write("roles/foo/templates/foo.conf.j2",
+                    "setting = {{ foo_setting }}\n")
+        self._write("roles/foo/tasks/main.yml",
+                    "- include_role:\n    name: common-config\n")
+        self._write("roles/common-config/tasks/main.yml",
+                    "- debug: msg={{ common_setting }}\n")
+        self._write("roles/bar/templates/bar.conf.j2",
+                    "{{ bar_setting }} {{ groups['bar'] }}\n")
+        self._write("roles/loadbalancer/templates/haproxy.cfg.j2",
+                    "{{ lb_setting }}\n")
+        self._write("site.yml", PLAYBOOK)
+        self._write("config/global.conf", "[DEFAULT]\n")
+        self._write("config/foo/foo.conf", "[DEFAULT]\n")
+        self._write("config/foo/host2/foo.conf", "[DEFAULT]\n")
+        self._write("globals.yml", "foo_setting: 1\nbar_setting: 2\n")
+        self._write("passwords.yml", "foo_password: secret\n")
+        self.defaults = {
+            "common_setting": "{{ derived_setting }}",
+            "derived_setting": "",
+            "lb_setting": "",
+        }
+
+    def _write(self, path, content):
+        path = os.path.join(self.path, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _plan(self, inventory=INVENTORY, extra_vars=(), group_defaults=None):
+        units = playbooks.get_play_units(
+            os.path.join(self.path, "site.yml"))
+        return incremental.GenConfigPlan(
+            self.roles_path, units, inventory, self.defaults,
+            [os.path.join(self.path, "globals.yml"),
+             os.path.join(self.path, "passwords.yml")],
+            os.path.join(self.path, "config"), list(extra_vars),
+            os.path.join(self.path, incremental.STATE_FILE),
+            group_defaults=group_defaults)
+
+    def test_get_play_units(self):
+        units = playbooks.get_play_units(
+            os.path.join(self.path, "site.yml"))
+        self.assertEqual(
+            [("foo", {"foo"}, ("foo", "&enable_foo_True")),
+             ("bar", {"bar"}, ("bar",)),
+             ("loadbalancer", {"loadbalancer"}, ("loadbalancer",)),
+             ("bar", {"bar", "loadbalancer"}, ("loadbalancer",))],
+            [(u.role, set(u.tags), u.hosts) for u in units])
+
+    def test_get_role_dependencies(self):
+        self.assertEqual(
+            {"foo", "common-config"},
+            playbooks.get_role_dependencies(self.roles_path, "foo"))
+
+    def test_first_run(self):
+        plan = self._plan()
+        self.assertEqual({"foo", "bar", "loadbalancer"}, plan.changed_roles)
+        self.assertEqual({"host1", "host2"}, set(plan.changes["foo"]["hosts"]))
+        self.assertEqual(["no previous run"], plan.changes["foo"]["reasons"])
+        self.assertEqual([], plan.skip_tags)
+
+    def test_unchanged(self):
+        self._plan().save()
+        plan = self._plan()
+        self.assertEqual(set(), plan.changed_roles)
+        self.assertEqual(["bar", "foo", "loadbalancer"], plan.skip_tags)
+        self.assertIn("foo: unchanged, skipping", plan.report())
+
+    def test_variable_changed(self):
+        self._plan().save()
+        self._write("globals.yml", "foo_setting: 3\nbar_setting: 2\n")
+        plan = self._plan()
+        self.assertEqual({"foo"}, plan.changed_roles)
+        self.assertEqual(["variables: foo_setting"],
+                         plan.changes["foo"]["reasons"])
+        self.assertEqual(["bar", "loadbalancer"], plan.skip_tags)
+
+    def test_indirect_variable_changed(self):
+        self._plan().save()
+        self.defaults["derived_setting"] = "changed"
+        plan = self._plan()
+        self.assertEqual({"foo"}, plan.changed_roles)
+        self.assertEqual(["variables: derived_setting"],
+                         plan.changes["foo"]["reasons"])
+
+    def test_unrelated_password_changed(self):
+        self._plan().save()
+        self._write("passwords.yml", "foo_password: changed\n")
+        self.assertEqual(set(), self._plan().changed_roles)
+
+    def test_role_dependency_changed(self):
+        self._plan().save()
+        self._write("roles/common-config/tasks/main.yml",
+                    "- debug: msg={{ common_setting }}\n- debug:\n")
+        plan = self._plan()
+        self.assertEqual({"foo"}, plan.changed_roles)
+        self.assertEqual(
+            ["role files: common-config/tasks/main.yml"],
+            plan.changes["foo"]["reasons"])
+
+    def test_host_override_changed(self):
+        self._plan().save()
+        self._write("config/foo/host2/foo.conf", "[DEFAULT]\ndebug=1\n")
+        plan = self._plan()
+        self.assertEqual({"foo"}, plan.changed_roles)
+        self.assertEqual(["host2"], plan.changes["foo"]["hosts"])
+        self.assertEqual(["host config overrides: foo/host2/foo.conf"],
+                         plan.changes["foo"]["reasons"])
+
+    def test_global_override_changed(self):
+        self._plan().save()
+        self._write("config/global.conf", "[DEFAULT]\ndebug=1\n")
+        self.assertEqual({"foo", "bar", "loadbalancer"},
+                         self._plan().changed_roles)
+
+    def test_host_variable_changed(self):
+        self._plan().save()
+        inventory = dict(INVENTORY)
+        inventory["_meta"] = {"hostvars": {
+            "host1": {}, "host2": {"bar_setting": "changed"}, "lb1": {}}}
+        plan = self._plan(inventory)
+        self.assertEqual({"bar"}, plan.changed_roles)
+        self.assertEqual(["host2"], plan.changes["bar"]["hosts"])
+        self.assertEqual(["host variables: bar_setting"],
+                         plan.changes["bar"]["reasons"])
+        # The bar role is included in the loadbalancer play.
+        self.assertEqual(["foo"], plan.skip_tags)
+
+    def test_group_defaults_changed(self):
+        self._plan(group_defaults={"loadbalancer": {"bar_setting": "a"}}
+                   ).save()
+        plan = self._plan(group_defaults={"loadbalancer": {"bar_setting": "b"}})
+        self.assertEqual({"bar"}, plan.changed_roles)
+        self.assertEqual(["lb1"], plan.changes["bar"]["hosts"])
+        self.assertEqual(["group defaults: loadbalancer: bar_setting"],
+                         plan.changes["bar"]["reasons"])
+
+    def test_load_group_vars(self):
+        self._write("group_vars/all.yml", "foo_setting: all\n")
+        self._write("group_vars/baremetal.yml", "bar_setting: baremetal\n")
+        self._write("group_vars/control/main.yml", "foo_setting: control\n")
+        self._write("group_vars/README", "ignored\n")
+        self.assertEqual(
+            {"all": {"foo_setting": "all"},
+             "baremetal": {"bar_setting": "baremetal"},
+             "control": {"foo_setting": "control"}},
+            incremental._load_group_vars(
+                os.path.join(self.path, "group_vars")))
+
+    def test_group_changed(self):
+        self._plan().save()
+        inventory = dict(INVENTORY)
+        inventory["bar"] = {"hosts": ["host1"]}
+        plan = self._plan(inventory)
+        self.assertIn("inventory groups: bar", plan.changes["bar"]["reasons"])
+        self.assertEqual(["host2"], plan.changes["foo"]["hosts"])
+        self.assertEqual(["host groups: group_names"],
+                         plan.changes["foo"]["reasons"])
+
+    def test_extra_vars_changed(self):
+        self._plan().save()
+        plan = self._plan(extra_vars=["foo=bar"])
+        self.assertEqual({"foo", "bar", "loadbalancer"}, plan.changed_roles)
+
+    def test_vault_encrypted_vars_file(self):
+        self._write("passwords.yml", "$ANSIBLE_VAULT;1.1;AES256\n1234\n")
+        self._plan().save()
+        self.assertEqual(set(), self._plan().changed_roles)
+        self._write("passwords.yml", "$ANSIBLE_VAULT;1.1;AES256\n5678\n")
+        self.assertEqual({"foo", "bar", "loadbalancer"},
+                         self._plan().changed_roles)
+
+    def test_invalid_state(self):
+        self._write(incremental.STATE_FILE, "invalid")
+        self.assertEqual({"foo", "bar", "loadbalancer"},
+                         self._plan().changed_roles)
+
+    def test_state_file_mode(self):
+        self._plan().save()
+        mode = os.stat(os.path.join(self.path, incremental.STATE_FILE))
+        self.assertEqual(0o600, mode.st_mode & 0o777)
@@ -0,0 +1,138 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess  # nosec
+import tempfile
+import unittest
+
+from kolla_ansible import ansible
+from kolla_ansible import inventory
+from kolla_ansible import utils
+
+INVENTORY = """
+[control]
+control01 ansible_host=10.0.0.1
+control02
+
+[compute]
+compute01
+
+[storage:children]
+compute
+
+[nova:children]
+control
+
+[nova-api:children]
+nova
+
+[nova-api:vars]
+foo=bar
+"""
+
+
+class TestConvert(unittest.TestCase):
+
+    def test_convert(self):
+        listing = {
+            "_meta": {"hostvars": {"control01": {"ansible_host": "10.0.0.1"},
+                                   "compute01": {}}},
+            "all": {"children": ["ungrouped", "control", "nova-api"]},
+            "control": {"hosts": ["control01"]},
+            "nova": {"hosts": ["control01", "compute01"]},
+            "nova-api": {"children": ["nova"], "vars": {"foo": "bar"}},
+        }
+        self.assertEqual(
+            {"all": {"children": {"ungrouped": None, "control": None,
+                                  "nova-api": None}},
+             "control": {"hosts": {"control01": {"ansible_host": "10.0.0.1"}}},
+             "nova": {"hosts": {"control01": None, "compute01": None}},
+             "nova-api": {"children": {"nova": None},
+                          "vars": {"foo": "bar"}}},
+            inventory._convert(listing))
+
+
+@unittest.skipIf(shutil.which("ansible-inventory") is None,
+                 "ansible-inventory not installed")
+class TestCompileInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.config_path = os.path.join(self.path, "kolla")
+        self.source = os.path.join(self.path, "inventory")
+        self._write("inventory/multinode", INVENTORY)
+        self._write("inventory/group_vars/nova.yml", "baz: 1\n")
+        self._write("inventory/host_vars/control02.yml", "qux: 2\n")
+        parser = argparse.ArgumentParser()
+        ansible.add_ansible_args(parser)
+        ansible.add_kolla_ansible_args(parser)
+        self.parsed_args = parser.parse_args(
+            ["--configdir", self.config_path, "--inventory", self.source])
+
+    def _write(self, path, content):
+        path = os.path.join(self.path, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _list(self, source):
+        result = utils.run_command(
+            "ansible-inventory", ["--list", "--inventory", source],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        listing = json.loads(result.stdout)
+        for hostvars in listing["_meta"]["hostvars"].values():
+            hostvars.pop("inventory_file", None)
+            hostvars.pop("inventory_dir", None)
+        return listing
+
+    def test_compile_inventory(self):
+        path = inventory.compile_inventory(self.parsed_args, self.source)
+        self.assertEqual(
+            inventory.get_compiled_path(self.parsed_args, self.source), path)
+        self.assertTrue(path.startswith(os.path.join(
+            self.config_path, inventory.COMPILED_INVENTORY_DIR, "inventory-")))
+        self.assertEqual(["group_vars", "host_vars", "inventory.json"],
+                         sorted(os.listdir(path)))
+        with open(os.path.join(path, "inventory.json")) as f:
+            compiled = json.load(f)
+        # Variables of group_vars and host_vars are not compiled.
+        self.assertEqual({"hosts": {"control01": {"ansible_host": "10.0.0.1"},
+                                    "control02": None}},
+                         compiled["control"])
+        self.assertEqual({"children": {"nova": None}, "vars": {"foo": "bar"}},
+                         compiled["nova-api"])
+        # Ansible loads the same hosts, groups and variables.
+        self.assertEqual(self._list(self.source), self._list(path))
+
+    def test_is_fresh(self):
+        self.assertFalse(inventory.is_fresh(self.parsed_args, self.source))
+        path = inventory.compile_inventory(self.parsed_args, self.source)
+        self.assertTrue(inventory.is_fresh(self.parsed_args, self.source))
+        self.assertEqual(
+            ["--inventory", path],
+            ansible.build_args(self.parsed_args, ["site.yml"])[1][:2])
+
+        # Changes to variables files do not require a compilation.
+        os.utime(os.path.join(self.source, "group_vars", "nova.yml"))
+        self.assertTrue(inventory.is_fresh(self.parsed_args, self.source))
+
+        os.utime(os.path.join(self.source, "multinode"))
+        self.assertFalse(inventory.is_fresh(self.parsed_args, self.source))
+        self.assertEqual(
+            [self.source],
+            inventory.resolve_inventory_paths(self.parsed_args,
+                                              [self.source]))
@@ -73,6 +73,26 @@ class TestFilters(unittest.TestCase):
         self.assertRaisesRegex(jinja2.TemplateRuntimeError, 'duplicates',
                                self._test_extract_cell, test_data, 'cell0001')
 
+    def test_extract_cells(self):
+        test_data = os.path.join(os.path.dirname(
+            __file__), 'data', 'nova_manage_cli_output_multiple_cells')
+        with open(test_data, 'r') as f:
+            nova_manage_output = {'stdout_lines': f.readlines()}
+        actual = filters.extract_cells(nova_manage_output)
+        self.assertEqual(['', 'cell0', 'cell0001', 'cell0002'],
+                         sorted(actual))
+        self.assertEqual('087697bb-bfc2-471d-befb-0c0fcc7630e4',
+                         actual['cell0002']['cell_uuid'])
+
+    def test_extract_cells_duplicate(self):
+        test_data = os.path.join(os.path.dirname(
+            __file__), 'data', 'nova_manage_cli_output_duplicate_cells')
+        with open(test_data, 'r') as f:
+            nova_manage_output = {'stdout_lines': f.readlines()}
+        self.assertRaisesRegex(jinja2.TemplateRuntimeError,
+                               'cell0001 have duplicates',
+                               filters.extract_cells, nova_manage_output)
+
     def test_namespace_haproxy_for_cell_with_empty_name(self):
         example_services = {
             'nova-novncproxy': {
@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import configparser
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from kolla_ansible import performance
+
+BASE_CONFIG = """[defaults]
+roles_path = roles:/usr/share/roles
+forks = 7
+pipelining = False
+host_key_checking = %(foo)s
+"""
+
+
+class TestGetForks(unittest.TestCase):
+
+    def test_get_forks(self):
+        self.assertEqual(5, performance.get_forks("default", 3, cpus=8))
+        self.assertEqual(32, performance.get_forks("default", 400, cpus=8))
+        self.assertEqual(80, performance.get_forks("large", 400, cpus=8))
+        self.assertEqual(200, performance.get_forks("large", 400, cpus=64))
+        self.assertEqual(20, performance.get_forks("large", 400, processes=4,
+                                                   cpus=8))
+        self.assertEqual(5, performance.get_forks("large", 10, processes=4,
+                                                  cpus=8))
+
+
+@mock.patch.object(performance, "_get_mitogen_strategy_path",
+                   return_value=None)
+class TestWriteConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.config = os.path.join(self.path, "kolla", "ansible-large.cfg")
+        os.mkdir(os.path.dirname(self.config))
+
+    def _write(self, base=None, env=None, **kwargs):
+        settings = performance.write_config(
+            self.config, "large", 400, base=base, env=env or {}, **kwargs)
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.read(self.config)
+        return settings, parser
+
+    def test_write_config(self, mock_mitogen):
+        settings, parser = self._write()
+        self.assertEqual(
+            ["[defaults] forks = %d" % performance.get_forks("large", 400),
+             "[ssh_connection] pipelining = True",
+             "[ssh_connection] ssh_args = -C -o ControlMaster=auto "
+             "-o ControlPersist=30m"],
+            performance.describe(settings))
+        self.assertFalse(parser.has_option("defaults", "strategy"))
+
+    def test_write_config_base(self, mock_mitogen):
+        base = os.path.join(self.path, "ansible.cfg")
+        with open(base, "w") as f:
+            f.write(BASE_CONFIG)
+        settings, parser = self._write(
+            base=base, env={"ANSIBLE_SSH_ARGS": "-o ControlMaster=no"})
+        # Options of the base configuration and the environment are kept.
+        self.assertEqual([], settings)
+        self.assertEqual("7", parser.get("defaults", "forks"))
+        self.assertEqual("False", parser.get("defaults", "pipelining"))
+        self.assertEqual("%(foo)s",
+                         parser.get("defaults", "host_key_checking"))
+        # Relative paths are relative to the base configuration.
+        self.assertEqual(
+            os.pathsep.join([os.path.join(self.path, "roles"),
+                             "/usr/share/roles"]),
+            parser.get("defaults", "roles_path"))
+        with open(self.config) as f:
+            self.assertIn("# Base configuration: %s\n" % base, f.read())
+
+    def test_write_config_free_strategy(self, mock_mitogen):
+        settings, parser = self._write(free_strategy=True)
+        self.assertEqual("free", parser.get("defaults", "strategy"))
+
+    def test_write_config_mitogen(self, mock_mitogen):
+        mock_mitogen.return_value = "/mitogen/plugins/strategy"
+        settings, parser = self._write()
+        self.assertEqual("mitogen_linear",
+                         parser.get("defaults", "strategy"))
+        self.assertEqual("/mitogen/plugins/strategy",
+                         parser.get("defaults", "strategy_plugins"))
+        # The strategy and its plugins are only set together.
+        settings, parser = self._write(env={"ANSIBLE_STRATEGY": "linear"})
+        self.assertFalse(parser.has_option("defaults", "strategy_plugins"))
@@ -0,0 +1,182 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from kolla_ansible import playbooks
+from kolla_ansible import utils
+
+PLAYBOOK = """
+- import_playbook: gather-facts.yml
+
+- name: Group hosts
+  hosts: all
+  tags: always
+  tasks:
+    - group_by:
+        key: foo
+
+- name: Apply role common
+  hosts: all
+  roles:
+    - { role: common,
+        tags: common }
+
+- name: Apply role loadbalancer
+  hosts: loadbalancer
+  tags: loadbalancer
+  roles:
+    - role: loadbalancer
+  tasks:
+    - include_role:
+        name: foo
+        tasks_from: loadbalancer
+      tags: foo
+
+- import_playbook: foo.yml
+
+- name: Apply role bar
+  hosts: bar
+  roles:
+    - { role: bar,
+        tags: bar }
+"""
+
+GATHER_FACTS = """
+- name: Gather facts
+  hosts: all
+  tags: always
+"""
+
+FOO = """
+- name: Bootstrap foo
+  hosts: foo[0]
+  tags: foo
+
+- name: Apply role foo
+  hosts: foo
+  roles:
+    - { role: foo,
+        tags: foo }
+"""
+
+
+class TestScopedPlaybook(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self._write("ansible/site.yml", PLAYBOOK)
+        self._write("ansible/gather-facts.yml", GATHER_FACTS)
+        self._write("ansible/foo.yml", FOO)
+        self._write("ansible/group_vars/all.yml", "foo: bar\n")
+        self._write("ansible/roles/foo/tasks/main.yml", "- debug:\n")
+        self.playbook = os.path.join(self.path, "ansible", "site.yml")
+
+    def _write(self, path, content):
+        path = os.path.join(self.path, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _names(self, services):
+        return [play["name"]
+                for play in playbooks.select_plays(self.playbook, services)]
+
+    def test_select_plays(self):
+        self.assertEqual(
+            ["Gather facts", "Group hosts", "Apply role loadbalancer",
+             "Bootstrap foo", "Apply role foo"],
+            self._names(["foo"]))
+        self.assertEqual(
+            ["Gather facts", "Group hosts", "Apply role loadbalancer",
+             "Apply role bar"],
+            self._names(["loadbalancer", "bar"]))
+
+    def test_select_plays_unknown_service(self):
+        self.assertRaisesRegex(ValueError, "Unknown services: baz",
+                               playbooks.select_plays, self.playbook,
+                               ["foo", "baz"])
+
+    def test_select_plays_import_keywords(self):
+        self._write("ansible/import.yml", """
+- import_playbook: foo.yml
+  when: enable_foo | bool
+  tags: bar
+  vars:
+    foo_action: deploy
+""")
+        self._write("ansible/foo.yml", """
+- name: Bootstrap foo
+  hosts: foo[0]
+  tags: foo
+  gather_facts: false
+  vars:
+    foo_action: upgrade
+  tasks:
+    - debug:
+
+- name: Apply role foo
+  hosts: foo
+  gather_facts: false
+  roles:
+    - { role: foo,
+        tags: foo }
+""")
+        self.playbook = os.path.join(self.path, "ansible", "import.yml")
+        bootstrap, apply = playbooks.select_plays(self.playbook, ["bar"])
+        self.assertEqual(["foo", "bar"], bootstrap["tags"])
+        self.assertEqual({"foo_action": "deploy"}, bootstrap["vars"])
+        self.assertEqual(
+            [{"block": [{"debug": None}], "when": ["enable_foo | bool"]}],
+            bootstrap["tasks"])
+        self.assertEqual(
+            [{"role": "foo", "tags": "foo", "when": ["enable_foo | bool"]}],
+            apply["roles"])
+
+    def test_select_plays_import_gather_facts(self):
+        self._write("ansible/import.yml", """
+- import_playbook: foo.yml
+  when: enable_foo | bool
+""")
+        self.playbook = os.path.join(self.path, "ansible", "import.yml")
+        self.assertRaisesRegex(ValueError, "facts gathered by play Bootstrap",
+                               playbooks.select_plays, self.playbook, ["foo"])
+
+    def test_select_plays_import_unsupported_keyword(self):
+        self._write("ansible/import.yml", """
+- import_playbook: foo.yml
+  vars_files: foo.yml
+""")
+        self.playbook = os.path.join(self.path, "ansible", "import.yml")
+        self.assertRaisesRegex(ValueError, "Unsupported keywords .*vars_files",
+                               playbooks.select_plays, self.playbook, ["foo"])
+        # Roles are still listed regardless of the keywords of imports.
+        self.assertEqual(
+            ["foo"],
+            [unit.role for unit in playbooks.get_play_units(self.playbook)])
+
+    def test_write_scoped_playbook(self):
+        dest = os.path.join(self.path, "scoped")
+        path = playbooks.write_scoped_playbook(self.playbook, ["bar"], dest)
+        self.assertEqual(os.path.join(dest, "site.yml"), path)
+        self.assertEqual(
+            ["Gather facts", "Group hosts", "Apply role bar"],
+            [play["name"] for play in utils.read_yaml_file(path)])
+        # Directories next to the playbook are linked, playbooks are not.
+        self.assertEqual(["group_vars", "roles", "site.yml"],
+                         sorted(os.listdir(dest)))
+        self.assertTrue(os.path.isfile(
+            os.path.join(dest, "roles", "foo", "tasks", "main.yml")))
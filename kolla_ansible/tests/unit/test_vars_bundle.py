@@ -0,0 +1,111 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from kolla_ansible import vars_bundle
+
+GLOBALS = """---
+a: 1
+b: "{{ a }}"
+nested:
+  x: 1
+unsafe: !unsafe "{{ raw }}"
+"""
+
+PASSWORDS = """$ANSIBLE_VAULT;1.1;AES256
+6162636465
+"""
+
+
+class TestVarsBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.bundle_path = os.path.join(self.path, vars_bundle.BUNDLE_DIR)
+        self.files = [self._write("globals.yml", GLOBALS),
+                      self._write("passwords.yml", PASSWORDS),
+                      self._write("globals.d/a.yml", "b: 2\nc: 3\n"),
+                      self._write("globals.d/b.json", '{"nested": {"y": 2}}')]
+
+    def _write(self, name, content):
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+    def test_get_vars_files(self):
+        result = vars_bundle.get_vars_files(self.path, self.files)
+        self.assertEqual(3, len(result))
+        # Vault encrypted files are kept in order between bundles.
+        self.assertEqual(os.path.dirname(result[0]), self.bundle_path)
+        self.assertEqual(self.files[1], result[1])
+        self.assertEqual(
+            {"a": 1, "b": "{{ a }}", "nested": {"x": 1},
+             "unsafe": {"__ansible_unsafe": "{{ raw }}"}},
+            self._read(result[0]))
+        self.assertEqual({"b": 2, "c": 3, "nested": {"y": 2}},
+                         self._read(result[2]))
+        self.assertEqual(0o600, os.stat(result[0]).st_mode & 0o777)
+
+    def test_get_vars_files_cached(self):
+        result = vars_bundle.get_vars_files(self.path, self.files)
+        with mock.patch.object(vars_bundle, "build") as mock_build:
+            self.assertEqual(
+                result, vars_bundle.get_vars_files(self.path, self.files))
+        mock_build.assert_not_called()
+
+        self._write("globals.d/a.yml", "b: 4\n")
+        updated = vars_bundle.get_vars_files(self.path, self.files)
+        self.assertEqual(result[:2], updated[:2])
+        self.assertEqual({"b": 4, "nested": {"y": 2}},
+                         self._read(updated[2]))
+        # Bundles which are no longer used are removed.
+        self.assertFalse(os.path.exists(result[2]))
+
+    def test_get_vars_files_not_json(self):
+        self._write("globals.d/a.yml", "b: 2\n")
+        self._write("globals.d/b.json", '{"nested": {"y": 2}}')
+        dates = self._write("globals.d/c.yml", "d: 2024-01-01\n")
+        int_keys = self._write("globals.d/d.yml", "e:\n  1: one\n")
+        files = self.files[2:] + [dates, int_keys]
+        result = vars_bundle.get_vars_files(self.path, files)
+        # Files whose values JSON does not represent are passed as they are.
+        self.assertEqual(3, len(result))
+        self.assertEqual({"b": 2, "nested": {"y": 2}}, self._read(result[0]))
+        self.assertEqual([dates, int_keys], result[1:])
+
+    def test_get_vars_files_merge(self):
+        self.assertEqual(
+            self.files,
+            vars_bundle.get_vars_files(self.path, self.files, "merge"))
+        self.assertFalse(os.path.exists(self.bundle_path))
+
+    def test_get_vars_files_invalid(self):
+        self._write("globals.d/a.yml", "- b\n")
+        self.assertEqual(self.files,
+                         vars_bundle.get_vars_files(self.path, self.files))
+
+    def test_get_vars_files_missing(self):
+        files = self.files + [os.path.join(self.path, "missing.yml")]
+        self.assertEqual(files, vars_bundle.get_vars_files(self.path, files))
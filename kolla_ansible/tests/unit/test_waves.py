@@ -0,0 +1,57 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from kolla_ansible import waves
+
+HOSTS = ["host%02d" % i for i in range(1, 41)]
+
+
+class TestParseSpec(unittest.TestCase):
+
+    def test_parse_spec(self):
+        self.assertEqual(("compute", ["1", "5", "25%", "rest"]),
+                         waves.parse_spec("compute=1, 5,25%,rest"))
+        self.assertEqual(("all", ["10%"]), waves.parse_spec("10%"))
+
+    def test_parse_spec_invalid(self):
+        for spec in ("compute=", "0", "1,x", "150%", "-1", "0%"):
+            self.assertRaises(ValueError, waves.parse_spec, spec)
+
+
+class TestWavePlan(unittest.TestCase):
+
+    def test_get_wave_size(self):
+        self.assertEqual(5, waves.get_wave_size("5", 40))
+        self.assertEqual(10, waves.get_wave_size("25%", 40))
+        self.assertEqual(1, waves.get_wave_size("1%", 40))
+        self.assertEqual(40, waves.get_wave_size("rest", 40))
+
+    def test_plan(self):
+        plan = waves.WavePlan(HOSTS, ["1", "5", "25%"])
+        self.assertEqual([1, 5, 10, 10, 10, 4],
+                         [len(wave) for wave in plan])
+        self.assertEqual(HOSTS, sum(list(plan), []))
+
+    def test_plan_rest(self):
+        plan = waves.WavePlan(HOSTS, ["1", "5", "rest"])
+        self.assertEqual([1, 5, 34], [len(wave) for wave in plan])
+
+    def test_plan_failed(self):
+        # The size of waves does not grow after a wave failed.
+        plan = waves.WavePlan(HOSTS, ["1", "5", "rest"])
+        sizes = []
+        for wave in plan:
+            sizes.append(len(wave))
+            plan.failed = len(sizes) == 2
+        self.assertEqual([1, 5, 5, 29], sizes)
@@ -12,15 +12,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import functools
 import glob
 import json
 import logging
 import os
 import subprocess  # nosec
 import sys
-import yaml
 
 from importlib.metadata import Distribution
+from kolla_ansible import yaml_utils
 from time import sleep
 
 LOG = logging.getLogger(__name__)
@@ -69,7 +70,16 @@ def _get_base_path() -> os.path:
     override = os.environ.get("KOLLA_ANSIBLE_DATA_FILES_PATH")
     if override:
         return os.path.join(override)
+    return _find_base_path()
 
+
+@functools.lru_cache(maxsize=None)
+def _find_base_path() -> os.path:
+    """Find the installation of the package.
+
+    Distributions are discovered by scanning the whole of sys.path, which is
+    done only once per process.
+    """
     kolla_ansible_dist = list(Distribution.discover(name="kolla_ansible"))
     if kolla_ansible_dist:
         direct_url = _get_direct_url_if_editable(kolla_ansible_dist[0])
@@ -142,8 +152,8 @@ def read_yaml_file(path: os.path):
               (path, repr(e)))
         sys.exit(1)
     try:
-        return yaml.safe_load(content)
-    except yaml.YAMLError as e:
+        return yaml_utils.safe_load(content)
+    except yaml_utils.YAMLError as e:
         print("Failed to decode YAML file %s: %s" %
               (path, repr(e)))
         sys.exit(1)
@@ -174,10 +184,11 @@ def is_readable_file(path: os.path) -> bool:
 def run_command(executable: str,
                 args: list,
                 quiet: bool = False,
-                **kwargs) -> None:
+                **kwargs) -> subprocess.CompletedProcess:
     """Run a command, checking the output.
 
     :param quiet: Redirect output to /dev/null
+    :returns: The completed process.
     """
     full_cmd = [executable] + args
     cmd_string = " ".join(full_cmd)
@@ -186,6 +197,8 @@ def run_command(executable: str,
     if quiet:
         kwargs["stdout"] = subprocess.DEVNULL
         kwargs["stderr"] = subprocess.DEVNULL
-        subprocess.run(full_cmd, check=True, shell=False, **kwargs)  # nosec
+        return subprocess.run(full_cmd, check=True, shell=False,  # nosec
+                              **kwargs)
     else:
-        subprocess.run(full_cmd, check=True, shell=False, **kwargs)  # nosec
+        return subprocess.run(full_cmd, check=True, shell=False,  # nosec
+                              **kwargs)
@@ -0,0 +1,183 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Bundling of the variable files passed to Ansible as extra vars.
+
+Consecutive variable files are merged into a JSON bundle, which Ansible loads
+faster than YAML and as a single file. Bundles are named after the hash of
+their content and cached in the config path, along with an index of the
+modification times and sizes of the files they were built from, so that they
+are only rebuilt when a file changes.
+
+Files encrypted with Ansible Vault cannot be read without their secrets and
+are passed as they are, between the bundles of the files before and after
+them. So are files with values which JSON does not represent, such as
+mappings with keys which are not strings or dates. Values encrypted inline
+with the !vault tag stay encrypted in bundles.
+
+Files are not bundled when Ansible merges variables with the merge hash
+behaviour.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+
+from typing import List
+
+# Directory of the bundles in the config path.
+BUNDLE_DIR = ".vars-bundle"
+
+INDEX_FILE = "index.json"
+
+VAULT_HEADER = b"$ANSIBLE_VAULT"
+
+LOG = logging.getLogger(__name__)
+
+
+def _get_state(files: List[str]) -> List[list]:
+    """Return the path, modification time and size of files."""
+    state = []
+    for path in files:
+        st = os.stat(path)
+        state.append([path, st.st_mtime_ns, st.st_size])
+    return state
+
+
+def _is_vault_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(VAULT_HEADER)) == VAULT_HEADER
+
+
+def _load_index(path: str) -> dict:
+    try:
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path: str, content: str) -> None:
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _is_json_compatible(value) -> bool:
+    """Return whether a value is loaded back unchanged from JSON."""
+    from ansible.parsing.yaml.objects import AnsibleVaultEncryptedUnicode
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json_compatible(v)
+                   for k, v in value.items())
+    if isinstance(value, list):
+        return all(_is_json_compatible(v) for v in value)
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return value is None or isinstance(
+        value, (str, int, AnsibleVaultEncryptedUnicode))
+
+
+def _dump(variables: dict) -> str:
+    from ansible.module_utils.common.json import AnsibleJSONEncoder
+    # NOTE: Unsafe strings are encoded as such, as are vault encrypted
+    # values, which are not decrypted.
+    return json.dumps(variables, cls=AnsibleJSONEncoder,
+                      preprocess_unsafe=True, sort_keys=True,
+                      separators=(",", ":"))
+
+
+def build(path: str, files: List[str]) -> List[str]:
+    """Build the bundles of variable files.
+
+    Variables of later files replace those of earlier ones, as Ansible does
+    for extra vars with the default hash behaviour.
+
+    :param path: the directory in which bundles are written.
+    :returns: the bundles and the files which are not bundled, in order.
+    :raises ValueError: if a file does not contain a dict.
+    """
+    from ansible.parsing.dataloader import DataLoader
+    loader = DataLoader()
+
+    results = []
+    variables = None
+    for vars_file in files + [None]:
+        data = None
+        if vars_file is not None and not _is_vault_file(vars_file):
+            data = loader.load_from_file(vars_file)
+            if data is None:
+                data = {}
+            if not isinstance(data, dict):
+                raise ValueError("%s does not contain a dict" % vars_file)
+            if not _is_json_compatible(data):
+                LOG.debug("Not bundling %s, which has values not "
+                          "represented by JSON", vars_file)
+                data = None
+        if data is not None:
+            variables = variables or {}
+            variables.update(data)
+            continue
+        if variables is not None:
+            content = _dump(variables)
+            digest = hashlib.sha256(content.encode()).hexdigest()[:16]
+            bundle = os.path.join(path, "bundle-%s.json" % digest)
+            if not os.path.exists(bundle):
+                _write(bundle, content)
+            results.append(bundle)
+            variables = None
+        if vars_file is not None:
+            results.append(vars_file)
+    return results
+
+
+def get_vars_files(config_path: str, files: List[str],
+                   hash_behaviour: str = "replace") -> List[str]:
+    """Return the files to pass to Ansible as extra vars instead of files.
+
+    Bundles are built if the files changed since they were last built. The
+    files are returned unchanged if they cannot be bundled, for Ansible to
+    report any error.
+
+    :param hash_behaviour: the hash_behaviour of Ansible, files are only
+        bundled with the default 'replace' behaviour.
+    """
+    if hash_behaviour != "replace":
+        return files
+    path = os.path.join(os.path.abspath(config_path), BUNDLE_DIR)
+    try:
+        state = _get_state(files)
+    except OSError:
+        return files
+    index = _load_index(path)
+    if (index.get("files") == state and
+            all(os.path.exists(f) for f in index.get("bundles", []))):
+        return index["bundles"]
+
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        bundles = build(path, files)
+        _write(os.path.join(path, INDEX_FILE),
+               json.dumps({"files": state, "bundles": bundles}))
+    except Exception as e:
+        LOG.debug("Unable to bundle variable files, passing them to "
+                  "Ansible: %s", e)
+        return files
+    for name in os.listdir(path):
+        bundle = os.path.join(path, name)
+        if name.startswith("bundle-") and bundle not in bundles:
+            os.remove(bundle)
+    LOG.debug("Bundled variable files %s into %s", files, bundles)
+    return bundles
@@ -0,0 +1,85 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Rolling runs of Ansible on waves of hosts of growing sizes."""
+
+import math
+
+from typing import Iterator
+from typing import List
+from typing import Tuple
+
+# Step of a wave plan covering the remaining hosts.
+REST = "rest"
+
+
+def _check_step(step: str) -> None:
+    if step == REST:
+        return
+    value = step[:-1] if step.endswith("%") else step
+    try:
+        valid = (0 < float(value) <= 100 if step.endswith("%")
+                 else int(value) > 0)
+    except ValueError:
+        valid = False
+    if not valid:
+        raise ValueError("Invalid wave size %s, expected a positive number "
+                         "of hosts, a percentage or %s" % (step, REST))
+
+
+def parse_spec(spec: str) -> Tuple[str, List[str]]:
+    """Parse the waves of a group, as [GROUP=]SIZE[,SIZE...].
+
+    :returns: the group, all if not given, and the sizes of its waves.
+    :raises ValueError: if the specification is invalid.
+    """
+    group, _, steps = spec.rpartition("=")
+    steps = [step.strip() for step in steps.split(",") if step.strip()]
+    if not steps:
+        raise ValueError("No wave sizes in %s" % spec)
+    for step in steps:
+        _check_step(step)
+    return group.strip() or "all", steps
+
+
+def get_wave_size(step: str, hosts: int) -> int:
+    """Return the number of hosts of a wave of a group of hosts."""
+    if step == REST:
+        return hosts
+    if step.endswith("%"):
+        return max(1, math.ceil(hosts * float(step[:-1]) / 100))
+    return int(step)
+
+
+class WavePlan(object):
+    """Waves of hosts whose sizes grow while waves succeed.
+
+    The size of each wave is given by the next step, until the last step
+    which is used for the remaining waves. If hosts of a wave failed,
+    ``failed`` is set by the caller and the next wave has the same size.
+    """
+
+    def __init__(self, hosts: List[str], steps: List[str]):
+        self.hosts = hosts
+        self.steps = steps
+        self.failed = False
+
+    def __iter__(self) -> Iterator[List[str]]:
+        remaining = list(self.hosts)
+        index = 0
+        while remaining:
+            size = get_wave_size(self.steps[index], len(self.hosts))
+            wave, remaining = remaining[:size], remaining[size:]
+            self.failed = False
+            yield wave
+            if not self.failed:
+                index = min(index + 1, len(self.steps) - 1)
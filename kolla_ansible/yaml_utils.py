@@ -0,0 +1,58 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""YAML loading and dumping helpers.
+
+The libyaml based loader and dumpers are used when PyYAML was built with
+libyaml support, otherwise the pure Python implementations are used. Both
+produce the same documents and output.
+"""
+
+import yaml
+
+try:
+    from yaml import CDumper as Dumper
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+    HAS_LIBYAML = True
+except ImportError:
+    from yaml import Dumper
+    from yaml import SafeDumper
+    from yaml import SafeLoader
+    HAS_LIBYAML = False
+
+YAMLError = yaml.YAMLError
+
+
+def safe_load(stream):
+    """Parse a YAML document from a string or a file object.
+
+    Equivalent to yaml.safe_load().
+    """
+    return yaml.load(stream, Loader=SafeLoader)  # nosec
+
+
+def safe_dump(data, stream=None, **kwargs):
+    """Serialize a Python object into a YAML document.
+
+    Equivalent to yaml.safe_dump(). If stream is None, return the produced
+    string.
+    """
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwargs)
+
+
+def dump(data, stream=None, **kwargs):
+    """Serialize a Python object into a YAML document.
+
+    Equivalent to yaml.dump(). If stream is None, return the produced string.
+    """
+    return yaml.dump(data, stream, Dumper=Dumper, **kwargs)
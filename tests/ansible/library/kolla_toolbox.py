@@ -45,6 +45,12 @@ def ovs_vsctl(argv, state):
     if not argv:
         return False, 1, "", "missing ovs-vsctl arguments"
 
+    if argv[0].startswith("--timeout="):
+        return ovs_vsctl(argv[1:], state)
+
+    if "--" in argv:
+        return ovs_vsctl_transaction(argv, state)
+
     cmd = argv[0]
 
     if cmd == "br-exists":
@@ -77,6 +83,34 @@ def ovs_vsctl(argv, state):
         data = [[name, details.get("fail_mode", "")] for name, details in sorted(state["bridges"].items())]
         return False, 0, json.dumps({"data": data}), ""
 
+    if cmd == "--format=json" and len(argv) >= 4 and argv[1] == "--columns=name,fail_mode,ports" and argv[2] == "list" and argv[3] == "Bridge":
+        data = [
+            [name, details.get("fail_mode") or ["set", []], ["set", [["uuid", f"uuid-{port}"] for port in details.get("ports", [])]]]
+            for name, details in sorted(state["bridges"].items())
+        ]
+        return False, 0, json.dumps({"headings": ["name", "fail_mode", "ports"], "data": data}), ""
+
+    if cmd == "--format=json" and len(argv) >= 4 and argv[1].startswith("--columns=_uuid,name") and argv[2] == "list" and argv[3] == "Port":
+        headings = argv[1].split("=", 1)[1].split(",")
+        data = []
+        for details in state["bridges"].values():
+            for port in details.get("ports", []):
+                columns = state.get("ports", {}).get(port, {})
+                values = {"_uuid": ["uuid", f"uuid-{port}"], "name": port}
+                data.append([values.get(heading, columns.get(heading, ["set", []])) for heading in headings])
+        return False, 0, json.dumps({"headings": headings, "data": data}), ""
+
+    if cmd == "set" and len(argv) >= 4 and argv[1] == "Port":
+        port = argv[2]
+        columns = state.setdefault("ports", {}).setdefault(port, {})
+        for assignment in argv[3:]:
+            column, value = assignment.split("=", 1)
+            try:
+                columns[column] = json.loads(value)
+            except json.JSONDecodeError:
+                columns[column] = value
+        return True, 0, "", ""
+
     if cmd == "set-fail-mode" and len(argv) >= 3:
         bridge = argv[1]
         mode = argv[2]
@@ -109,6 +143,27 @@ def ovs_vsctl(argv, state):
     return False, 1, "", f"unsupported ovs-vsctl command: {' '.join(argv)}"
 
 
+def ovs_vsctl_transaction(argv, state):
+    """Run the commands of an ``ovs-vsctl -- cmd -- cmd`` transaction."""
+    log_command(["transaction"])
+    commands = [[]]
+    for arg in argv:
+        if arg == "--":
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    changed = False
+    for command in commands:
+        if not command:
+            continue
+        log_command(command)
+        command_changed, rc, stdout, stderr = ovs_vsctl(command, state)
+        if rc != 0:
+            return False, rc, stdout, stderr
+        changed = changed or command_changed
+    return changed, 0, "", ""
+
+
 def main():
     module = AnsibleModule(
         argument_spec=dict(
@@ -21,23 +21,72 @@ Original license:
 Simple j2 linter, useful for checking jinja2 template syntax
 
 Adapted for OpenStack Kolla/Kolla-Ansible purposes
+
+Files and directories may be passed as arguments. Directories are walked once
+and the files found are classified by type: Jinja2 templates (*.j2), YAML
+(*.yml, *.yaml) and JSON (*.json) files. Files are checked in parallel and
+results are cached by content between runs.
 """
 
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import os.path
+import sys
+
 from ansible.plugins.filter.core import get_encrypted_password
 from ansible.plugins.filter.core import to_json
-from functools import reduce
+import jinja2
 from jinja2 import BaseLoader
 from jinja2 import Environment
 from jinja2 import exceptions
 from jinja2 import TemplateNotFound
+from kolla_ansible import fluentd_filters
 from kolla_ansible import kolla_address
+from kolla_ansible import kolla_cluster_addresses
 from kolla_ansible import put_address_in_context
-import os.path
+from kolla_ansible import yaml_utils
+import yaml
 try:
     from ansible_collections.ansible.utils.plugins.filter import ipwrap
 except ImportError:
     from ansible_collections.ansible.netcommon.plugins.filter import ipwrap
 
+EXCLUDE_DIRS = ['.tox', '.git', '.testrepository', '.venv', '.eggs',
+                '__pycache__', '*.egg-info']
+
+# Template types, matched in order against file names.
+FILE_TYPES = [
+    ('jinja2', ['*.j2']),
+    ('yaml', ['*.yml', '*.yaml']),
+    ('json', ['*.json']),
+]
+
+CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'kolla-ansible', 'j2lint.json')
+
+
+class TagTolerantLoader(yaml_utils.SafeLoader):
+    """YAML loader accepting application specific tags.
+
+    Ansible (!unsafe, !vault) and Zuul (!inherit) files use local tags which
+    are not known to the safe loader, only the syntax is checked here.
+    """
+
+
+def _construct_tagged(loader, tag_suffix, node):
+    if isinstance(node, yaml.MappingNode):
+        return loader.construct_mapping(node)
+    if isinstance(node, yaml.SequenceNode):
+        return loader.construct_sequence(node)
+    return loader.construct_scalar(node)
+
+
+TagTolerantLoader.add_multi_constructor('!', _construct_tagged)
+
 
 class AbsolutePathLoader(BaseLoader):
     def get_source(self, environment, template):
@@ -49,39 +98,183 @@ class AbsolutePathLoader(BaseLoader):
         return source, template, lambda: mtime == os.path.getmtime(template)
 
 
-def check(template, out, err, env=Environment(loader=AbsolutePathLoader(),
-          autoescape=True)):
+def get_environment():
+    """Return a Jinja2 environment with the filters used by templates."""
+    env = Environment(loader=AbsolutePathLoader(), autoescape=True)
+    env.filters['basename'] = os.path.basename
+    env.filters['bool'] = bool
+    env.filters['hash'] = hash
+    env.filters['to_json'] = to_json
+    # NOTE(wszumski): password_hash is mapped to the function:
+    # get_encrypted_password in ansible.filters.core.
+    env.filters['password_hash'] = get_encrypted_password
+    env.filters['kolla_address'] = kolla_address
+    env.filters['kolla_cluster_addresses'] = kolla_cluster_addresses
+    env.filters['put_address_in_context'] = put_address_in_context
+    env.filters['ipwrap'] = ipwrap
+    env.filters.update(fluentd_filters.get_filters())
+    return env
+
+
+ENV = get_environment()
+
+
+def _engine_version():
+    """Return a key identifying the checks, used to invalidate the cache."""
+    with open(os.path.realpath(__file__), 'rb') as f:
+        source = f.read()
+    return hashlib.sha256(source + jinja2.__version__.encode()).hexdigest()
+
+
+def get_file_type(path):
+    """Return the type of a file, or None if it is not checked."""
+    name = os.path.basename(path)
+    for file_type, patterns in FILE_TYPES:
+        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            return file_type
+    return None
+
+
+def find_files(paths):
+    """Return the files to check, walking directories once."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, filenames in os.walk(path):
+            dirs[:] = sorted(
+                d for d in dirs
+                if not any(fnmatch.fnmatch(d, x) for x in EXCLUDE_DIRS))
+            for filename in sorted(filenames):
+                full_path = os.path.join(root, filename)
+                if get_file_type(full_path):
+                    files.append(full_path)
+    return files
+
+
+def lint_source(file_type, source, template, env=ENV):
+    """Check the content of a file.
+
+    :returns: a tuple of a return code and an error message.
+    """
     try:
-        env.filters['basename'] = os.path.basename
-        env.filters['bool'] = bool
-        env.filters['hash'] = hash
-        env.filters['to_json'] = to_json
-        # NOTE(wszumski): password_hash is mapped to the function:
-        # get_encrypted_password in ansible.filters.core.
-        env.filters['password_hash'] = get_encrypted_password
-        env.filters['kolla_address'] = kolla_address
-        env.filters['put_address_in_context'] = put_address_in_context
-        env.filters['ipwrap'] = ipwrap
-        env.get_template(template)
-        out.write("%s: Syntax OK\n" % template)
-        return 0
-    except TemplateNotFound:
-        err.write("%s: File not found\n" % template)
-        return 2
+        if file_type == 'jinja2':
+            env.compile(source, template, template)
+        elif file_type == 'yaml':
+            yaml.load(source, Loader=TagTolerantLoader)  # nosec
+        elif file_type == 'json':
+            json.loads(source)
     except exceptions.TemplateSyntaxError as ex:
-        err.write("%s: Syntax check failed: %s in %s at %d\n"
-                  % (template, ex.message, ex.filename, ex.lineno))
-        return 1
+        return 1, "Syntax check failed: %s in %s at %d" % (
+            ex.message, ex.filename, ex.lineno)
+    except (yaml_utils.YAMLError, ValueError) as ex:
+        return 1, "Syntax check failed: %s" % str(ex).replace('\n', ' ')
+    return 0, None
+
+
+def _lint_file(args):
+    path, file_type = args
+    try:
+        with open(path) as f:
+            source = f.read()
+    except IOError:
+        return 2, "File not found"
+    except UnicodeDecodeError as ex:
+        return 1, "Decode failed: %s" % ex
+    return lint_source(file_type, source, path)
 
 
-def main(**kwargs):
-    import sys
+def _load_cache(path, version):
     try:
-        sys.exit(reduce(lambda r, fn: r +
-                        check(fn, sys.stdout, sys.stderr, **kwargs),
-                        sys.argv[1:], 0))
-    except IndexError:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if cache.get('version') != version:
+        return {}
+    return cache.get('results', {})
+
+
+def _save_cache(path, version, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': version, 'results': results}, f)
+    os.replace(tmp_path, path)
+
+
+def lint(paths, out, err, jobs=None, cache_path=CACHE_PATH):
+    """Check files and directories, returning the sum of return codes."""
+    version = _engine_version()
+    cache = _load_cache(cache_path, version) if cache_path else {}
+    keys = {}
+    pending = []
+    for path in find_files(paths):
+        file_type = get_file_type(path) or 'jinja2'
+        try:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except IOError:
+            err.write("%s: File not found\n" % path)
+            keys[path] = None
+            continue
+        keys[path] = '%s:%s' % (file_type, digest)
+        if keys[path] not in cache:
+            pending.append((path, file_type))
+
+    if jobs == 1 or len(pending) <= 1:
+        checked = list(map(_lint_file, pending))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            checked = list(executor.map(
+                _lint_file, pending, chunksize=max(1, len(pending) // 64)))
+    results = dict(zip((path for path, _ in pending), checked))
+
+    return_code = 0
+    for path, key in keys.items():
+        if key is None:
+            return_code += 2
+            continue
+        code, message = results.get(path) or cache[key]
+        if code == 0:
+            out.write("%s: Syntax OK\n" % path)
+        else:
+            err.write("%s: %s\n" % (path, message))
+        return_code += code
+        # NOTE: Error messages contain the file name, only successful
+        # results are cached.
+        if code == 0:
+            cache[key] = [code, message]
+
+    if cache_path:
+        _save_cache(cache_path, version,
+                    dict((k, v) for k, v in cache.items()
+                         if k in keys.values()))
+    return return_code
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the syntax of Jinja2 templates, YAML and JSON "
+                    "files.")
+    parser.add_argument('paths', metavar='PATH', nargs='*',
+                        help="files or directories to check")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of parallel processes "
+                             "(default: number of CPUs)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="do not use cached results")
+    parser.add_argument('--cache-file', default=CACHE_PATH,
+                        help="path of the results cache "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    if not args.paths:
         sys.stdout.write("Usage: j2lint.py filename [filename ...]\n")
+        return
+    cache_path = None if args.no_cache else args.cache_file
+    sys.exit(lint(args.paths, sys.stdout, sys.stderr, jobs=args.jobs,
+                  cache_path=cache_path) and 1)
 
 
 if __name__ == "__main__":
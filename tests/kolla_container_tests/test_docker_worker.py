@@ -865,6 +865,7 @@ class TestImage(base.BaseTestCase):
         self.dw.dc.exec_start.assert_called_once_with(job)
         self.dw.dc.exec_inspect.assert_called_once_with(job)
         self.assertFalse(return_data)
+        self.assertNotIn('config_diff', self.dw.result)
 
     def test_compare_config_changed(self):
         self.dw = get_DockerWorker(FAKE_DATA['params'])
@@ -880,6 +881,7 @@ class TestImage(base.BaseTestCase):
         self.dw.dc.exec_start.assert_called_once_with(job)
         self.dw.dc.exec_inspect.assert_called_once_with(job)
         self.assertTrue(return_data)
+        self.assertEqual('fake output', self.dw.result['config_diff'])
 
     @mock.patch('kolla_docker_worker.time.sleep')
     def test_compare_config_transient_exit_then_unchanged(self, mock_sleep):
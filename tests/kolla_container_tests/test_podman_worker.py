@@ -904,6 +904,7 @@ class TestImage(base.BaseTestCase):
             pwm.COMPARE_CONFIG_CMD,
             user='root')
         self.assertTrue(return_data)
+        self.assertEqual('fake_data', self.pw.result['config_diff'])
 
     @mock.patch('kolla_podman_worker.time.sleep')
     def test_compare_config_transient_non_running_then_unchanged(self, mock_sleep):
@@ -119,6 +119,37 @@ def test_compare_container_podman_detects_user_drift():
     assert 'user' in pw.result.get('container_recreate_reasons', [])
 
 
+def _drifted_worker(**params):
+    pw = PodmanWorker(DummyModule(**params))
+    pw.check_container = mock.MagicMock(return_value=True)
+    pw.check_container_differs = mock.MagicMock(return_value=True)
+    pw.emit_diff = mock.MagicMock()
+    pw.compare_config = mock.MagicMock(return_value=True)
+    pw.systemd.check_unit_change = mock.MagicMock(return_value=False)
+    pw.systemd.check_unit_file = mock.MagicMock(return_value=True)
+    pw.systemd.get_unit_file_state = mock.MagicMock(return_value='enabled')
+    pw.systemd.get_unit_state = mock.MagicMock(return_value='dead')
+    return pw
+
+
+def test_compare_container_podman_stops_at_first_difference():
+    pw = _drifted_worker()
+
+    assert pw.compare_container() is True
+    assert pw.result['drift_reasons'] == ['container_differs']
+    pw.compare_config.assert_not_called()
+    pw.systemd.get_unit_state.assert_not_called()
+
+
+def test_compare_container_podman_compare_all():
+    pw = _drifted_worker(compare_all=True)
+
+    assert pw.compare_container() is True
+    assert pw.result['drift_reasons'] == [
+        'container_differs', 'config_changed', 'unit_inactive']
+    pw.emit_diff.assert_called_once_with()
+
+
 def test_wait_overrides_defer_start():
     module = DummyModule(defer_start=True, wait=True)
     pw = PodmanWorker(module)
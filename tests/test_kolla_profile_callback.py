@@ -0,0 +1,99 @@
+import csv
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess  # nosec B404
+import sys
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ANSIBLE_PLAYBOOK = shutil.which("ansible-playbook")
+
+if ANSIBLE_PLAYBOOK is None:
+    pytest.skip("ansible-playbook not installed", allow_module_level=True)
+
+PLAYBOOK = """---
+- name: Profiled play
+  hosts: all
+  gather_facts: false
+  tasks:
+    - name: Run a command
+      command: "true"
+    - name: Skipped task
+      command: "false"
+      when: false
+    - include_role:
+        name: profiled
+    - name: Notify handler
+      command: "true"
+      notify: Restart service
+    - meta: flush_handlers
+    - name: Wait between flushes
+      command: sleep 1
+    - name: Notify handler again
+      command: "true"
+      notify: Restart service
+  handlers:
+    - name: Restart service
+      command: "true"
+"""
+
+
+def test_profile_report(tmp_path):
+    (tmp_path / "playbook.yml").write_text(PLAYBOOK, encoding="utf-8")
+    role_tasks = tmp_path / "roles" / "profiled" / "tasks"
+    role_tasks.mkdir(parents=True)
+    (role_tasks / "main.yml").write_text(
+        "- name: Role task\n  debug:\n    msg: hello\n", encoding="utf-8")
+    output_dir = tmp_path / "profile"
+
+    env = os.environ.copy()
+    env.update(
+        {
+            "ANSIBLE_CALLBACK_PLUGINS": str(
+                REPO_ROOT / "ansible" / "callback_plugins"),
+            "ANSIBLE_CALLBACKS_ENABLED": "kolla_profile",
+            "KOLLA_ANSIBLE_PROFILE_DIR": str(output_dir),
+            "KOLLA_ANSIBLE_PROFILE_TOP": "2",
+        }
+    )
+    result = subprocess.run(  # nosec B603
+        [ANSIBLE_PLAYBOOK, "-i", "host1,host2,", "-c", "local",
+         "-e", f"ansible_python_interpreter={sys.executable}",
+         str(tmp_path / "playbook.yml")],
+        check=True, capture_output=True, text=True, env=env)
+
+    assert "SLOWEST TASKS" in result.stdout
+    assert "MODULE CALLS" in result.stdout
+
+    reports = sorted(output_dir.iterdir())
+    assert [p.suffix for p in reports] == [".csv", ".json"]
+    report = json.loads(reports[1].read_text(encoding="utf-8"))
+
+    tasks = dict((task["task"], task) for task in report["tasks"])
+    assert set(tasks) == {"Run a command", "Skipped task",
+                          "include_role : profiled", "Role task",
+                          "Notify handler", "Wait between flushes",
+                          "Notify handler again", "Restart service", "meta"}
+    assert tasks["Run a command"]["hosts"] == 2
+    assert tasks["Role task"]["role"] == "profiled"
+    assert tasks["Role task"]["play"] == "Profiled play"
+    assert set(report["roles"]) == {"", "profiled"}
+    assert set(report["hosts"]) == {"host1", "host2"}
+    # Each flush of a handler is recorded separately, and does not cover the
+    # tasks run between the flushes.
+    handlers = [task for task in report["tasks"]
+                if task["task"] == "Restart service"]
+    assert [handler["hosts"] for handler in handlers] == [2, 2]
+    assert all(handler["duration"] < tasks["Wait between flushes"]["duration"]
+               for handler in handlers)
+    # Skipped tasks do not call their module.
+    assert report["modules"]["command"] == 12
+    assert report["modules"]["debug"] == 2
+
+    with reports[0].open(newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["task"] for row in rows] == [
+        task["task"] for task in report["tasks"]]
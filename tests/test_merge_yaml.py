@@ -174,3 +174,106 @@ class MergeYamlConfigTest(base.BaseTestCase):
         with self.assertRaisesRegex(AnsibleModuleError, "Failure merging key"):
             merge_yaml.Utils.update_nested_conf(
                 initial_conf, extension, extend_lists=True)
+
+    def test_merge_lists_by_key(self):
+        initial_conf = {
+            'scrape_configs': [
+                {'job_name': 'node', 'scrape_interval': '60s'},
+                {'job_name': 'mysqld', 'scrape_interval': '60s'},
+            ]
+        }
+
+        extension = {
+            'scrape_configs': [
+                {'job_name': 'node', 'scrape_interval': '15s'},
+                {'job_name': 'custom', 'scrape_interval': '30s'},
+            ]
+        }
+
+        actual = merge_yaml.Utils.update_nested_conf(
+            initial_conf, extension, merge_lists_by='job_name')
+        expected = {
+            'scrape_configs': [
+                {'job_name': 'node', 'scrape_interval': '15s'},
+                {'job_name': 'mysqld', 'scrape_interval': '60s'},
+                {'job_name': 'custom', 'scrape_interval': '30s'},
+            ]
+        }
+        self.assertDictEqual(actual, expected)
+
+    def test_merge_lists_by_key_nested_lists(self):
+        initial_conf = {
+            'groups': [
+                {'name': 'rabbitmq', 'rules': [{'alert': 'Down'}]},
+            ]
+        }
+
+        extension = {
+            'groups': [
+                {'name': 'rabbitmq', 'rules': [{'alert': 'Down'},
+                                               {'alert': 'Full'}]},
+            ]
+        }
+
+        actual = merge_yaml.Utils.update_nested_conf(
+            initial_conf, extension, merge_lists_by=['alert', 'name'])
+        expected = {
+            'groups': [
+                {'name': 'rabbitmq', 'rules': [{'alert': 'Down'},
+                                               {'alert': 'Full'}]},
+            ]
+        }
+        self.assertDictEqual(actual, expected)
+
+    def test_merge_lists_by_key_deduplicates_plain_items(self):
+        initial_conf = {
+            "mylist": ["one", "two", {"no": "identity"}]
+        }
+
+        extension = {
+            "mylist": ["two", "three", {"no": "identity"}]
+        }
+
+        actual = merge_yaml.Utils.update_nested_conf(
+            initial_conf, extension, merge_lists_by='name')
+        expected = {
+            "mylist": ["one", "two", {"no": "identity"}, "three"]
+        }
+        self.assertDictEqual(actual, expected)
+
+    def test_merge_lists_by_key_mismatch_types(self):
+        initial_conf = {
+            "mylist": [{"name": "one"}]
+        }
+
+        extension = {
+            "mylist": "two"
+        }
+        with self.assertRaisesRegex(AnsibleModuleError, "Failure merging key"):
+            merge_yaml.Utils.update_nested_conf(
+                initial_conf, extension, merge_lists_by='name')
+
+    def test_documents_equal(self):
+        document = {
+            'foo': [{'a': 1, 'b': [True, None]}, 'bar'],
+            'egg': {'spam': 1.5},
+        }
+        self.assertTrue(merge_yaml.Utils.documents_equal(
+            document, {
+                'egg': {'spam': 1.5},
+                'foo': [{'b': [True, None], 'a': 1}, 'bar'],
+            }))
+
+    def test_documents_equal_strict_types(self):
+        self.assertFalse(merge_yaml.Utils.documents_equal(
+            {'foo': [1]}, {'foo': [True]}))
+        self.assertFalse(merge_yaml.Utils.documents_equal(
+            {'foo': 1}, {'foo': 1.0}))
+
+    def test_documents_not_equal(self):
+        self.assertFalse(merge_yaml.Utils.documents_equal(
+            {'foo': ['a', 'b']}, {'foo': ['b', 'a']}))
+        self.assertFalse(merge_yaml.Utils.documents_equal(
+            {'foo': 'bar'}, {'foo': 'bar', 'egg': 'spam'}))
+        self.assertFalse(merge_yaml.Utils.documents_equal(
+            {'foo': 'bar'}, {'egg': 'bar'}))
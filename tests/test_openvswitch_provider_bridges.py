@@ -28,6 +28,7 @@ def _run_playbook(playbook, inventory, state_file, command_log_file=None, check=
             "ANSIBLE_PYTHON_INTERPRETER": sys.executable,
             "ANSIBLE_LIBRARY": os.pathsep.join(library_parts),
             "ANSIBLE_ROLES_PATH": str(REPO_ROOT.parent / "ansible" / "roles"),
+            "ANSIBLE_FILTER_PLUGINS": str(REPO_ROOT.parent / "ansible" / "filter_plugins"),
             "OVS_STATE_PATH": str(state_file),
         }
     )
@@ -293,3 +294,63 @@ localhost ansible_connection=local ansible_python_interpreter={python_path}
     assert "openvswitch_require_explicit_provider_fail_mode=true requires" in combined_output
     assert "group_vars/network/openvswitch.yml" in combined_output
     assert "/etc/kolla/globals.yml" in combined_output
+
+
+def test_provider_batch_applies_changes_in_one_transaction(tmp_path):
+    inventory = tmp_path / "inventory"
+    python_path = sys.executable
+    inventory.write_text(
+        f"[network]\nlocalhost ansible_connection=local ansible_python_interpreter={python_path}\n",
+        encoding="utf-8",
+    )
+
+    playbook = tmp_path / "playbook.yml"
+    playbook.write_text(
+        """---
+- hosts: network
+  gather_facts: false
+  vars:
+    kolla_action: deploy
+    kolla_container_engine: podman
+    ovs_provider_fail_mode: standalone
+    provider_bridges:
+      - br-ex
+      - br-vlan
+    provider_mappings:
+      - bridge: br-ex
+        port: eth1
+        options: {}
+      - bridge: br-vlan
+        port: eth2
+        options:
+          tag: 100
+          type: internal
+  tasks:
+    - name: Manage provider bridges in one transaction
+      include_role:
+        name: openvswitch
+        tasks_from: provider_batch
+""",
+        encoding="utf-8",
+    )
+
+    state_file = tmp_path / "ovs_state.json"
+    state_file.write_text(
+        json.dumps({"bridges": {"br-ex": {"fail_mode": "standalone", "ports": []}}}),
+        encoding="utf-8",
+    )
+    command_log = tmp_path / "ovs_commands.log"
+
+    first_run = _run_playbook(playbook, inventory, state_file, command_log).stdout
+    assert _extract_changed(first_run) == 1
+
+    state = json.loads(state_file.read_text(encoding="utf-8"))
+    assert state["bridges"]["br-ex"]["ports"] == ["eth1"]
+    assert state["bridges"]["br-vlan"] == {"fail_mode": "standalone", "ports": ["eth2"]}
+    assert state["ports"]["eth2"] == {"tag": 100, "type": "internal"}
+
+    commands = [line.strip() for line in command_log.read_text(encoding="utf-8").splitlines() if line.strip()]
+    assert commands.count("transaction") == 1
+
+    second_run = _run_playbook(playbook, inventory, state_file, command_log).stdout
+    assert _extract_changed(second_run) == 0
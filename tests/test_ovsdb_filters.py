@@ -0,0 +1,157 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from importlib.machinery import SourceFileLoader
+import json
+import os
+
+from ansible.errors import AnsibleFilterError
+from oslotest import base
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+OVSDB_FILE = os.path.join(PROJECT_DIR, 'ansible/filter_plugins/ovsdb.py')
+ovsdb = SourceFileLoader('ovsdb', OVSDB_FILE).load_module()
+
+PORTS = {
+    'headings': ['_uuid', 'name', 'tag', 'trunks', 'external_ids', 'type'],
+    'data': [
+        [['uuid', 'aaaa'], 'eth1', 100, ['set', []],
+         ['map', [['owner', 'kolla']]], ''],
+        [['uuid', 'bbbb'], 'eth2', ['set', []], ['set', [10, 20]],
+         ['map', []], 'internal'],
+    ],
+}
+
+
+class OvsdbRowsTest(base.BaseTestCase):
+
+    def test_rows(self):
+        rows = ovsdb.ovsdb_rows(json.dumps(PORTS))
+        self.assertEqual(
+            [{'_uuid': 'aaaa', 'name': 'eth1', 'tag': 100, 'trunks': [],
+              'external_ids': {'owner': 'kolla'}, 'type': ''},
+             {'_uuid': 'bbbb', 'name': 'eth2', 'tag': [], 'trunks': [10, 20],
+              'external_ids': {}, 'type': 'internal'}],
+            rows)
+
+    def test_rows_columns(self):
+        self.assertEqual(
+            [{'name': 'eth1', 'trunks': []}, {'name': 'eth2',
+                                              'trunks': [10, 20]}],
+            ovsdb.ovsdb_rows(PORTS, 'name,trunks,missing'))
+
+    def test_columns(self):
+        self.assertEqual(
+            {'name': ['eth1', 'eth2'], 'tag': [100, []]},
+            ovsdb.ovsdb_columns(PORTS, ['name', 'tag']))
+
+    def test_invalid(self):
+        self.assertEqual([], ovsdb.ovsdb_rows([]))
+        self.assertEqual({}, ovsdb.ovsdb_columns(None))
+
+    def test_convert_nested(self):
+        value = ['set', [['map', [[['string', 'a'], ['set', [['uuid', 'x'],
+                                                             ['uuid', 'y']]]]]],
+                         1]]
+        self.assertEqual([{'a': ['x', 'y']}, 1],
+                         ovsdb._convert_ovsdb_value(value))
+
+    def test_convert_deep(self):
+        value = 'leaf'
+        for _ in range(5000):
+            value = [value]
+        result = ovsdb._convert_ovsdb_value(value)
+        for _ in range(5000):
+            result = result[0]
+        self.assertEqual('leaf', result)
+
+
+class OvsdbDiffTest(base.BaseTestCase):
+
+    def test_no_changes(self):
+        desired = [{'name': 'eth1', 'tag': '100',
+                    'external_ids': {'owner': 'kolla'}}]
+        self.assertEqual([], ovsdb.ovsdb_diff(json.dumps(PORTS), desired))
+
+    def test_changed_columns(self):
+        desired = {
+            'eth1': {'tag': 100, 'type': 'internal'},
+            'eth2': {'trunks': [20, 10], 'external_ids': {'owner': 'kolla'}},
+        }
+        self.assertEqual(
+            [{'name': 'eth1', 'type': 'internal'},
+             {'name': 'eth2', 'external_ids': {'owner': 'kolla'}}],
+            ovsdb.ovsdb_diff(PORTS, desired))
+
+    def test_missing_row(self):
+        desired = [{'name': 'eth3', 'tag': 5}]
+        self.assertEqual(desired, ovsdb.ovsdb_diff(PORTS, desired))
+
+    def test_decoded_rows(self):
+        rows = ovsdb.ovsdb_rows(PORTS)
+        desired = [{'_uuid': 'bbbb', 'type': 'internal'},
+                   {'_uuid': 'aaaa', 'type': 'internal'}]
+        self.assertEqual(
+            [{'_uuid': 'aaaa', 'type': 'internal'}],
+            ovsdb.ovsdb_diff(rows, desired, key='_uuid'))
+
+
+BRIDGES = {
+    'headings': ['name', 'fail_mode', 'ports'],
+    'data': [
+        ['br-ex', 'secure', ['uuid', 'aaaa']],
+        ['br-vlan', ['set', []], ['set', []]],
+    ],
+}
+
+
+class OvsdbProviderCommandsTest(base.BaseTestCase):
+
+    def test_no_changes(self):
+        mappings = [{'bridge': 'br-ex', 'port': 'eth1',
+                     'options': {'tag': '100'}}]
+        self.assertEqual([], ovsdb.ovsdb_provider_commands(
+            mappings, BRIDGES, PORTS, fail_mode=' Secure '))
+
+    def test_changes(self):
+        mappings = [
+            {'bridge': 'br-ex', 'port': 'eth1',
+             'options': {'tag': 200, 'trunks': None}},
+            {'bridge': 'br-vlan', 'port': 'eth3',
+             'options': {'external_ids': {'owner': 'kolla'}}},
+            {'bridge': 'br-new', 'port': 'br-new'},
+        ]
+        self.assertEqual(
+            [['set-fail-mode', 'br-vlan', 'secure'],
+             ['--may-exist', 'add-br', 'br-new'],
+             ['set-fail-mode', 'br-new', 'secure'],
+             ['set', 'Port', 'eth1', 'tag=200'],
+             ['--may-exist', 'add-port', 'br-vlan', 'eth3'],
+             ['set', 'Port', 'eth3', 'external_ids={"owner"="kolla"}']],
+            ovsdb.ovsdb_provider_commands(
+                mappings, BRIDGES, PORTS, bridges='br-ex,br-vlan,br-new',
+                fail_mode='secure'))
+
+    def test_attached_to_other_bridge(self):
+        mappings = [{'bridge': 'br-vlan', 'port': 'eth1'}]
+        self.assertRaises(AnsibleFilterError,
+                          ovsdb.ovsdb_provider_commands,
+                          mappings, BRIDGES, PORTS)
+
+    def test_transaction(self):
+        commands = [['--may-exist', 'add-br', 'br-ex'],
+                    ['set', 'Port', 'eth1', 'external_ids={"a"="b c"}']]
+        self.assertEqual(
+            'ovs-vsctl --timeout=10 -- --may-exist add-br br-ex -- '
+            'set Port eth1 \'external_ids={"a"="b c"}\'',
+            ovsdb.ovs_vsctl_transaction(commands))
+        self.assertEqual('ovs-vsctl', ovsdb.ovs_vsctl_transaction([], None))
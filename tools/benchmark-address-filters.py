@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the address filters on a generated inventory.
+
+Host variables are provided by Ansible's HostVars, as during a play, so that
+the cost of merging and templating variables of hosts is accounted for.
+Member list templates similar to the ones of RabbitMQ, memcached or
+Prometheus are rendered for a number of hosts. Each render gets its own
+HostVars object, as a task rendered in a forked worker does, so that results
+are only cached within a render.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+from ansible.inventory.manager import InventoryManager
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.filter.core import to_bool
+from ansible.vars.hostvars import HostVars
+from ansible.vars.manager import VariableManager
+import jinja2
+from jinja2.filters import pass_context
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from kolla_ansible import kolla_address  # noqa: E402
+from kolla_ansible import kolla_cluster_addresses  # noqa: E402
+from kolla_ansible import put_address_in_context  # noqa: E402
+
+GROUP_VARS = """
+network_interface: eth0
+api_interface: "{{ network_interface }}"
+api_address_family: ipv4
+storage_interface: "{{ network_interface }}"
+storage_address_family: ipv4
+enable_haproxy: yes
+kolla_internal_vip_address: 10.1.0.254
+kolla_external_vip_address: "{{ kolla_internal_vip_address }}"
+"""
+
+TEMPLATES = {
+    'rabbitmq': (
+        "{% for host in groups['all'] %}"
+        "rabbit@{{ 'api' | kolla_address(host)"
+        " | put_address_in_context('rabbitmq') }}"
+        "{% if not loop.last %},{% endif %}{% endfor %}"),
+    'memcached': (
+        "{% for host in groups['all'] %}"
+        "{{ 'api' | kolla_address(host)"
+        " | put_address_in_context('memcache') }}:11211"
+        "{% if not loop.last %},{% endif %}{% endfor %}"),
+    'memcached (kolla_cluster_addresses)': (
+        "{{ groups['all'] | kolla_cluster_addresses('api', 'memcache', 11211)"
+        " | join(',') }}"),
+    'prometheus': (
+        "{% for port in [9100, 9101, 9104, 18080] %}"
+        "{% for host in groups['all'] %}"
+        "- {{ 'api' | kolla_address(host)"
+        " | put_address_in_context('url') }}:{{ port }}\n"
+        "{% endfor %}{% endfor %}"),
+}
+
+
+@pass_context
+def uncached_kolla_address(context, network_name, hostname=None,
+                           override_var=None):
+    """kolla_address without the cache of results."""
+    if hostname is None:
+        hostname = context.get('inventory_hostname')
+    return kolla_address._resolve_address(
+        context, context.get('hostvars'), network_name, hostname,
+        override_var)
+
+
+def make_hostvars(path, hosts):
+    """Return a HostVars object for a generated inventory."""
+    with open(os.path.join(path, 'inventory'), 'w') as f:
+        f.write('[all]\n')
+        for i in range(hosts):
+            f.write('host%d\n' % i)
+    os.mkdir(os.path.join(path, 'group_vars'))
+    with open(os.path.join(path, 'group_vars', 'all.yml'), 'w') as f:
+        f.write(GROUP_VARS)
+
+    loader = DataLoader()
+    inventory = InventoryManager(loader=loader,
+                                 sources=[os.path.join(path, 'inventory')])
+    variable_manager = VariableManager(loader=loader, inventory=inventory)
+    for i, host in enumerate(inventory.get_hosts()):
+        variable_manager.set_host_facts(host.name, {
+            'eth0': {'ipv4': {'address': '10.1.%d.%d' % (i // 250,
+                                                         i % 250 + 1)}},
+        })
+    hostvars = HostVars(inventory=inventory,
+                        variable_manager=variable_manager, loader=loader)
+    groups = {'all': [host.name for host in inventory.get_hosts()]}
+    return hostvars, groups
+
+
+def make_task_hostvars(hostvars):
+    """Return a copy of a HostVars object, as seen by a new task."""
+    return HostVars(inventory=hostvars._inventory,
+                    variable_manager=hostvars._variable_manager,
+                    loader=hostvars._loader)
+
+
+def render(template, hostvars, groups, hosts):
+    """Render a template for hosts, returning the total time taken."""
+    total = 0
+    for hostname in hosts:
+        task_hostvars = make_task_hostvars(hostvars)
+        total += timeit.timeit(
+            lambda: template.render(hostvars=task_hostvars, groups=groups,
+                                    inventory_hostname=hostname),
+            number=1)
+    return total
+
+
+def get_template(source, address_filter):
+    # Bandit complains about Jinja2 autoescaping without nosec.
+    env = jinja2.Environment()  # nosec
+    env.filters['bool'] = to_bool
+    env.filters['kolla_address'] = address_filter
+    env.filters['kolla_cluster_addresses'] = (
+        kolla_cluster_addresses.kolla_cluster_addresses)
+    env.filters['put_address_in_context'] = (
+        put_address_in_context.put_address_in_context)
+    return env.from_string(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hosts', type=int, default=300,
+                        help='Number of hosts in the inventory')
+    parser.add_argument('--renders', type=int, default=3,
+                        help='Number of hosts rendering each template')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        hostvars, groups = make_hostvars(path, args.hosts)
+        hosts = groups['all'][:args.renders]
+        print('%d hosts, each template rendered for %d hosts, total time of '
+              'the renders without and with cache:' %
+              (args.hosts, len(hosts)))
+        for name, source in TEMPLATES.items():
+            uncached = '       -'
+            if 'kolla_cluster_addresses' not in source:
+                template = get_template(source, uncached_kolla_address)
+                uncached = '%8.3f' % render(template, hostvars, groups, hosts)
+            template = get_template(source, kolla_address.kolla_address)
+            cached = render(template, hostvars, groups, hosts)
+            print('  %-36s uncached %s s  cached %8.3f s' %
+                  (name, uncached, cached))
+
+
+if __name__ == '__main__':
+    main()
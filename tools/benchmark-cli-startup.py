@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the import time of the kolla-ansible command line interface.
+
+The application is created in a new interpreter started with
+``python -X importtime``, as is done by the kolla-ansible script before the
+command is parsed. The slowest imports are reported and the exit code is
+non-zero when the total import time exceeds the budget, or when modules only
+needed to run a command are imported.
+"""
+
+import argparse
+import os
+import subprocess  # nosec
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+STARTUP_CODE = ('from kolla_ansible.cmd import kolla_ansible; '
+                'kolla_ansible.KollaAnsibleApp()')
+
+# Modules which are only needed once a command runs.
+DEFERRED_MODULES = [
+    'kolla_ansible.cli.commands',
+    'pbr.packaging',
+    'yaml',
+]
+
+
+def parse_importtime(output):
+    """Return the imports reported by ``python -X importtime``.
+
+    :returns: a dict of (self, cumulative) import times in microseconds by
+              module, and the names of the top level imports, whose
+              cumulative times include the imports of their dependencies.
+    """
+    times = {}
+    top_level = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            # Header line
+            continue
+        times[name.strip()] = (int(own), int(cumulative))
+        # Nested imports are indented by two more spaces per level.
+        if not name.startswith('  '):
+            top_level.append(name.strip())
+    return times, top_level
+
+
+def measure():
+    """Return the imports of a new interpreter creating the application."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [PROJECT_ROOT, env.get('PYTHONPATH')]))
+    result = subprocess.run(  # nosec
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def _total(run):
+    times, top_level = run
+    return sum(times[name][1] for name in top_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=250,
+                        help='Maximum total import time in milliseconds')
+    parser.add_argument('--number', type=int, default=5,
+                        help='Number of measurements, the fastest is used')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to report')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.number)]
+    times, top_level = min(runs, key=_total)
+    total = _total((times, top_level)) / 1000
+
+    print('Slowest modules (self, cumulative):')
+    for name in sorted(times, key=lambda n: -times[n][0])[:args.top]:
+        print('  %8.1f ms %8.1f ms  %s' % (
+            times[name][0] / 1000, times[name][1] / 1000, name))
+    print('Total: %.1f ms (budget %.1f ms)' % (total, args.budget))
+
+    ok = True
+    deferred = [name for name in DEFERRED_MODULES if name in times]
+    if deferred:
+        print('ERROR: imported before a command runs: %s' %
+              ', '.join(deferred))
+        ok = False
+    if total > args.budget:
+        print('ERROR: import time exceeds the budget')
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
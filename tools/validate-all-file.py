@@ -12,33 +12,41 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import argparse
 import collections
 import fnmatch
 import json
 import logging
+import mmap
 import os
 import re
+import subprocess  # nosec
 import sys
+import time
 
 import jinja2
-import yaml
 
 
 from kolla_ansible.put_address_in_context import put_address_in_context
+from kolla_ansible import yaml_utils
 
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
+EXCLUDE_PATTERNS = ['.tox', '.testrepository', '.git']
+
 NEWLINE_EOF_INCLUDE_PATTERNS = ['*.j2', '*.yml', '*.py', '*.sh']
-NEWLINE_EOF_EXCLUDE_PATTERNS = ['.tox', '.testrepository', '.git']
+NEWLINE_EOF_EXCLUDE_PATTERNS = EXCLUDE_PATTERNS
 
 # Render json file by using jinja2 template is OK
 JSON_J2_INCLUDE_PATTERNS = ['*.json.j2', '*.json']
-JSON_J2_EXCLUDE_PATTERNS = ['.tox', '.testrepository', '.git']
+JSON_J2_EXCLUDE_PATTERNS = EXCLUDE_PATTERNS
 
 YAML_INCLUDE_PATTERNS = ['*.yml']
-YAML_EXCLUDE_PATTERNS = ['.tox', '.testrepository', '.git',
-                         'defaults', 'templates', 'vars']
+YAML_EXCLUDE_PATTERNS = EXCLUDE_PATTERNS + ['defaults', 'templates', 'vars']
+
+BLOCK_LOOP_INCLUDE_PATTERNS = [
+    'ansible/roles/openvswitch/tasks/post-config.yml']
 
 KOLLA_NETWORKS = [
     'api',
@@ -54,144 +62,180 @@ logging.basicConfig()
 LOG = logging.getLogger(__name__)
 
 
-def check_newline_eof():
-    includes = r'|'.join([fnmatch.translate(x)
-                          for x in NEWLINE_EOF_INCLUDE_PATTERNS])
-    excludes = r'|'.join([fnmatch.translate(x)
-                          for x in NEWLINE_EOF_EXCLUDE_PATTERNS])
-    return_code = 0
-
-    def has_newline_eof(path):
-        with open(path, 'r') as f:
-            data = f.read()
-            if data and data[-1] != '\n':
-                LOG.error('%s file error: no newline at end of file', path)
-                return False
-        return True
-
-    for root, dirs, files in os.walk(PROJECT_ROOT):
-        dirs[:] = [d for d in dirs if not re.match(excludes, d)]
-        for f in files:
-            if not re.match(excludes, f) and re.match(includes, f):
-                if not has_newline_eof(os.path.join(root, f)):
-                    return_code = 1
-    return return_code
-
-
-def check_json_j2():
-    includes = r'|'.join([fnmatch.translate(x)
-                          for x in JSON_J2_INCLUDE_PATTERNS])
-    excludes = r'|'.join([fnmatch.translate(x)
-                          for x in JSON_J2_EXCLUDE_PATTERNS])
-    return_code = 0
-
-    def bool_filter(value):
-        return True
-
-    def basename_filter(text):
-        return text.split('\\')[-1]
-
-    def kolla_address_filter_mock(network_name, hostname=None):
-        # no validation is possible for the hostname
-
-        if network_name not in KOLLA_NETWORKS:
-            raise ValueError("{network_name} not in KOLLA_NETWORKS"
-                             .format(network_name=network_name))
-
-        return "127.0.0.1"
-
-    # Mock ansible hostvars variable, which is a nested dict
-    def hostvars():
-        return collections.defaultdict(hostvars)
-
-    # Mock Ansible groups variable, which is a dict of lists.
-    def groups():
-        return collections.defaultdict(list)
-
-    def validate_json_j2(root, filename):
-        env = jinja2.Environment(  # nosec: not used to render HTML
-            loader=jinja2.FileSystemLoader(root))
-        env.filters['bool'] = bool_filter
-        env.filters['basename'] = basename_filter
-        env.filters['kolla_address'] = kolla_address_filter_mock
-        env.filters['put_address_in_context'] = \
-            put_address_in_context
-        template = env.get_template(filename)
-        # Mock ansible variables.
-        context = {
-            'hostvars': hostvars(),
-            'groups': groups(),
-            'inventory_hostname': 'hostname',
-            'api_interface_address': '',
-            'kolla_internal_fqdn': '',
-            'octavia_provider_drivers': '',
-            'ovn_sb_db_relay_active_inactivity_probe': 120000,
-            'ovn_sb_db_relay_passive_inactivity_probe': 60000,
-            'ovn_sb_db_relay_max_backoff': 60000,
-            'rabbitmq_ha_replica_count': 2,
-            'rabbitmq_message_ttl_ms': 600000,
-            'rabbitmq_queue_expiry_ms': 3600000,
-
-        }
-        data = template.render(**context)
-        json.loads(data)
-    for root, dirs, files in os.walk(PROJECT_ROOT):
-        dirs[:] = [d for d in dirs if not re.match(excludes, d)]
-        for filename in files:
-            if not re.match(excludes, filename) and \
-                    re.match(includes, filename):
-                fullpath = os.path.join(root, filename)
-                try:
-                    validate_json_j2(root, filename)
-                except (ValueError, jinja2.exceptions.TemplateError):
-                    return_code = 1
-                    LOG.exception('%s file error', fullpath)
-    return return_code
+def _compile(patterns):
+    return re.compile(r'|'.join([fnmatch.translate(x) for x in patterns]))
+
+
+class Check(object):
+    """A check run on the files matching a set of patterns.
+
+    Include patterns are matched against the file name, or against the path
+    relative to PROJECT_ROOT for patterns containing a slash. Exclude
+    patterns are matched against the file name and each of its directories.
+    Files outside of path, relative to PROJECT_ROOT, are skipped.
+
+    The function of a check is called with a FileBuffer and returns a list
+    of error messages.
+    """
+
+    def __init__(self, name, func, includes, excludes=(), path=''):
+        self.name = name
+        self.func = func
+        self.includes = _compile(includes)
+        self.excludes = _compile(excludes) if excludes else None
+        self.path = path
+        self.files = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def applies(self, relpath):
+        if self.path and not relpath.startswith(self.path + os.sep):
+            return False
+        parts = relpath.split(os.sep)
+        if self.excludes and any(self.excludes.match(p) for p in parts):
+            return False
+        return bool(self.includes.match(parts[-1]) or
+                    self.includes.match(relpath))
+
+
+class FileBuffer(object):
+    """Content of a file, read once and shared by all checks."""
+
+    def __init__(self, path):
+        self.path = path
+        self._text = None
+        self._yaml = None
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.data[:].decode('utf-8')
+        return self._text
+
+    @property
+    def yaml(self):
+        if self._yaml is None:
+            self._yaml = [yaml_utils.safe_load(self.text)]
+        return self._yaml[0]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+# Exceptions raised by checks for invalid files.
+CHECK_ERRORS = (ValueError, jinja2.exceptions.TemplateError,
+                yaml_utils.YAMLError)
+
+
+def check_newline_eof(buf):
+    # Only the last byte of the file is read from the mapping.
+    if buf.data and buf.data[-1:] != b'\n':
+        return ['no newline at end of file']
+    return []
+
+
+def bool_filter(value):
+    return True
+
 
+def basename_filter(text):
+    return text.split('\\')[-1]
 
-def check_task_contents():
+
+def kolla_address_filter_mock(network_name, hostname=None):
+    # no validation is possible for the hostname
+
+    if network_name not in KOLLA_NETWORKS:
+        raise ValueError("{network_name} not in KOLLA_NETWORKS"
+                         .format(network_name=network_name))
+
+    return "127.0.0.1"
+
+
+# Mock ansible hostvars variable, which is a nested dict
+def hostvars():
+    return collections.defaultdict(hostvars)
+
+
+# Mock Ansible groups variable, which is a dict of lists.
+def groups():
+    return collections.defaultdict(list)
+
+
+def get_json_j2_environment():
+    env = jinja2.Environment()  # nosec: not used to render HTML
+    env.filters['bool'] = bool_filter
+    env.filters['basename'] = basename_filter
+    env.filters['kolla_address'] = kolla_address_filter_mock
+    env.filters['put_address_in_context'] = \
+        put_address_in_context
+    env.filters['to_json'] = json.dumps
+    return env
+
+
+JSON_J2_ENV = get_json_j2_environment()
+
+
+def check_json_j2(buf):
+    # NOTE: The template is compiled from the buffer already read, the loader
+    # resolves includes and imports relative to its directory.
+    JSON_J2_ENV.loader = jinja2.FileSystemLoader(os.path.dirname(buf.path))
+    template = JSON_J2_ENV.from_string(buf.text)
+    # Mock ansible variables.
+    context = {
+        'hostvars': hostvars(),
+        'groups': groups(),
+        'inventory_hostname': 'hostname',
+        'api_interface_address': '',
+        'kolla_internal_fqdn': '',
+        'octavia_provider_drivers': '',
+        'ovn_sb_db_relay_active_inactivity_probe': 120000,
+        'ovn_sb_db_relay_passive_inactivity_probe': 60000,
+        'ovn_sb_db_relay_max_backoff': 60000,
+        'rabbitmq_ha_replica_count': 2,
+        'rabbitmq_message_ttl_ms': 600000,
+        'rabbitmq_queue_expiry_ms': 3600000,
+
+    }
+    data = template.render(**context)
+    json.loads(data)
+    return []
+
+
+def check_task_contents(buf):
     """All tasks that use Docker should have 'become: true'."""
-    includes = r'|'.join([fnmatch.translate(x)
-                          for x in YAML_INCLUDE_PATTERNS])
-    excludes = r'|'.join([fnmatch.translate(x)
-                          for x in YAML_EXCLUDE_PATTERNS])
-    roles_path = os.path.join(PROJECT_ROOT, 'ansible', 'roles')
-    return_code = 0
-    for root, dirs, files in os.walk(roles_path):
-        dirs[:] = [d for d in dirs if not re.match(excludes, d)]
-        for filename in files:
-            if not re.match(excludes, filename) and \
-                    re.match(includes, filename):
-                fullpath = os.path.join(root, filename)
-                with open(fullpath) as fp:
-                    tasks = yaml.safe_load(fp)
-                tasks = tasks or []
-                for task in tasks:
-                    if task.get('block'):
-                        block = task
-                        for task in task['block']:
-                            if check_container_become(fullpath, task, block):
-                                return_code = 1
-                    else:
-                        if check_container_become(fullpath, task):
-                            return_code = 1
-
-    return return_code
-
-
-def check_container_become(fullpath, task, block=''):
+    errors = []
+    tasks = buf.yaml or []
+    if not isinstance(tasks, list):
+        return errors
+    for task in tasks:
+        if task.get('block'):
+            block = task
+            for task in task['block']:
+                errors += check_container_become(task, block)
+        else:
+            errors += check_container_become(task)
+    return errors
+
+
+def check_container_become(task, block=None):
 
     ce_modules = ('kolla_container', 'kolla_container_facts', 'kolla_toolbox')
     cmd_modules = ('command', 'shell')
-    return_code = 0
+    block = block or {}
+    errors = []
 
     for module in ce_modules:
         if (module in task and not task.get('become') and
                 not block.get('become')):
-            return_code = 1
-            LOG.error("Use of %s module without become in "
-                      "task %s in %s",
-                      module, task['name'], fullpath)
+            errors.append("Use of %s module without become in task %s"
+                          % (module, task['name']))
     for module in cmd_modules:
         ce_without_become = False
         if (module in task and not task.get('become')):
@@ -206,74 +250,158 @@ def check_container_become(fullpath, task, block=''):
                     not block.get('become')):
                 ce_without_become = True
             if ce_without_become:
-                return_code = 1
-                LOG.error("Use of container engine in %s "
-                          "module without "
-                          "become in task %s in %s block %s",
-                          module, task['name'], fullpath, block)
-    return return_code
+                errors.append("Use of container engine in %s module without "
+                              "become in task %s block %s"
+                              % (module, task['name'], block or ''))
+    return errors
 
 
-def check_block_loop_usage():
+def check_block_loop_usage(buf):
     """Ensure no block tasks use loop or with_* constructs."""
-    return_code = 0
-    target = os.path.join(
-        PROJECT_ROOT,
-        'ansible',
-        'roles',
-        'openvswitch',
-        'tasks',
-        'post-config.yml',
-    )
-    if not os.path.exists(target):
-        return return_code
-
-    try:
-        with open(target) as fp:
-            data = yaml.safe_load(fp) or []
-    except yaml.YAMLError:
-        LOG.exception('Failed to parse %s', target)
-        return 1
-
+    errors = []
+    data = buf.yaml or []
     if not isinstance(data, list):
-        return return_code
+        return errors
 
     def _visit(task):
-        nonlocal return_code
         if not isinstance(task, dict):
             return
         if 'block' in task:
             for key in list(task.keys()):
                 if key == 'loop' or key.startswith('with_'):
-                    LOG.error(
-                        "Use of %s on block task %s in %s",
-                        key,
-                        task.get('name', '<unnamed>'),
-                        target,
-                    )
-                    return_code = 1
-            for section in ('block', 'rescue', 'always'):
-                for nested in task.get(section, []) or []:
-                    _visit(nested)
-        else:
-            for section in ('block', 'rescue', 'always'):
-                for nested in task.get(section, []) or []:
-                    _visit(nested)
+                    errors.append("Use of %s on block task %s"
+                                  % (key, task.get('name', '<unnamed>')))
+        for section in ('block', 'rescue', 'always'):
+            for nested in task.get(section, []) or []:
+                _visit(nested)
 
     for task in data:
         _visit(task)
 
-    return return_code
+    return errors
+
+
+def get_checks():
+    return [
+        Check('newline_eof', check_newline_eof,
+              NEWLINE_EOF_INCLUDE_PATTERNS, NEWLINE_EOF_EXCLUDE_PATTERNS),
+        Check('json_j2', check_json_j2,
+              JSON_J2_INCLUDE_PATTERNS, JSON_J2_EXCLUDE_PATTERNS),
+        Check('task_contents', check_task_contents,
+              YAML_INCLUDE_PATTERNS, YAML_EXCLUDE_PATTERNS,
+              path=os.path.join('ansible', 'roles')),
+        Check('block_loop_usage', check_block_loop_usage,
+              BLOCK_LOOP_INCLUDE_PATTERNS),
+    ]
+
+
+def find_files():
+    """Return the paths of files in the tree, relative to PROJECT_ROOT."""
+    excludes = _compile(EXCLUDE_PATTERNS)
+    files = []
+    for root, dirs, filenames in os.walk(PROJECT_ROOT):
+        dirs[:] = sorted(d for d in dirs if not excludes.match(d))
+        relroot = os.path.relpath(root, PROJECT_ROOT)
+        for filename in sorted(filenames):
+            files.append(os.path.normpath(os.path.join(relroot, filename)))
+    return files
+
+
+def find_changed_files(ref):
+    """Return the files changed since a git reference, including the
+    uncommitted and untracked files.
+    """
+    commands = [
+        ['git', 'diff', '--name-only', '-z', '--diff-filter=d', ref, '--'],
+        ['git', 'ls-files', '--others', '--exclude-standard', '-z'],
+    ]
+    files = set()
+    for command in commands:
+        output = subprocess.check_output(command, cwd=PROJECT_ROOT)  # nosec
+        files.update(os.path.normpath(path)
+                     for path in output.decode().split('\0') if path)
+    return sorted(path for path in files
+                  if os.path.isfile(os.path.join(PROJECT_ROOT, path)))
+
+
+def run_checks(files, checks):
+    """Run the checks applying to each file, reading each file once.
+
+    :returns: a list of errors, as dicts with check, path and message keys.
+    """
+    errors = []
+    for relpath in files:
+        applicable = [check for check in checks if check.applies(relpath)]
+        if not applicable:
+            continue
+        path = os.path.join(PROJECT_ROOT, relpath)
+        try:
+            buf = FileBuffer(path)
+        except (IOError, ValueError) as e:
+            buf = None
+            read_error = str(e)
+        for check in applicable:
+            start = time.perf_counter()
+            if buf is None:
+                messages = [read_error]
+            else:
+                try:
+                    messages = check.func(buf)
+                except CHECK_ERRORS as e:
+                    messages = ['%s: %s' % (type(e).__name__, e)]
+            check.seconds += time.perf_counter() - start
+            check.files += 1
+            for message in messages:
+                LOG.error('%s file error: %s', path, message)
+                check.errors += 1
+                errors.append({'check': check.name, 'path': relpath,
+                               'message': message})
+        if buf is not None:
+            buf.close()
+    return errors
+
+
+def write_report(path, report):
+    if path == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
 
 
 def main():
-    checks = (
-        check_newline_eof,
-        check_json_j2,
-        check_task_contents,
-        check_block_loop_usage,
-    )
-    return sum([check() for check in checks])
+    parser = argparse.ArgumentParser(
+        description='Validate the files of the Kolla Ansible tree.')
+    parser.add_argument('--changed-since', metavar='REF',
+                        help='only check files changed since a git '
+                             'reference, including uncommitted files')
+    parser.add_argument('--report', metavar='PATH',
+                        help='write a JSON report with the errors and the '
+                             'time spent in each check, - for stdout')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.changed_since:
+        files = find_changed_files(args.changed_since)
+    else:
+        files = find_files()
+    checks = get_checks()
+    errors = run_checks(files, checks)
+    failed = [check for check in checks if check.errors]
+
+    if args.report:
+        write_report(args.report, {
+            'changed_since': args.changed_since,
+            'files': len(files),
+            'seconds': time.perf_counter() - start,
+            'checks': dict((check.name, {'files': check.files,
+                                         'errors': check.errors,
+                                         'seconds': check.seconds})
+                           for check in checks),
+            'errors': errors,
+        })
+    return len(failed)
 
 
 if __name__ == "__main__":